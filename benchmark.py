@@ -0,0 +1,1004 @@
+#!/usr/bin/env python3
+
+import collections
+import contextlib
+import datetime
+import ipaddress
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from gnsmodel import Interface
+from gnsmodel import Node
+from gnsmodel import segment_links
+from gnsmodel import Switch
+from layout import force_layout
+from layout import hierarchy_layout
+from layout import link_edges
+from netindex import build_subnet_index
+from netindex import map_networks
+from netindex import merge_segments
+from netindex import prune_subnet_index
+from netindex import PrefixFilter
+from netindex import string_to_key
+from configrules import ConfigRules
+from configrules import DEFAULT_RULES
+from synthetic import generate
+from timing import profiler
+
+
+'''
+Benchmarks for the model building code. They run on synthetic topologies so
+nothing here logs into a device or talks to a gns3 server.
+
+    python3 benchmark.py netmap 100 1000 10000
+    python3 benchmark.py memory 10000
+    python3 benchmark.py startup 20
+    python3 benchmark.py layout 1000 5000
+    python3 benchmark.py segments 1000 5000
+    python3 benchmark.py pipeline 1000 10000
+    python3 benchmark.py config 1000
+    python3 benchmark.py rules 30000
+    python3 benchmark.py snapshot 1000 10000
+    python3 benchmark.py schedule 500
+    python3 benchmark.py rebuild 1000
+    python3 benchmark.py partition 1000 10000
+    python3 benchmark.py boot 200
+    python3 benchmark.py slice 1000 10000
+
+pipeline runs the whole build offline on generated topologies against the
+stub gns3 server, and appends the time and memory of every stage to
+benchmark-history.jsonl so a slow stage shows up against earlier runs.
+'''
+
+
+# build a fake node list: every router has a loopback, a /24 lan and p2p /30
+# links to the next router in a ring plus a couple of random chords. this is
+# the dict per node and interface model netmodel used before gnsmodel
+
+def synthetic_dicts(size, chords=2, seed=1):
+    rnd = random.Random(seed)
+    nodes = [{"name": "r" + str(x), "interfaces": []} for x in range(size)]
+    pairs = [(x, (x + 1) % size) for x in range(size)]
+    for x in range(size):
+        for _ in range(chords):
+            pairs.append((x, rnd.randrange(size)))
+
+    base = int(ipaddress.IPv4Address("10.0.0.0"))
+    for num, (a, b) in enumerate(pairs):
+        if a == b:
+            continue
+        net = base + num * 4
+        for side, node in ((1, a), (2, b)):
+            intfs = nodes[node]["interfaces"]
+            intfs.append({
+                "intf": "Ethernet0/" + str(len(intfs)),
+                "ip": str(ipaddress.IPv4Address(net + side)),
+                "mask": 30})
+
+    for x, node in enumerate(nodes):
+        node["interfaces"].append({
+            "intf": "Loopback0",
+            "ip": "172.16." + str(x // 256) + "." + str(x % 256),
+            "mask": 32})
+        node["interfaces"].append({
+            "intf": "Vlan10",
+            "ip": "192.168." + str(x % 256) + ".1",
+            "mask": 24})
+
+    for node in nodes:
+        for intf in node["interfaces"]:
+            intf["gns_adapter"] = 1
+            intf["gns_port"] = 0
+            intf["gns_ifname"] = "Ethernet1/0"
+    return nodes
+
+
+# the old Node class, a free-form dict plus attributes added on the fly
+
+class LegacyNode():
+
+    def __init__(self, node):
+        self.node = node
+        self.intfs = []
+
+
+def legacy_nodes(dicts):
+    gns_node_list = []
+    for id, node in enumerate(dicts):
+        node["networks"] = [str(ipaddress.IPv4Network(
+            (x["ip"], x["mask"]), strict=False)) for x in node["interfaces"]
+            if x["mask"] != 24 and x["mask"] != 32]
+        gns_node = LegacyNode(node)
+        gns_node.id = "node" + str(id)
+        gns_node.dir = "/opt/gns3/projects/node" + str(id)
+        gns_node.startup = "i" + str(id + 1) + "_startup-config.cfg"
+        gns_node_list.append(gns_node)
+    return gns_node_list
+
+
+def synthetic_nodes(dicts):
+    gns_node_list = []
+    for id, node in enumerate(dicts):
+        intfs = []
+        for x in node["interfaces"]:
+            intf = Interface(x["intf"], x["ip"], x["mask"])
+            intf.add_port(x["gns_adapter"], x["gns_port"], x["gns_ifname"])
+            intfs.append(intf)
+        gns_node = Node(node["name"], intfs)
+        gns_node.add_id("node" + str(id))
+        gns_node.add_dir("/opt/gns3/projects/node" + str(id))
+        gns_node.add_startup("i" + str(id + 1) + "_startup-config.cfg")
+        gns_node_list.append(gns_node)
+    return gns_node_list
+
+
+def synthetic_netlist(dicts):
+    netlist = set()
+    for node in dicts:
+        for intf in node["interfaces"]:
+            if intf["mask"] == 24 or intf["mask"] == 32:
+                continue
+            netlist.add(str(ipaddress.IPv4Network(
+                (intf["ip"], intf["mask"]), strict=False)))
+    return list(netlist)
+
+
+# the nested loops create_netmap and create_linkmap used before the subnet
+# index, kept here so we can compare
+
+def legacy_netmap(netlist, gns_node_list):
+    netmap = []
+    for id, network in enumerate(netlist, 1):
+        net_obj = {"name": network, "nodes": [], "id": id}
+        for gns_node in gns_node_list:
+            for net in gns_node.node["networks"]:
+                if network == net:
+                    net_obj["nodes"].append(gns_node)
+        netmap.append(net_obj)
+    return netmap
+
+
+def legacy_linkmap(netlist, gns_node_list):
+    linkmap = []
+    for id, network in enumerate(netlist, 1):
+        net_obj = {"name": network, "interfaces": [], "id": id}
+        for gns_node in gns_node_list:
+            for i in gns_node.node["interfaces"]:
+                intf_net = str(ipaddress.IPv4Network(
+                    str(i["ip"]) + "/" + str(i["mask"]), strict=False))
+                if network == intf_net:
+                    net_obj["interfaces"].append({
+                        "id": gns_node.id,
+                        "adapter": i["gns_adapter"],
+                        "port": i["gns_port"]})
+        linkmap.append(net_obj)
+    return linkmap
+
+
+# the point to point links of a legacy linkmap or of segment_links as
+# (node id, adapter, port) pairs
+
+def link_ends(links):
+    if links and isinstance(links[0], dict):
+        links = [[(x["id"], x["adapter"], x["port"])
+                  for x in net["interfaces"]]
+                 for net in links if len(net["interfaces"]) == 2]
+    else:
+        links = [[(node.id, adapter, port) for node, adapter, port in ends]
+                 for ends in links if not any(isinstance(x[0], Switch)
+                                              for x in ends)]
+    return sorted(tuple(sorted(x)) for x in links)
+
+
+# netmaps hold node objects, compare them by name
+
+def netmap_names(netmap, name):
+    return [(x["name"], [name(n) for n in x["nodes"]]) for x in netmap]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# the legacy loops are skipped above legacy_max nodes, at 1k nodes they
+# already run for minutes
+
+def bench_netmap(sizes=None, legacy_max=100):
+    sizes = sizes or [100, 1000, 10000]
+    print("{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+        "nodes", "nets", "index", "netmap", "links", "legacy"))
+    for size in sizes:
+        dicts = synthetic_dicts(size)
+        netlist = synthetic_netlist(dicts)
+        gns_node_list = synthetic_nodes(dicts)
+
+        index, t_index = timed(build_subnet_index, gns_node_list)
+        netmap, t_netmap = timed(map_networks, netlist, index)
+        networks = dict((x, index[x]) for x in map(string_to_key, netlist)
+                        if x in index)
+        (_, links), t_links = timed(segment_links, networks)
+
+        legacy = "skipped"
+        if size <= legacy_max:
+            old_nodes = legacy_nodes(dicts)
+            old_netmap, t_old_netmap = timed(
+                legacy_netmap, netlist, old_nodes)
+            old_linkmap, t_old_linkmap = timed(
+                legacy_linkmap, netlist, old_nodes)
+            if (netmap_names(old_netmap, lambda x: x.node["name"]) !=
+                    netmap_names(netmap, lambda x: x.name) or
+                    link_ends(old_linkmap) != link_ends(links)):
+                raise SystemExit("index results differ from nested loops")
+            legacy = "{:.3f}s".format(t_old_netmap + t_old_linkmap)
+
+        print("{:>8} {:>8} {:>9.3f}s {:>9.3f}s {:>9.3f}s {:>10}".format(
+            size, len(netlist), t_index, t_netmap, t_links, legacy))
+
+
+# memory used by the node list in the old dict model and in gnsmodel. both
+# are built from the same raw (name, [(intf, ip, mask)]) tuples, the way
+# create_node_list builds them from the napalm results
+
+def measure(func, *args):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def build_legacy(raw):
+    gns_node_list = []
+    for id, (name, intfs) in enumerate(raw):
+        node = {"name": name, "interfaces": [], "networks": []}
+        for port, (intf, ip, mask) in enumerate(intfs):
+            node["interfaces"].append({
+                "intf": intf, "ip": ip, "mask": mask, "gns_adapter": 1,
+                "gns_port": port, "gns_ifname": "Ethernet1/" + str(port)})
+            node["networks"].append(str(ipaddress.IPv4Network(
+                (ip, mask), strict=False)))
+        gns_node = LegacyNode(node)
+        gns_node.id = "node" + str(id)
+        gns_node_list.append(gns_node)
+    return gns_node_list
+
+
+def build_gnsmodel(raw):
+    gns_node_list = []
+    for id, (name, intfs) in enumerate(raw):
+        gns_node = Node(name)
+        for port, (intf, ip, mask) in enumerate(intfs):
+            x = Interface(intf, ip, mask)
+            x.add_port(1, port, "Ethernet1/" + str(port))
+            gns_node.add_intf(x)
+        gns_node.add_id("node" + str(id))
+        gns_node_list.append(gns_node)
+    return gns_node_list
+
+
+def bench_memory(sizes=None):
+    sizes = sizes or [10000]
+    print("{:>8} {:>12} {:>12} {:>8}".format(
+        "nodes", "dict model", "gnsmodel", "ratio"))
+    for size in sizes:
+        raw = [(x["name"], [(i["intf"], i["ip"], i["mask"])
+                            for i in x["interfaces"]])
+               for x in synthetic_dicts(size)]
+        old, old_bytes = measure(build_legacy, raw)
+        del old
+        new, new_bytes = measure(build_gnsmodel, raw)
+        del new
+        print("{:>8} {:>10.1f}MB {:>10.1f}MB {:>7.1f}x".format(
+            size, old_bytes / 1e6, new_bytes / 1e6, old_bytes / new_bytes))
+
+
+# how long the cli takes to start. importing netmodel must not pull in any
+# of the heavy dependencies, those are imported by the subcommands
+
+HEAVY_MODULES = ["nornir", "napalm", "paramiko", "requests", "ciscoconfparse",
+                 "numpy"]
+
+
+def bench_startup(runs=None):
+    runs = (runs or [20])[0]
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "netmodel.py")
+    check = ("import sys, netmodel; print(','.join(m for m in {!r} "
+             "if m in sys.modules))".format(HEAVY_MODULES))
+    heavy = subprocess.run([sys.executable, "-c", check], cwd=here,
+                           stdout=subprocess.PIPE, check=True)
+    heavy = heavy.stdout.decode().strip()
+    if heavy:
+        raise SystemExit("importing netmodel imports " + heavy)
+
+    print("{:<20} {:>10} {:>10}".format("command", "min", "mean"))
+    for cmd in (["--help"], ["plan", "--help"], ["build", "--help"]):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script] + cmd, check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        print("{:<20} {:>9.3f}s {:>9.3f}s".format(
+            " ".join(cmd), min(times), sum(times) / len(times)))
+
+
+# time both layouts on the synthetic netmap. the hierarchy puts every tenth
+# router in core and the rest in access. mean link length against the mean
+# distance of random pairs shows the force layout keeps neighbours close
+
+def bench_layout(sizes=None):
+    sizes = sizes or [1000, 5000]
+    print("{:>8} {:>8} {:>10} {:>10} {:>10}".format(
+        "nodes", "edges", "force", "hierarchy", "link/pair"))
+    for size in sizes:
+        dicts = synthetic_dicts(size)
+        gns_node_list = synthetic_nodes(dicts)
+        index = prune_subnet_index(build_subnet_index(gns_node_list),
+                                   synthetic_netlist(dicts))
+        edges = link_edges(segment_links(index)[1])
+        names = [x.name for x in gns_node_list]
+        groups = dict((name, ["core"] if num % 10 == 0 else ["access"])
+                      for num, name in enumerate(names))
+
+        positions, t_force = timed(force_layout, names, edges)
+        tiers, t_tiers = timed(hierarchy_layout, names, edges, groups,
+                               ["core", "access"])
+
+        def distance(a, b):
+            (ax, ay), (bx, by) = positions[a], positions[b]
+            return ((ax - bx) ** 2 + (ay - by) ** 2) ** 0.5
+
+        rnd = random.Random(1)
+        link = sum(distance(a, b) for a, b in edges) / len(edges)
+        pair = sum(distance(rnd.choice(names), rnd.choice(names))
+                   for _ in range(len(edges))) / len(edges)
+        print("{:>8} {:>8} {:>9.3f}s {:>9.3f}s {:>10.2f}".format(
+            size, len(edges), t_force, t_tiers, link / pair))
+
+
+# dual stack version of the synthetic topology: every interface also gets an
+# ipv6 address in a /64 (/128 on the loopbacks) built from its ipv4 network,
+# and the /24 lans are modeled so they need switches. times the netlist,
+# the v4/v6 merge and the links with their switches
+
+def bench_segments(sizes=None):
+    from netmodel import create_netlist
+
+    sizes = sizes or [1000, 5000]
+    prefix_filter = PrefixFilter({4: [32], 6: [128]})
+    print("{:>8} {:>10} {:>8} {:>8} {:>8} {:>10}".format(
+        "nodes", "addresses", "nets", "links", "switches", "time"))
+    for size in sizes:
+        gns_node_list = synthetic_nodes(synthetic_dicts(size))
+        for gns_node in gns_node_list:
+            for intf in gns_node.interfaces:
+                v6 = 0x20010DB8 << 96 | intf.network << 64 | intf.ip & 0xFF
+                intf.add_address(v6, 128 if intf.prefix == 32 else 64, 6)
+        addresses = sum(len(x.interfaces) * 2 for x in gns_node_list)
+
+        start = time.perf_counter()
+        index = build_subnet_index(gns_node_list)
+        netlist = merge_segments(
+            index, create_netlist(gns_node_list, prefix_filter))
+        prune_subnet_index(index, netlist)
+        switches, links = segment_links(index)
+        elapsed = time.perf_counter() - start
+
+        print("{:>8} {:>10} {:>8} {:>8} {:>8} {:>9.3f}s".format(
+            size, addresses, len(netlist), len(links), len(switches),
+            elapsed))
+
+
+# config generation on a synthetic leaf-spine topology with 1, 2, 4 ...
+# worker processes up to one per cpu. every worker count has to give the
+# same configs in the same order
+
+def bench_config(sizes=None):
+    from gnsstub import DEFAULT_TEMPLATES
+    from ports import PortAllocator
+    from ports import template_layout
+    import netmodel
+
+    sizes = sizes or [1000]
+    cpus = os.cpu_count() or 1
+    counts = sorted(set([1] + [2 ** x for x in range(cpus.bit_length())
+                               if 2 ** x <= cpus] + [cpus]))
+    allocator = PortAllocator(dict(
+        (k, template_layout(v)) for k, v in DEFAULT_TEMPLATES.items()))
+    print("{:>8} {:>8} {:>10} {:>12} {:>8}".format(
+        "devices", "workers", "seconds", "devices/s", "speedup"))
+    for size in sizes:
+        router_get = generate("leaf-spine", size).router_get()
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                model = netmodel.build_model(
+                    router_get, allocator, PrefixFilter({4: [24, 32]}))
+        rules = ConfigRules(**DEFAULT_RULES["ios"])
+        jobs = [(x, router_get[x.name]["config"]["running"], False, rules)
+                for x in model["gns_node_list"]]
+
+        first = None
+        for workers in counts:
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    results, elapsed = timed(
+                        netmodel.run_config_jobs, jobs, workers)
+            configs = [x[0] for x in results]
+            if first is None:
+                first = (configs, elapsed)
+            elif configs != first[0]:
+                raise SystemExit("{} workers gave different configs".format(
+                    workers))
+            print("{:>8} {:>8} {:>9.2f}s {:>12.0f} {:>7.1f}x".format(
+                size, workers, elapsed, size / elapsed, first[1] / elapsed))
+
+
+# the config rules against one find_all_children scan per section, the way
+# the sections used to be picked. sizes are config lines, the running
+# configs of a synthetic topology are joined until the config is that long.
+# the extra rules match nothing, they show what a longer rule file costs
+
+def bench_rules(sizes=None, extra=50):
+    from gnsconfig import ParsedConfig
+
+    sizes = sizes or [30000]
+    base = DEFAULT_RULES["ios"]
+    more = dict(base, include=base["include"] + [
+        "^snmp-server never" + str(x) for x in range(extra)])
+    print("{:>8} {:>8} {:>10} {:>10}".format(
+        "lines", "rules", "scans", "compiled"))
+    for size in sizes:
+        topo = generate("hub-spoke", max(2, size // 60))
+        lines = []
+        for name in topo.devices:
+            lines.extend(topo.running_config(name).splitlines())
+            if len(lines) >= size:
+                break
+        lines = lines[:size]
+        parse = ParsedConfig(lines).parse
+        for rules in (base, more):
+            compiled = ConfigRules(**rules)
+            _, scans = timed(lambda: [parse.find_all_children(x)
+                                      for x in rules["include"]])
+            _, elapsed = timed(compiled.extract, lines)
+            print("{:>8} {:>8} {:>9.3f}s {:>9.3f}s".format(
+                len(lines), len(rules["include"]), scans, elapsed))
+
+
+# what a model holds, to check a restored snapshot against the original
+
+def model_fingerprint(model):
+    return (
+        [(x.name, x.id, x.dir, x.config,
+          [(i.name, i.ip, i.prefix, i.version, i.secondary, i.adapter,
+            i.port, i.gns_name) for i in x.interfaces])
+         for x in model["gns_node_list"]],
+        model["netlist"],
+        [(x["name"], x["id"], [n.name for n in x["nodes"]])
+         for x in model["netmap"]],
+        sorted((k, [(n.name, i.name) for n, i in v])
+               for k, v in model["subnet_index"].items()),
+        [(x.name, x.ports) for x in model["switches"]],
+        [[(x.name, a, p) for x, a, p in ends] for ends in model["links"]],
+        model.get("positions"))
+
+
+def bench_snapshot(sizes=None):
+    from gnsstub import DEFAULT_TEMPLATES
+    from ports import PortAllocator
+    from ports import template_layout
+    from snapshot import SnapshotStore
+    import netmodel
+
+    sizes = sizes or [1000, 10000]
+    allocator = PortAllocator(dict(
+        (k, template_layout(v)) for k, v in DEFAULT_TEMPLATES.items()))
+    print("{:>8} {:>10} {:>10} {:>10}".format(
+        "devices", "KB", "save", "load"))
+    for size in sizes:
+        router_get = generate("leaf-spine", size).router_get()
+        with open(os.devnull, 'w') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                model = netmodel.build_model(
+                    router_get, allocator, PrefixFilter({4: [24, 32]}))
+        model["positions"] = dict((x.name, (n, -n)) for n, x in enumerate(
+            model["gns_node_list"] + model["switches"]))
+        for n, x in enumerate(model["gns_node_list"]):
+            x.add_id("node" + str(n))
+            x.add_dir("/opt/gns3/projects/p/node" + str(n))
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SnapshotStore(tmp)
+            filename, save = timed(store.save, "model", model)
+            restored, load = timed(store.load, "model")
+            kb = os.path.getsize(filename) / 1024
+        if model_fingerprint(restored) != model_fingerprint(model):
+            raise SystemExit("the restored model is different")
+        print("{:>8} {:>10.0f} {:>9.3f}s {:>9.3f}s".format(
+            size, kb, save, load))
+
+
+# one pipeline run: the synthetic topology goes into a discovery cache in a
+# scratch directory and netmodel build runs on it with --offline against
+# the stub server. each run is its own process so the peak memory of one
+# doesn't hide the next
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "benchmark-history.jsonl")
+PIPELINE_KINDS = {"leaf-spine": None, "hub-spoke": None, "full-mesh": 40}
+
+
+def pipeline_case(kind, size):
+    from cache import DiscoveryCache
+    from gnsstub import StubServer
+    import netmodel
+
+    here = os.getcwd()
+    stub = StubServer().start()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            cache = DiscoveryCache(".netmodel-cache", max_bytes=sys.maxsize)
+            for name, result in generate(kind, size).router_get().items():
+                cache.put(name, result, name)
+            cache.save()
+            del cache
+
+            args = netmodel.make_parser().parse_args(
+                ["build", "--offline", "--no-upload", "--gns-server",
+                 stub.address])
+            cfg = netmodel.load_config(args)
+            profiler.enable()
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    netmodel.cmd_build(cfg)
+            report = profiler.report()
+            report["seconds"] = time.perf_counter() - start
+        finally:
+            os.chdir(here)
+            stub.stop()
+    del report["devices"]
+    return report
+
+
+# what a build left in the stub: every node with its compute and place on
+# the canvas and every link by node name and port
+
+def project_state(stub):
+    project, = stub.gns.projects.values()
+    names = dict((k, v["name"]) for k, v in project["nodes"].items())
+    nodes = sorted((v["name"], v["node_type"], v["compute_id"], v["x"],
+                    v["y"]) for v in project["nodes"].values())
+    links = sorted(sorted((names[x["node_id"]], x["adapter_number"],
+                           x["port_number"]) for x in v["nodes"])
+                   for v in project["links"].values())
+    return nodes, links
+
+
+def build_case(router_get, latency, flags, computes=None):
+    from cache import DiscoveryCache
+    from gnsstub import StubServer
+    import netmodel
+
+    here = os.getcwd()
+    stub = StubServer(latency=latency, computes=computes).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            cache = DiscoveryCache(".netmodel-cache", max_bytes=sys.maxsize)
+            for name, result in router_get.items():
+                cache.put(name, result, name)
+            cache.save()
+            del cache
+
+            args = netmodel.make_parser().parse_args(
+                ["build", "--offline", "--no-upload", "--gns-server",
+                 stub.address, "--project-name", "bench"] + flags)
+            cfg = netmodel.load_config(args)
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    _, elapsed = timed(netmodel.cmd_build, cfg)
+            configs = {}
+            for name in os.listdir(cfg.output_dir):
+                with open(os.path.join(cfg.output_dir, name)) as f:
+                    configs[name] = f.read()
+        finally:
+            os.chdir(here)
+            stub.stop()
+    return project_state(stub), configs, elapsed
+
+
+# the sequential and the pipelined build against a stub server that takes
+# latency seconds per call, they have to make the same project
+
+def bench_schedule(sizes=None, latency=0.005):
+    sizes = sizes or [500]
+    print("{:>8} {:>12} {:>12} {:>8}".format(
+        "devices", "sequential", "pipelined", "speedup"))
+    for size in sizes:
+        router_get = generate("hub-spoke", size).router_get()
+        sequential = build_case(router_get, latency, [])
+        pipelined = build_case(router_get, latency, ["--pipeline"])
+        if sequential[:2] != pipelined[:2]:
+            raise SystemExit("the pipelined build made a different project")
+        print("{:>8} {:>11.2f}s {:>11.2f}s {:>7.1f}x".format(
+            size, sequential[2], pipelined[2], sequential[2] / pipelined[2]))
+
+
+# a build, then a sync of the same project with nothing changed, then one
+# with one device changed. the build cache should only build that device
+
+def bench_rebuild(sizes=None, latency=0.001):
+    from cache import DiscoveryCache
+    from gnsstub import StubServer
+    import netmodel
+
+    sizes = sizes or [1000]
+    print("{:>8} {:>10} {:>12} {:>12} {:>8}".format(
+        "devices", "build", "unchanged", "one change", "built"))
+    here = os.getcwd()
+    for size in sizes:
+        router_get = generate("hub-spoke", size).router_get()
+        stub = StubServer(latency=latency).start()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                cache = DiscoveryCache(".netmodel-cache",
+                                       max_bytes=sys.maxsize)
+                for name, result in router_get.items():
+                    cache.put(name, result, name)
+                cache.save()
+
+                def build(*flags):
+                    args = netmodel.make_parser().parse_args(
+                        ["build", "--offline", "--no-upload", "--gns-server",
+                         stub.address, "--project-name", "bench"] +
+                        list(flags))
+                    cfg = netmodel.load_config(args)
+                    profiler.reset()
+                    profiler.enable()
+                    with open(os.devnull, 'w') as devnull:
+                        with contextlib.redirect_stdout(devnull):
+                            _, elapsed = timed(netmodel.cmd_build, cfg)
+                    profiler.enabled = False
+                    return elapsed, profiler.counters.get("config_parses", 0)
+
+                first, _ = build()
+                p_id, = stub.gns.projects
+                unchanged, _ = build("--project-id", p_id)
+                name = sorted(router_get)[0]
+                result = cache.get(name, ttl=None)
+                result["config"]["running"] += "ip prefix-list NEW seq 5 " \
+                    "permit 192.0.2.0/24\n"
+                cache.put(name, result, name)
+                cache.save()
+                changed, built = build("--project-id", p_id)
+            finally:
+                os.chdir(here)
+                stub.stop()
+        print("{:>8} {:>9.2f}s {:>11.2f}s {:>11.2f}s {:>8}".format(
+            size, first, unchanged, changed, built))
+
+
+# the partitioner on the bigger topologies against handing the nodes out
+# round robin, then a build against a stub with three computes of different
+# sizes: every node has to be on one of them, each compute gets its share
+# of the ram and the links between computes are the ones the partition cut
+
+PARTITION_COMPUTES = {
+    "gns1": {"cpus": 64, "memory": 64 * 2 ** 30},
+    "gns2": {"cpus": 32, "memory": 32 * 2 ** 30},
+    "gns3": {"cpus": 32, "memory": 32 * 2 ** 30},
+}
+
+
+def bench_partition(sizes=None, build_size=300):
+    from gnsstub import DEFAULT_TEMPLATES
+    from partition import cut_links
+    from partition import partition
+    from ports import PortAllocator
+    from ports import template_layout
+    import netmodel
+
+    sizes = sizes or [1000, 10000]
+    allocator = PortAllocator(dict(
+        (k, template_layout(v)) for k, v in DEFAULT_TEMPLATES.items()))
+    capacity = [(x["memory"] // 2 ** 20, x["cpus"])
+                for x in PARTITION_COMPUTES.values()]
+    print("{:>8} {:>12} {:>8} {:>10} {:>12}".format(
+        "devices", "kind", "seconds", "cut", "round robin"))
+    for size in sizes:
+        for kind in ("leaf-spine", "hub-spoke"):
+            router_get = generate(kind, size).router_get()
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    model = netmodel.build_model(
+                        router_get, allocator, PrefixFilter({4: [24, 32]}))
+            names = [x.name for x in model["gns_node_list"] +
+                     model["switches"]]
+            edges = [(a.name, b.name) for (a, _, _), (b, _, _)
+                     in model["links"]]
+            demand = dict((x, (256, 1)) for x in names)
+            demand.update((x.name, (0, 0)) for x in model["switches"])
+            parts, seconds = timed(partition, names, edges, demand, capacity)
+            spread = dict((x, n % len(capacity)) for n, x in enumerate(names))
+            print("{:>8} {:>12} {:>7.2f}s {:>10} {:>12}".format(
+                size, kind, seconds, cut_links(edges, parts),
+                cut_links(edges, spread)))
+
+    router_get = generate("leaf-spine", build_size).router_get()
+    (nodes, links), _, elapsed = build_case(
+        router_get, 0, ["--computes", ",".join(PARTITION_COMPUTES)],
+        PARTITION_COMPUTES)
+    compute = dict((x[0], x[2]) for x in nodes)
+    routers = collections.Counter(x[2] for x in nodes
+                                  if x[1] != "ethernet_switch")
+    total = sum(x["memory"] for x in PARTITION_COMPUTES.values())
+    for compute_id, x in PARTITION_COMPUTES.items():
+        share = len(router_get) * x["memory"] / total
+        if abs(routers[compute_id] - share) > share * 0.05 + 1:
+            raise SystemExit("{} has {} routers, its share is {:.0f}".format(
+                compute_id, routers[compute_id], share))
+    tunnels = sum(1 for a, b in links if compute[a[0]] != compute[b[0]])
+    print("build of {} devices on {} computes in {:.2f}s: {}, {} of {} "
+          "links between computes".format(
+              len(router_get), len(PARTITION_COMPUTES), elapsed,
+              ", ".join("{} {}".format(k, routers[k])
+                        for k in PARTITION_COMPUTES), tunnels, len(links)))
+
+
+# a build, then boot on the project against a stub whose nodes take
+# boot_time to start and load their compute while they do. every node has
+# to come up, never more than the workers at once, and the only calls are
+# the starts: readiness comes from the notification stream
+
+def bench_boot(sizes=None, boot_time=0.2, workers=8):
+    from cache import DiscoveryCache
+    from gnsstub import StubServer
+    import netmodel
+
+    sizes = sizes or [200]
+    print("{:>8} {:>8} {:>10} {:>6} {:>8} {:>8} {:>10} {:>6}".format(
+        "devices", "console", "seconds", "waves", "median", "slowest",
+        "load waits", "calls"))
+    here = os.getcwd()
+    for size in sizes:
+        for console in (False, True):
+            router_get = generate("hub-spoke", size).router_get()
+            stub = StubServer(boot_time=boot_time, boot_cpu=15,
+                              ping_interval=boot_time).start()
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                try:
+                    cache = DiscoveryCache(".netmodel-cache",
+                                           max_bytes=sys.maxsize)
+                    for name, result in router_get.items():
+                        cache.put(name, result, name)
+                    cache.save()
+                    flags = ["--offline", "--gns-server", stub.address,
+                             "--boot-workers", str(workers)]
+                    if console:
+                        flags.append("--boot-console")
+                    cfg = netmodel.load_config(netmodel.make_parser()
+                                               .parse_args(
+                        ["build", "--no-upload", "--project-name",
+                         "bench"] + flags))
+                    with open(os.devnull, 'w') as devnull:
+                        with contextlib.redirect_stdout(devnull):
+                            netmodel.cmd_build(cfg)
+                    p_id, = stub.gns.projects
+                    calls = stub.gns.calls
+                    cfg = netmodel.load_config(netmodel.make_parser()
+                                               .parse_args(
+                        ["boot", "--project-id", p_id] + flags))
+                    profiler.reset()
+                    profiler.enable()
+                    with open(os.devnull, 'w') as devnull:
+                        with contextlib.redirect_stdout(devnull):
+                            netmodel.cmd_boot(cfg)
+                    profiler.enabled = False
+                    with open(cfg.boot_report) as f:
+                        report = json.load(f)
+                finally:
+                    os.chdir(here)
+                    stub.stop()
+            calls = stub.gns.calls - calls
+            started = sum(1 for x in stub.gns.projects[p_id]["nodes"].values()
+                          if x["status"] == "started")
+            if (report["failures"] or len(report["nodes"]) != size or
+                    started != size):
+                raise SystemExit("{} of {} nodes came up".format(
+                    len(report["nodes"]), size))
+            if stub.gns.max_booting > workers:
+                raise SystemExit("{} nodes booted at once".format(
+                    stub.gns.max_booting))
+            if calls != size + 3:
+                raise SystemExit("boot made {} calls for {} nodes".format(
+                    calls, size))
+            times = sorted(report["nodes"].values())
+            print("{:>8} {:>8} {:>9.2f}s {:>6} {:>7.2f}s {:>7.2f}s {:>10} "
+                  "{:>6}".format(
+                      size, "yes" if console else "no", report["seconds"],
+                      report["waves"], times[len(times) // 2], times[-1],
+                      profiler.counters.get("boot_load_waits", 0), calls))
+
+
+# the topology index of a model and its queries, then the crawl of a two
+# hop slice from one device against fetching everything. the model of the
+# slice has to give its hosts the interfaces and ports the whole model
+# gives them
+
+def bench_slice(sizes=None, hops=2):
+    from gnsstub import DEFAULT_TEMPLATES
+    from ports import PortAllocator
+    from ports import template_layout
+    from topology import TopologyIndex
+    from topology import crawl
+    from topology import node_networks
+    import argparse
+    import netmodel
+
+    sizes = sizes or [1000, 10000]
+    allocator = PortAllocator(dict(
+        (k, template_layout(v)) for k, v in DEFAULT_TEMPLATES.items()))
+    skip = PrefixFilter({4: [24, 32]})
+    print("{:>8} {:>12} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "devices", "kind", "index", "k-hop", "path", "group", "slice",
+        "fetched"))
+    for size in sizes:
+        for kind in ("leaf-spine", "hub-spoke"):
+            topo = generate(kind, size)
+            router_get = topo.router_get()
+            with open(os.devnull, 'w') as devnull:
+                with contextlib.redirect_stdout(devnull):
+                    model = netmodel.build_model(router_get, allocator, skip)
+            names = [x.name for x in model["gns_node_list"]]
+            index, index_time = timed(TopologyIndex.from_netmap,
+                                      model["netmap"], names)
+            seed = names[-1]
+            near, hop_time = timed(index.neighbourhood, [seed], hops)
+            path, path_time = timed(index.shortest_path, names[0], seed)
+            role = sorted(set(topo.roles.values()))[0]
+            _, group_time = timed(index.group, [role], dict(
+                (k, [v]) for k, v in topo.roles.items()))
+
+            # there is no path when the two aren't connected, otherwise it
+            # is as long as the hops between them
+
+            reach = index.neighbourhood([names[0]], len(names))
+            if seed not in reach:
+                if path is not None:
+                    raise SystemExit("a path from {} to {} that doesn't "
+                                     "exist".format(names[0], seed))
+            elif (path is None or len(path) != reach[seed] + 1 or
+                    path[0] != names[0] or path[-1] != seed):
+                raise SystemExit("no shortest path from {} to {}".format(
+                    names[0], seed))
+
+            fetched = []
+
+            def fetch(wanted):
+                fetched.extend(wanted)
+                return dict((x, router_get[x]) for x in wanted)
+
+            crawled = crawl(
+                TopologyIndex.from_netmap(model["netmap"], names),
+                {seed: hops + 1}, fetch,
+                lambda name, result: node_networks(
+                    netmodel.create_node(name, result), skip))
+            whole = dict(((x.name, i.name), i.gns_name)
+                         for x in model["gns_node_list"]
+                         for i in x.interfaces)
+            with tempfile.TemporaryDirectory() as tmp:
+                cfg = argparse.Namespace(
+                    slice=[seed], slice_hops=hops, slice_path=[],
+                    slice_groups=[], cache_dir=tmp)
+                with open(os.devnull, 'w') as devnull:
+                    with contextlib.redirect_stdout(devnull):
+                        part = netmodel.build_model(crawled, allocator, skip)
+                        _, part = netmodel.slice_model(cfg, crawled, part)
+            if set(x.name for x in part["gns_node_list"]) != set(near):
+                raise SystemExit("the slice isn't the {} hop "
+                                 "neighbourhood".format(hops))
+            for gns_node in part["gns_node_list"]:
+                for intf in gns_node.interfaces:
+                    if whole[(gns_node.name, intf.name)] != intf.gns_name:
+                        raise SystemExit("{} {} has another port in the "
+                                         "slice".format(gns_node.name,
+                                                        intf.name))
+            print("{:>8} {:>12} {:>7.3f}s {:>7.4f}s {:>7.4f}s {:>7.4f}s "
+                  "{:>8} {:>8}".format(
+                      size, kind, index_time, hop_time, path_time,
+                      group_time, len(near), len(set(fetched))))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, check=True,
+            cwd=os.path.dirname(HISTORY)).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def last_run(kind, size):
+    last = None
+    if os.path.exists(HISTORY):
+        with open(HISTORY) as f:
+            for line in f:
+                run = json.loads(line)
+                if run["kind"] == kind and run["size"] == size:
+                    last = run
+    return last
+
+
+def bench_pipeline(sizes=None):
+    sizes = sizes or [1000]
+    for size in sizes:
+        for kind, largest in PIPELINE_KINDS.items():
+            devices = min(size, largest or size)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "pipeline-case",
+                 kind, str(devices)], stdout=subprocess.PIPE, check=True)
+            report = json.loads(out.stdout.decode().splitlines()[-1])
+            before = last_run(kind, devices)
+
+            print("{} {} devices, {:.2f}s, peak {:.0f}MB".format(
+                kind, devices, report["seconds"], report["peak_mb"]))
+            print("    {:<16} {:>10} {:>10} {:>10}".format(
+                "stage", "seconds", "last run", "added MB"))
+            for name, stage in report["stages"].items():
+                last = ""
+                if before and name in before["stages"]:
+                    last = "{:.3f}".format(before["stages"][name]["seconds"])
+                print("    {:<16} {:>10.3f} {:>10} {:>10.1f}".format(
+                    name, stage["seconds"], last, stage["rss_added_mb"]))
+            print("    " + ", ".join("{} {}".format(k, v) for k, v
+                                     in sorted(report["counters"].items())))
+
+            report.update({
+                "kind": kind, "size": devices, "commit": git_commit(),
+                "time": datetime.datetime.now().isoformat(
+                    timespec="seconds")})
+            with open(HISTORY, 'a') as f:
+                f.write(json.dumps(report, sort_keys=True) + "\n")
+
+
+BENCHMARKS = {
+    "netmap": bench_netmap,
+    "memory": bench_memory,
+    "startup": bench_startup,
+    "layout": bench_layout,
+    "segments": bench_segments,
+    "pipeline": bench_pipeline,
+    "config": bench_config,
+    "rules": bench_rules,
+    "snapshot": bench_snapshot,
+    "schedule": bench_schedule,
+    "rebuild": bench_rebuild,
+    "partition": bench_partition,
+    "boot": bench_boot,
+    "slice": bench_slice,
+}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["pipeline-case"]:
+        print(json.dumps(pipeline_case(args[1], int(args[2]))))
+        raise SystemExit()
+    if not args or args[0] not in BENCHMARKS:
+        raise SystemExit("usage: benchmark.py {" +
+                         ",".join(BENCHMARKS) + "} [sizes...]")
+    BENCHMARKS[args[0]]([int(x) for x in args[1:]])
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+import json
+import re
+import socket
+import threading
+import time
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+from timing import profiler
+
+
+'''
+Starts the nodes of a project in waves instead of all at once. A wave is up
+to wave nodes, at most workers of them are booting at the same time and
+the next wave starts when every node of this one is up or has timed out.
+Before a wave the load of the compute servers is checked: nodes on a
+compute using more than max_cpu or max_memory percent wait, when every
+compute is that busy the wave waits for the next load report (up to the
+timeout, then it goes anyway).
+
+Nothing is polled. The project notification stream is read in a thread
+for the whole boot, a node is up when its node.updated event says it has
+started and gns3 reports the load of the computes on the same stream
+(compute.updated, or ping on older servers). When the stream drops it is
+opened again (up to reconnects times) and the status of every node is
+read once, for the nodes that started while nobody was listening. With
+console the node is only up once its console answers with prompt (a regex
+on the last thing it printed), that is when an ios image has really
+finished booting.
+
+The boot time of a node is from its start request to the moment it was
+up, they go in the boot report with the nodes that didn't come up.
+'''
+
+
+DEFAULT_PROMPT = r"[>#]\s*$"
+
+# telnet option negotiation, iac followed by a command and maybe an option
+# or a subnegotiation
+
+TELNET = re.compile(rb"\xff\xfa.*?\xff\xf0|\xff[\xfb-\xfe].|\xff[\xf0-\xfa]",
+                    re.S)
+
+
+class Notifications():
+
+    # the status of every node and the load of every compute as the
+    # notification stream of the project reports them
+
+    def __init__(self, gns, project_id, reconnects=3, backoff=0.5):
+        self.gns = gns
+        self.project_id = project_id
+        self.reconnects = reconnects
+        self.backoff = backoff
+        self.resp = gns.notifications(project_id)
+        self.status = {}
+        self.load = {}
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        try:
+            for attempt in range(self.reconnects + 1):
+                if attempt:
+                    profiler.count("notification_reconnects")
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                    if self.closed:
+                        break
+                    self.resp = self.gns.notifications(self.project_id)
+                    if self.closed:
+                        self.resp.close()
+                        break
+                    self.catch_up()
+                self.read_stream()
+                if self.closed:
+                    break
+        except (requests.RequestException, OSError, ValueError):
+            pass
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    # close shuts the response under the read, http.client then fails with
+    # whatever it was doing, that is the end of the stream too
+
+    def read_stream(self):
+        try:
+            for line in self.resp.iter_lines(chunk_size=None):
+                if self.closed:
+                    return
+                if line:
+                    profiler.count("notifications")
+                    self.handle(json.loads(line))
+        except (requests.RequestException, OSError, AttributeError):
+            pass
+
+    def catch_up(self):
+        for node in self.gns.get_nodes(self.project_id):
+            self.handle({"action": "node.updated", "event": node})
+
+    def handle(self, message):
+        action = message.get("action")
+        event = message.get("event") or {}
+        if action == "node.updated" and "node_id" in event:
+            with self.cond:
+                status = event.get("status")
+                if self.status.get(event["node_id"], (None,))[0] != status:
+                    self.status[event["node_id"]] = (status,
+                                                     time.monotonic())
+                self.cond.notify_all()
+        elif action in ("compute.updated", "ping"):
+            self.set_load(event.get("compute_id", "local"), event)
+
+    def set_load(self, compute_id, compute):
+        with self.cond:
+            self.load[compute_id] = (compute.get("cpu_usage_percent") or 0,
+                                     compute.get("memory_usage_percent") or 0)
+            self.cond.notify_all()
+
+    def busy(self, max_cpu, max_memory):
+        with self.cond:
+            return set(k for k, (cpu, memory) in self.load.items()
+                       if cpu > max_cpu or memory > max_memory)
+
+    # when the node started, None if it didn't before the deadline or the
+    # stream closed
+
+    def wait_started(self, node_id, deadline):
+        with self.cond:
+            while self.status.get(node_id, (None, None))[0] != "started":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.closed:
+                    return None
+                self.cond.wait(remaining)
+            return self.status[node_id][1]
+
+    def wait(self, timeout):
+        with self.cond:
+            if not self.closed:
+                self.cond.wait(timeout)
+
+    def close(self):
+        self.closed = True
+        self.resp.close()
+
+
+# reads the console until prompt matches what it printed last, a return is
+# sent every few seconds to get a prompt out of it
+
+def wait_prompt(host, port, prompt, deadline, poke=5):
+    text = ""
+    poked = 0
+    with socket.create_connection(
+            (host, port), timeout=max(1, deadline - time.monotonic())) as sock:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                raise TimeoutError("no console prompt")
+            if now - poked >= poke:
+                sock.sendall(b"\r\n")
+                poked = now
+            sock.settimeout(min(1, deadline - now))
+            try:
+                data = sock.recv(4096)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConnectionError("the console closed")
+            text = (text + TELNET.sub(b"", data).decode(
+                "ascii", "replace"))[-256:]
+            if prompt.search(text):
+                return
+
+
+class LabBoot():
+
+    # nodes are the gns3 node data (node_id, name, compute_id, console ...)
+    # of the nodes to start, server is the host of a console that listens
+    # on every address
+
+    def __init__(self, gns, project_id, nodes, wave=20, workers=8,
+                 max_cpu=80, max_memory=90, timeout=600, console=False,
+                 prompt=DEFAULT_PROMPT, server="127.0.0.1", reconnects=3):
+        self.gns = gns
+        self.project_id = project_id
+        self.nodes = nodes
+        self.wave = max(1, wave)
+        self.workers = max(1, workers)
+        self.max_cpu = max_cpu
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.console = console
+        self.prompt = re.compile(prompt)
+        self.server = server
+        self.reconnects = reconnects
+        self.events = None
+        self.times = {}
+        self.failures = {}
+        self.waves = 0
+        self.seconds = 0
+
+    def run(self):
+        start = time.monotonic()
+        self.events = Notifications(self.gns, self.project_id,
+                                    self.reconnects)
+        try:
+            for compute in self.gns.get_computes():
+                self.events.set_load(compute["compute_id"], compute)
+            pending = [x for x in self.nodes if x.get("status") != "started"]
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                while pending:
+                    wave = self.next_wave(pending)
+                    self.waves += 1
+                    for node, (seconds, error) in zip(
+                            wave, pool.map(self.boot, wave)):
+                        if error:
+                            self.failures[node["name"]] = error
+                            continue
+                        self.times[node["name"]] = seconds
+                        profiler.add_device("boot", node["name"], seconds)
+        finally:
+            self.events.close()
+            self.seconds = time.monotonic() - start
+        return self.times
+
+    # the next wave, taken in order from the nodes on computes that aren't
+    # busy. pending is left with the rest
+
+    def next_wave(self, pending):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            busy = self.events.busy(self.max_cpu, self.max_memory)
+            wave = [x for x in pending
+                    if x.get("compute_id", "local") not in busy][:self.wave]
+            remaining = deadline - time.monotonic()
+            if wave or remaining <= 0 or self.events.closed:
+                break
+            profiler.count("boot_load_waits")
+            self.events.wait(remaining)
+        wave = wave or pending[:self.wave]
+        chosen = set(x["node_id"] for x in wave)
+        pending[:] = [x for x in pending if x["node_id"] not in chosen]
+        return wave
+
+    # start one node and wait for it to be up, returns (seconds, error)
+
+    def boot(self, node):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        try:
+            self.gns.start_node(self.project_id, node["node_id"])
+            if self.events.wait_started(node["node_id"], deadline) is None:
+                if self.events.closed:
+                    return None, "the notification stream closed"
+                return None, "not started after {}s".format(self.timeout)
+            if self.console and node.get("console"):
+                wait_prompt(self.console_host(node), node["console"],
+                            self.prompt, deadline)
+        except Exception as e:
+            return None, "{}: {}".format(type(e).__name__, e)
+        return time.monotonic() - start, None
+
+    def console_host(self, node):
+        host = node.get("console_host")
+        if not host or host in ("0.0.0.0", "::"):
+            return self.server
+        return host
+
+    def print_report(self, filename=None, slowest=5):
+        print("Booted {} nodes in {} waves in {:.1f}s".format(
+            len(self.times), self.waves, self.seconds))
+        if self.times:
+            times = sorted(self.times.values())
+            print("boot time median {:.1f}s, slowest {:.1f}s".format(
+                times[len(times) // 2], times[-1]))
+            for name, seconds in sorted(self.times.items(),
+                                        key=lambda x: -x[1])[:slowest]:
+                print("  {:<24} {:>8.1f}s".format(name, seconds))
+        if self.failures:
+            print("These nodes didn't come up:")
+            for name, reason in sorted(self.failures.items()):
+                print("  {}: {}".format(name, reason))
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump({"seconds": self.seconds, "waves": self.waves,
+                           "nodes": self.times, "failures": self.failures},
+                          f, indent=2, sort_keys=True)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import time
+
+from collections import Counter
+
+
+'''
+On-disk cache of the per-device getter results, so the topology can be
+rebuilt without logging into the devices again. Results are stored as
+content-addressed blobs (the file name is the sha256 of the content) and an
+index maps each host to its current blob:
+
+.netmodel-cache/index.json
+    {"r1": {"hash": "9f86d0...", "hostname": "10.1.1.1",
+            "fetched": 1554600000.0, "used": 1554600300.0}}
+.netmodel-cache/blobs/9f86d0....json
+    {"config": {"running": "..."}, "interfaces_ip": {...}}
+
+Entries older than the ttl are stale. When the blobs grow past max_bytes
+the least recently used hosts are dropped.
+'''
+
+
+def write_atomic(filename, data):
+    tmp = filename + ".tmp"
+    with open(tmp, 'w') as f:
+        f.write(data)
+    os.replace(tmp, filename)
+
+
+class DiscoveryCache():
+
+    def __init__(self, path, ttl=3600, max_bytes=100 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(path, "blobs")
+        self.index_file = os.path.join(path, "index.json")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+
+    def blob_file(self, blob_hash):
+        return os.path.join(self.blob_dir, blob_hash + ".json")
+
+    # returns the cached result or None. ttl=None ignores the age, that is
+    # how we run offline. a host whose address changed is a miss
+
+    def get(self, name, hostname=None, ttl=-1):
+        if ttl == -1:
+            ttl = self.ttl
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        if hostname is not None and entry["hostname"] != hostname:
+            return None
+        if ttl is not None and time.time() - entry["fetched"] > ttl:
+            return None
+        try:
+            with open(self.blob_file(entry["hash"])) as f:
+                result = json.load(f)
+        except (IOError, ValueError):
+            del self.index[name]
+            return None
+        entry["used"] = time.time()
+        return result
+
+    def put(self, name, result, hostname=None):
+        data = json.dumps(result, sort_keys=True)
+        blob_hash = hashlib.sha256(data.encode()).hexdigest()
+        blob_file = self.blob_file(blob_hash)
+        if not os.path.exists(blob_file):
+            write_atomic(blob_file, data)
+        now = time.time()
+        self.index[name] = {"hash": blob_hash, "hostname": hostname,
+                            "fetched": now, "used": now}
+
+    # drop hosts from the cache, the blobs go when nothing points at them
+
+    def invalidate(self, names):
+        for name in names:
+            self.index.pop(name, None)
+
+    # remove unreferenced blobs then drop the least recently used hosts
+    # until the cache fits in max_bytes
+
+    def evict(self):
+        sizes = {}
+        for filename in os.listdir(self.blob_dir):
+            if not filename.endswith(".json"):
+                continue
+            blob_hash = filename[:-len(".json")]
+            sizes[blob_hash] = os.path.getsize(
+                os.path.join(self.blob_dir, filename))
+
+        refs = Counter(x["hash"] for x in self.index.values())
+        total = sum(sizes[x] for x in refs if x in sizes)
+        for name, entry in sorted(self.index.items(),
+                                  key=lambda x: x[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            del self.index[name]
+            refs[entry["hash"]] -= 1
+            if refs[entry["hash"]] == 0:
+                total -= sizes.get(entry["hash"], 0)
+
+        used = set(x["hash"] for x in self.index.values())
+        for blob_hash in sizes:
+            if blob_hash not in used:
+                os.remove(self.blob_file(blob_hash))
+
+    def save(self):
+        self.evict()
+        write_atomic(self.index_file, json.dumps(self.index, indent=1))
+
+
+# the gns configs already built, so a rebuild only generates and uploads
+# the devices whose inputs changed. the blob of a device is its last config
+# and the key of the inputs it was built from (see configgen.build_key),
+# the index entry also remembers where that config was uploaded:
+#
+# .netmodel-cache/builds/index.json
+#     {"r1": {"hash": "41c2e8...", "hostname": null, "fetched": ...,
+#             "used": ..., "uploaded": ["/opt/gns3/.../i1_startup-config.cfg",
+#                                       "5e1f0a..."]}}
+#
+# eviction is the same least recently used one as the discovery cache
+
+class BuildCache(DiscoveryCache):
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024):
+        super().__init__(path, ttl=None, max_bytes=max_bytes)
+
+    # the config built from these inputs, None if the inputs changed
+
+    def artifact(self, name, key):
+        result = self.get(name, ttl=None)
+        if result is None or result["key"] != key:
+            return None
+        return result["config"]
+
+    def add_artifact(self, name, key, config):
+        self.put(name, {"key": key, "config": config})
+
+    # true when this config went to this remote file last time. a new
+    # artifact replaces the index entry, so it is uploaded again
+
+    def uploaded(self, name, remote, digest):
+        entry = self.index.get(name)
+        return entry is not None and entry.get("uploaded") == [remote, digest]
+
+    def add_upload(self, name, remote, digest):
+        if name in self.index:
+            self.index[name]["uploaded"] = [remote, digest]
+
+    # drop the given devices, or everything
+
+    def invalidate(self, names=None):
+        super().invalidate(list(self.index) if names is None else names)
+
+
+def file_digest(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
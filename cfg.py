@@ -14,7 +14,6 @@ from nornir.plugins.functions.text import print_result
 from napalm import get_network_driver
 from ciscoconfparse import CiscoConfParse
 from gnsmodel import Node
-from gnsmodel import Link
 
 
 
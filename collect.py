@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import json
+import random
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from timing import profiler
+from workers import DaemonPool
+
+
+'''
+Collects the napalm getters from every device with a bounded pool of
+workers. Results are yielded as each host finishes so the model can be
+built while slower devices are still answering. A host that fails or runs
+past its timeout is recorded in the failure report instead of stopping the
+run. The workers are daemon threads, a host that hangs past its deadline
+doesn't hold up the others or the exit of the program.
+
+Example of what collect yields:
+("r1", {"config": {"running": "..."}, "interfaces_ip": {"e1": {...}}})
+'''
+
+
+# turn the nornir inventory into the host dicts the collector uses
+
+def nornir_hosts(nr):
+    hosts = []
+    for name, host in nr.inventory.hosts.items():
+        hosts.append({
+            "name": name,
+            "hostname": host.hostname,
+            "username": host.username,
+            "password": host.password,
+            "platform": host.platform})
+    return hosts
+
+
+# the default driver factory, connect_timeout covers the login and
+# command_timeout is the netmiko read timeout napalm uses for every command
+
+def napalm_driver(host, connect_timeout, command_timeout):
+    from napalm import get_network_driver
+    driver = get_network_driver(host["platform"])
+    return driver(host["hostname"], host["username"], host["password"],
+                  timeout=command_timeout,
+                  optional_args={"conn_timeout": connect_timeout})
+
+
+class Collector():
+
+    def __init__(self, workers=20, connect_timeout=10, command_timeout=60,
+                 getters=("config", "interfaces_ip"),
+                 driver_factory=napalm_driver):
+        self.workers = workers
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.getters = getters
+        self.driver_factory = driver_factory
+        self.failures = {}
+        self.started = {}
+
+    # a host gets the connect timeout plus the command timeout per getter
+
+    def deadline(self):
+        return self.connect_timeout + self.command_timeout * len(self.getters)
+
+    def fetch(self, host):
+        self.started[host["name"]] = time.monotonic()
+        with profiler.device("discovery", host["name"]):
+            device = self.driver_factory(
+                host, self.connect_timeout, self.command_timeout)
+            device.open()
+            try:
+                result = {}
+                for getter in self.getters:
+                    result[getter] = getattr(device, "get_" + getter)()
+                return result
+            finally:
+                device.close()
+
+    # how long until the first of the running hosts passes its deadline
+
+    def next_deadline(self, pending):
+        started = [self.started[x] for x in pending.values()
+                   if x in self.started]
+        if not started:
+            return 1
+        return min(1, max(0, min(started) + self.deadline() -
+                          time.monotonic()))
+
+    # yields (name, result) as each host finishes. hung hosts are given up on
+    # once they pass their deadline, the worker thread is left to finish on
+    # its own and another one takes its place. the failures add up over the
+    # calls, a crawl collects one hop at a time and reports them all at the
+    # end
+
+    def collect(self, hosts):
+        self.started = {}
+        pool = DaemonPool(self.workers)
+        pending = {}
+        for host in hosts:
+            pending[pool.submit(self.fetch, host)] = host["name"]
+
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=self.next_deadline(pending),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.failures[name] = "{}: {}".format(
+                            type(e).__name__, e)
+                        continue
+                    self.failures.pop(name, None)
+                    yield name, result
+
+                now = time.monotonic()
+                for future, name in list(pending.items()):
+                    start = self.started.get(name)
+                    if start is not None and now - start > self.deadline():
+                        pool.abandon(future)
+                        del pending[future]
+                        self.failures[name] = "timed out after {}s".format(
+                            self.deadline())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def print_failure_report(self, filename=None):
+        if not self.failures:
+            return
+        print("These hosts failed and will not be modeled: ")
+        for name, reason in sorted(self.failures.items()):
+            print("{}: {}".format(name, reason))
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump(self.failures, f, indent=2, sort_keys=True)
+
+
+# stands in for a napalm driver when testing the collector. payloads is a
+# dict of host name -> getter results, latency is a (min, max) range in
+# seconds and failure_rate is the chance a host fails to connect. each host
+# draws its own latencies and failure from seed and its name
+
+class FakeDriver():
+
+    def __init__(self, host, payloads, latency=(0, 0), failure_rate=0,
+                 seed=None):
+        self.host = host
+        self.payloads = payloads
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(
+            None if seed is None else "{}:{}".format(seed, host["name"]))
+
+    def open(self):
+        time.sleep(self.random.uniform(*self.latency))
+        if self.random.random() < self.failure_rate:
+            raise ConnectionError("fake connection failure")
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        if not name.startswith("get_"):
+            raise AttributeError(name)
+        getter = name[4:]
+
+        def get():
+            time.sleep(self.random.uniform(*self.latency))
+            return self.payloads[self.host["name"]][getter]
+        return get
+
+    # driver_factory for the collector
+
+    @classmethod
+    def factory(cls, payloads, **kwargs):
+        def make(host, connect_timeout, command_timeout):
+            return cls(host, payloads, **kwargs)
+        return make
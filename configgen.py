@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+
+from cache import write_atomic
+from modfile import rename_intfs
+from timing import profiler
+
+
+'''
+Builds the gns startup config of one device in memory. The running config
+is parsed once and then goes through a list of stages. A stage takes the
+node, the parsed config, the config rules of the device platform and the
+lines built so far and returns the new lines, so stages can be added,
+dropped or reordered without touching the others:
+
+extract     the global sections the rules keep (hostname, routing ...)
+interfaces  the blocks of the interfaces we model, less the excluded lines
+rename      device interface names to gns port names
+
+Nothing is written until the config is finished. With debug the lines after
+every stage are kept so they can be written next to the final config.
+'''
+
+
+def extract(gns_node, parsed, rules, lines):
+    from gnsconfig import gns_config_lines
+    return lines + gns_config_lines(parsed, rules)
+
+
+def interfaces(gns_node, parsed, rules, lines):
+    return lines + add_int_config(gns_node, parsed, rules)
+
+
+def rename(gns_node, parsed, rules, lines):
+    return modify_cfg(gns_node, parsed, "".join(lines)).splitlines(True)
+
+
+STAGES = [
+    ("extract", extract),
+    ("interfaces", interfaces),
+    ("rename", rename),
+]
+
+
+def add_int_config(gns_node, parsed, rules):
+
+    # loop through the interfaces to get the ip we will look up in the
+    # parsed config
+
+    lines = []
+    for intf in gns_node.interfaces:
+        ip = intf.ip_string
+        ip_ints = parsed.find_intfs(ip)
+        for i in ip_ints:
+            # i is a <class 'ciscoconfparse.models_cisco.IOSCfgLine'>
+            lines.extend(rules.filter_block(i.ioscfg))
+            lines.append("!\n")
+    return lines
+
+
+# update the config interface names with the gns names
+
+def modify_cfg(gns_node, parsed, config):
+
+    # build the old -> new name map for the whole node and rename everything
+    # in one pass. use the interface name as it is written in the config,
+    # napalm and the config don't always agree
+
+    renames = {}
+    for i in gns_node.interfaces:
+        for name in parsed.find_intf_names(i.ip_string) or [i.name]:
+            renames[name] = i.gns_name
+    return rename_intfs(config, renames)
+
+
+# bump when the same inputs build a different config, the configs in the
+# build cache are then built again
+
+BUILD_VERSION = 1
+
+
+# the key of everything a device's config is built from: the running
+# config, the interfaces left after pruning with their gns ports and the
+# config rules. the build cache reuses a config while the key is the same
+
+def build_key(gns_node, config, rules, stages=STAGES):
+    intfs = [(i.name, i.ip, i.prefix, i.version, i.secondary, i.adapter,
+              i.port, i.gns_name) for i in gns_node.interfaces]
+    inputs = [BUILD_VERSION, [name for name, _ in stages], rules.include,
+              rules.exclude, rules.rewrite, intfs]
+    key = hashlib.sha256(json.dumps(inputs).encode())
+    key.update(config.encode())
+    return key.hexdigest()
+
+
+# returns the finished config and, with debug, a list of (stage, text)
+# with the config after each stage
+
+def build_config(gns_node, config, rules=None, stages=STAGES, debug=False):
+    from configrules import DEFAULT_PLATFORM
+    from configrules import load_rules
+    from configrules import platform_rules
+    from gnsconfig import ParsedConfig
+
+    if rules is None:
+        rules = platform_rules(load_rules(), DEFAULT_PLATFORM)
+    parsed = ParsedConfig(config.splitlines())
+    lines = []
+    steps = []
+    for name, stage in stages:
+        with profiler.stage(name):
+            lines = stage(gns_node, parsed, rules, lines)
+        if debug:
+            steps.append((name, "".join(lines)))
+    return "".join(lines), steps
+
+
+def config_file(output_dir, name):
+    return os.path.join(output_dir, str(name) + "-gns.cfg")
+
+
+# the final config is the only file unless debug is on, then the running
+# config and each stage go in output_dir/debug
+
+def write_config(output_dir, name, gns_config, config=None, steps=()):
+    filename = config_file(output_dir, name)
+    write_atomic(filename, gns_config)
+    if config is not None:
+        debug_dir = os.path.join(output_dir, "debug")
+        os.makedirs(debug_dir, exist_ok=True)
+        write_atomic(os.path.join(debug_dir, str(name) + ".cfg"), config)
+        for num, (stage, text) in enumerate(steps, 1):
+            write_atomic(os.path.join(debug_dir, "{}.{}-{}.cfg".format(
+                name, num, stage)), text)
+    return filename
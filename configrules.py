@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import re
+
+
+'''
+Which parts of the running config go into the gns config. The rules are
+per platform (the napalm platform of the host) and can be given in a yaml
+file, config_rules in the settings:
+
+ios:
+  include:            # top level lines whose blocks are kept, the kept
+    - ^hostname       # sections come out in this order
+    - ^interface Loopback
+    - ^router
+  exclude:            # lines dropped anywhere in a kept block, with the
+    - bfd             # lines indented under them
+  rewrite:            # regex and replacement for the lines that are kept
+    - match: ^( *)shutdown$
+      replace: \\1no shutdown
+
+A platform in the file replaces the built in rules for that platform, a
+host with a platform that has no rules gets the ios rules.
+
+The rules are compiled once: all the include patterns into one regex with a
+group per section, all the excludes into another. A config is walked one
+line at a time and every line is matched once, so more rules don't mean
+more passes over the config.
+'''
+
+
+DEFAULT_PLATFORM = "ios"
+
+DEFAULT_RULES = {
+    "ios": {
+        "include": [
+            r"^hostname",
+            r"^interface Loopback",
+            r"^router",
+            r"^route-map",
+            r"^ip prefix-list",
+        ],
+        "exclude": [
+            r"bfd",
+            r"source-interface",
+        ],
+        "rewrite": [],
+    },
+}
+
+
+def any_of(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(x) for x in patterns))
+
+
+class ConfigRules():
+
+    def __init__(self, include=(), exclude=(), rewrite=()):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.rewrite = [(x["match"], x["replace"]) for x in rewrite]
+        self.compile()
+
+    def compile(self):
+        self.sections = re.compile("|".join(
+            "(?P<s{}>{})".format(num, x)
+            for num, x in enumerate(self.include))) if self.include else None
+        self.section_groups = ["s" + str(x) for x in range(len(self.include))]
+        self.excluded = any_of(self.exclude)
+        self.rewrites = [(re.compile(x), y) for x, y in self.rewrite]
+        self.rewritten = any_of([x for x, _ in self.rewrite])
+
+    # the include rule a top level line matches, None if it isn't kept
+
+    def section(self, line):
+        if self.sections is None:
+            return None
+        match = self.sections.match(line)
+        if match is None:
+            return None
+        for num, group in enumerate(self.section_groups):
+            if match.start(group) != -1:
+                return num
+
+    # only the lines one of the rewrites matches go through them
+
+    def rewrite_line(self, line):
+        if self.rewritten is None or not self.rewritten.search(line):
+            return line
+        for pattern, replace in self.rewrites:
+            line = pattern.sub(replace, line)
+        return line
+
+    # the kept lines of one block, an excluded line takes the lines indented
+    # under it with it
+
+    def filter_block(self, lines):
+        result = []
+        skip = None
+        for line in lines:
+            indent = len(line) - len(line.lstrip(" "))
+            if skip is not None and indent > skip:
+                continue
+            skip = None
+            if self.excluded is not None and self.excluded.search(line):
+                skip = indent
+                continue
+            result.append(self.rewrite_line(line) + "\n")
+        return result
+
+    # one pass over the config lines, returns the kept lines of every
+    # include rule in rule order
+
+    def extract(self, lines):
+        kept = [[] for _ in self.include]
+        block = None
+        current = None
+        for line in lines:
+            if line[:1] not in (" ", "\t"):
+                if block:
+                    kept[current].extend(self.filter_block(block))
+                current = self.section(line)
+                block = [] if current is not None else None
+            if block is not None:
+                block.append(line.rstrip())
+        if block:
+            kept[current].extend(self.filter_block(block))
+        return kept
+
+
+# a rule file with a mistake is refused with a ValueError that says where,
+# a bad regex or a string where a list goes would otherwise keep or drop
+# the wrong lines without a word
+
+def check_rules(platform, rules):
+    if not isinstance(rules, dict):
+        raise ValueError("config rules of {}: not a mapping".format(platform))
+    unknown = set(rules) - set(["include", "exclude", "rewrite"])
+    if unknown:
+        raise ValueError("config rules of {}: unknown {}".format(
+            platform, ", ".join(sorted(unknown))))
+    for key in ("include", "exclude", "rewrite"):
+        if not isinstance(rules.get(key) or [], list):
+            raise ValueError("config rules of {}: {} is not a list".format(
+                platform, key))
+    patterns = list(rules.get("include") or []) + list(
+        rules.get("exclude") or [])
+    for x in rules.get("rewrite") or []:
+        if not isinstance(x, dict) or set(x) != set(["match", "replace"]):
+            raise ValueError("config rules of {}: a rewrite needs match and "
+                             "replace, got {!r}".format(platform, x))
+        patterns.append(x["match"])
+    for x in patterns:
+        try:
+            re.compile(x)
+        except (re.error, TypeError) as e:
+            raise ValueError("config rules of {}: bad pattern {!r}: {}".format(
+                platform, x, e))
+
+
+def compile_rules(rules):
+    for platform, x in rules.items():
+        check_rules(platform, x)
+    return dict((platform, ConfigRules(
+        x.get("include") or (), x.get("exclude") or (),
+        x.get("rewrite") or ())) for platform, x in rules.items())
+
+
+# the built in rules with the platforms of the yaml file on top
+
+def load_rules(filename=None):
+    rules = dict(DEFAULT_RULES)
+    if filename:
+        import yaml
+        with open(filename) as f:
+            rules.update(yaml.safe_load(f) or {})
+    return compile_rules(rules)
+
+
+def platform_rules(rules, platform):
+    return rules.get(platform) or rules[DEFAULT_PLATFORM]
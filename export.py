@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import uuid
+import zipfile
+
+from ports import switch_ports
+
+
+'''
+Writes the topology as a gns3 portable project (.gns3project) that can be
+imported in one step instead of creating every node and link over the
+REST API. The zip holds project.gns3 and each node's startup config:
+
+project.gns3
+project-files/dynamips/<node_id>/configs/i1_startup-config.cfg
+project-files/iou/<node_id>/startup-config.cfg
+
+Networks with more than two interfaces get a builtin ethernet switch.
+
+project.gns3 is written as a stream one node and link at a time and the
+configs are copied straight from the generated files, so memory stays flat
+however many nodes there are.
+'''
+
+
+PROJECT_VERSION = "2.2.0"
+PROJECT_REVISION = 9
+
+# template fields that describe the template, not the node
+
+TEMPLATE_KEYS = ["template_id", "appliance_id", "template_type", "node_type",
+                 "name", "category", "symbol", "builtin", "compute_id",
+                 "default_name_format"]
+
+
+def template_type(template):
+    return template.get("template_type") or template.get("node_type")
+
+
+def template_properties(template):
+    if "properties" in template:
+        return dict(template["properties"])
+    return dict((k, v) for k, v in template.items() if k not in TEMPLATE_KEYS)
+
+
+# where gns3 keeps the startup config of a node, relative to the project
+
+def config_path(node, node_type):
+    if node_type == "iou":
+        return "project-files/iou/{}/startup-config.cfg".format(node.id)
+    return "project-files/{}/{}/configs/{}".format(
+        node_type, node.id, node.startup)
+
+
+# node ids are only made up here, gns3 keeps them on import. works for
+# switches as well
+
+def add_node_ids(gns_node_list):
+    for gns_node in gns_node_list:
+        gns_node.add_id(str(uuid.uuid4()))
+
+
+def node_data(gns_node, num, template, x, y):
+    node_type = template_type(template)
+    props = template_properties(template)
+    if node_type == "iou":
+        props["application_id"] = num
+    elif node_type == "dynamips":
+        props["dynamips_id"] = num
+    return {
+        "compute_id": "local",
+        "node_id": gns_node.id,
+        "node_type": node_type,
+        "name": gns_node.name,
+        "symbol": template.get("symbol", ":/symbols/router.svg"),
+        "x": x,
+        "y": y,
+        "z": 1,
+        "port_name_format": props.pop("port_name_format", "Ethernet{0}"),
+        "properties": props,
+    }
+
+
+def switch_data(switch, x, y):
+    return {
+        "compute_id": "local",
+        "node_id": switch.id,
+        "node_type": "ethernet_switch",
+        "name": switch.name,
+        "symbol": ":/symbols/ethernet_switch.svg",
+        "x": x,
+        "y": y,
+        "z": 1,
+        "properties": {"ports_mapping": switch_ports(switch.ports)},
+    }
+
+
+# ends is a pair of (node, adapter, port) from segment_links
+
+def link_data(ends):
+    return {
+        "link_id": str(uuid.uuid4()),
+        "nodes": [{"node_id": x.id, "adapter_number": adapter,
+                   "port_number": port} for x, adapter, port in ends],
+    }
+
+
+# write a json list one item at a time
+
+def write_list(f, items):
+    f.write("[")
+    for num, item in enumerate(items):
+        if num:
+            f.write(",")
+        f.write(json.dumps(item))
+    f.write("]")
+
+
+# templates is a dict of template id -> gns3 template data and positions a
+# dict of node name -> (x, y). links and switches come from segment_links
+
+def export_project(filename, name, gns_node_list, links, templates,
+                   positions=None, switches=()):
+    positions = positions or {}
+    project = {
+        "name": name,
+        "project_id": str(uuid.uuid4()),
+        "revision": PROJECT_REVISION,
+        "version": PROJECT_VERSION,
+        "type": "topology",
+        "auto_start": False,
+        "auto_open": False,
+        "auto_close": True,
+    }
+
+    # the startup config names follow the node numbers we hand out here
+
+    numbers = {}
+    for num, gns_node in enumerate(gns_node_list, 1):
+        numbers[gns_node.name] = num
+        if template_type(templates[gns_node.template]) == "dynamips":
+            gns_node.add_startup("i" + str(num) + "_startup-config.cfg")
+
+    def nodes():
+        for gns_node in gns_node_list:
+            x, y = positions.get(gns_node.name, (0, 0))
+            yield node_data(gns_node, numbers[gns_node.name],
+                            templates[gns_node.template], x, y)
+        for switch in switches:
+            x, y = positions.get(switch.name, (0, 0))
+            yield switch_data(switch, x, y)
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("project.gns3", 'w') as raw:
+            f = io.TextIOWrapper(raw, encoding="utf-8")
+            f.write(json.dumps(project)[:-1])
+            f.write(', "topology": {"computes": [], "drawings": [], '
+                    '"nodes": ')
+            write_list(f, nodes())
+            f.write(', "links": ')
+            write_list(f, (link_data(x) for x in links))
+            f.write("}}")
+            f.flush()
+            f.detach()
+
+        for gns_node in gns_node_list:
+            if gns_node.config:
+                node_type = template_type(templates[gns_node.template])
+                zf.write(gns_node.config, config_path(gns_node, node_type))
+
+
+# re-read an exported project and count what is in it. raises ValueError if
+# a link points at a missing node or a port is used twice
+
+def validate_project(filename):
+    with zipfile.ZipFile(filename) as zf:
+        with zf.open("project.gns3") as f:
+            project = json.load(io.TextIOWrapper(f, encoding="utf-8"))
+        files = set(zf.namelist())
+
+    topology = project["topology"]
+    node_ids = set(x["node_id"] for x in topology["nodes"])
+    ports = set()
+    for link in topology["links"]:
+        if len(link["nodes"]) != 2:
+            raise ValueError("link {} has {} ends".format(
+                link["link_id"], len(link["nodes"])))
+        for end in link["nodes"]:
+            if end["node_id"] not in node_ids:
+                raise ValueError("link {} uses unknown node {}".format(
+                    link["link_id"], end["node_id"]))
+            port = (end["node_id"], end["adapter_number"], end["port_number"])
+            if port in ports:
+                raise ValueError("port {} is used twice".format(port))
+            ports.add(port)
+
+    configs = [x for x in files if x.startswith("project-files/")]
+    return {"nodes": len(node_ids), "links": len(topology["links"]),
+            "ports": len(ports), "configs": len(configs)}
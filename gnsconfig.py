@@ -1,58 +1,77 @@
 #!/usr/bin/env python3
 
+import ipaddress
+import re
+
 from ciscoconfparse import CiscoConfParse
 
-# todo: remove bfd, source-interface commands
-
-# uncomment to test directly
-# config_full = "PDXL-3850-01.cfg"
-# config_gns = "PDXL-3850-01-test.cfg"
-
-def create_gns_config(config_full, config_gns):
-    with open(config_gns, 'w') as f:
-        f.write("! GENERATED BY B-TOWN\n\n")
-
-    with open(config_gns, 'a') as f:
-            parse = CiscoConfParse(config_full)
-            hostname = parse.find_lines("^hostname", exactmatch=False)
-            for x in hostname:
-                x = x
-                f.write(x)
-            f.write("\n!\n")
-            rtr_txt = parse.find_all_children("interface Loopback", exactmatch=False)
-            for x in rtr_txt:
-                x = x + "\n"
-                f.write(x)
-            f.write("!\n")
-            rtr_txt = parse.find_all_children("^router", exactmatch=False)
-            for x in rtr_txt:
-                if "bfd" not in x:
-                    print(x)
-                    x = x + "\n"
-                    f.write(x)
-            print("all done with router")
-            map_txt = parse.find_all_children("^route-map", exactmatch=False)
-            for x in map_txt:
-                x = x + "\n"
-                f.write(x)
-            f.write("!\n")
-            pfx_list = parse.find_lines("^ip prefix-list", exactmatch=False)
-            for x in pfx_list:
-                x = x + "\n"
-                f.write(x)
-            f.write("!\n")
-
-
-    # delete stuff not supported or needed
-'''
-    parse = CiscoConfParse(config_gns)
-    for obj in parse.find_objects("^interface"):
-        obj.delete_children_matching(r'bfd')
-    for obj in parse.find_objects("^router"):
-        print(obj)
-        obj.delete_children_matching(r'bfd')
-    for line in parse.ioscfg:
-        print(line)
-'''
-# uncomment this to test module directly
-# create_gns_config(config_full, config_gns)
+from configrules import DEFAULT_PLATFORM
+from configrules import load_rules
+from configrules import platform_rules
+from timing import profiler
+
+IP_ADDRESS = re.compile(r"^\s*ipv?6? address (\S+)")
+
+# ipv6 addresses can be written many ways, use the compressed lower case
+# form for the lookups
+
+def normal_ip(ip):
+    ip = str(ip).lower()
+    if ":" in ip:
+        try:
+            return ipaddress.IPv6Address(ip).compressed
+        except ValueError:
+            pass
+    return ip
+
+
+# a device config parsed once by ciscoconfparse. all the config generation
+# stages take this object so a config is never parsed twice. interfaces are
+# indexed by name and ip address while parsing so we can grab an interface
+# block without scanning the whole config again
+
+class ParsedConfig():
+
+    def __init__(self, config):
+        profiler.count("config_parses")
+        self.parse = CiscoConfParse(config)
+        self.intf_by_name = {}
+        self.intf_by_ip = {}
+        for obj in self.parse.find_objects("^interface"):
+            name = obj.text.split(None, 1)[1].strip()
+            self.intf_by_name[name] = obj
+            for child in obj.children:
+                match = IP_ADDRESS.match(child.text)
+                if match:
+                    ip = normal_ip(match.group(1).split("/")[0])
+                    self.intf_by_ip.setdefault(ip, []).append(obj)
+
+    # returns the interface objects that have the ip configured
+
+    def find_intfs(self, ip):
+        return self.intf_by_ip.get(normal_ip(ip), [])
+
+    # returns the interface names as they are written in the config
+
+    def find_intf_names(self, ip):
+        return [obj.text.split(None, 1)[1].strip()
+                for obj in self.find_intfs(ip)]
+
+
+# builds the gns config in memory and returns it as a list of strings,
+# config_full can be a ParsedConfig or the filename of a full config. the
+# sections that are kept come from the rules, see configrules.py
+
+def gns_config_lines(config_full, rules=None):
+    if not isinstance(config_full, ParsedConfig):
+        config_full = ParsedConfig(config_full)
+    if rules is None:
+        rules = platform_rules(load_rules(), DEFAULT_PLATFORM)
+
+    f = ["! GENERATED BY B-TOWN\n\n"]
+    for section in rules.extract(config_full.parse.ioscfg):
+        if section:
+            f.extend(section)
+            f.append("!\n")
+    return f
+
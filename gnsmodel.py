@@ -1,18 +1,32 @@
 
+from netindex import ip_to_int
+from netindex import ip_version
+from netindex import int_to_ip
+from netindex import key_to_string
+from netindex import mask_to_prefix
+from netindex import network_int
+
+
+# the model uses __slots__ and keeps addresses as integers, a 10k node
+# topology is a lot of interfaces and a dict per object adds up fast
+
 class Node():
 
-    def __init__(self, node):
-        self.node = node
-        self.intfs = []
+    __slots__ = ("name", "interfaces", "id", "dir", "startup", "config",
+                 "template")
+
+    def __init__(self, name, interfaces=None):
+        self.name = name
+        self.interfaces = interfaces or []
+        self.id = None
+        self.dir = None
+        self.startup = None
+        self.config = None
+        self.template = None
 
-    def add_intf(self, intf_mod):
-        mod, intfs = (self.intf_mod)
-        for x in range(intfs):
-            intf_name = "Ethernet" + str(mod) + "/" + str(x)
-            intf_obj = self.Interface(intf_name)
-            self.intfs.append(intf_obj)
-        return self.intfs
-        self.intfs = self.add_intf()
+    def add_intf(self, intf):
+        self.interfaces.append(intf)
+        return self.interfaces
 
     def add_id(self, node_id):
         self.id = node_id
@@ -24,25 +38,124 @@ class Node():
         self.config = str(config)
 
     def del_intf(self, ip):
-        self.intfs.pop(ip)
+        version = ip_version(ip)
+        ip = ip_to_int(ip)
+        self.interfaces = [x for x in self.interfaces
+                           if (x.ip, x.version) != (ip, version)]
 
     def add_dir(self, node_dir):
         self.dir = node_dir
 
+    def add_template(self, template_id):
+        self.template = template_id
+
+    def __repr__(self):
+        return "<Node {}>".format(self.name)
+
+
+# name is the interface name on the device, adapter, port and gns_name are
+# filled in when the interface gets a gns port. ip is the address we use to
+# find the interface in the config (ipv4 if it has one), other addresses
+# such as the ipv6 ones on a dual stack interface go in secondary as
+# (version, ip, prefix) tuples
+
 class Interface():
 
-    def __init__(self, adapter, port, node_id):
+    __slots__ = ("name", "ip", "prefix", "version", "secondary", "adapter",
+                 "port", "gns_name")
+
+    def __init__(self, name, ip, mask, version=None):
+        self.name = name
+        self.version = version or ip_version(ip)
+        self.ip = ip_to_int(ip)
+        self.prefix = mask_to_prefix(mask)
+        self.secondary = None
+        self.adapter = None
+        self.port = None
+        self.gns_name = None
+
+    def add_address(self, ip, mask, version=None):
+        if self.secondary is None:
+            self.secondary = []
+        self.secondary.append((version or ip_version(ip), ip_to_int(ip),
+                               mask_to_prefix(mask)))
+
+    @property
+    def network(self):
+        return network_int(self.ip, self.prefix, self.version)
+
+    # the subnet index key, (version, network, prefix)
+
+    @property
+    def key(self):
+        return (self.version, self.network, self.prefix)
+
+    # the keys of every address on the interface
+
+    @property
+    def keys(self):
+        keys = [self.key]
+        for version, ip, prefix in self.secondary or ():
+            keys.append((version, network_int(ip, prefix, version), prefix))
+        return keys
+
+    @property
+    def ip_string(self):
+        return int_to_ip(self.ip, self.version)
+
+    @property
+    def network_string(self):
+        return key_to_string(self.key)
+
+    def add_port(self, adapter, port, gns_name):
         self.adapter = adapter
         self.port = port
-        self.node_id = node_id
+        self.gns_name = gns_name
 
+    def __repr__(self):
+        return "<Interface {} {}/{}>".format(
+            self.name, self.ip_string, self.prefix)
 
-class Link():
 
-    def __init__(self, name, *args, **kwargs):
+# a gns3 ethernet switch for a network with more than two interfaces on it.
+# the name comes from the network so a sync finds the same switch again
+
+class Switch():
+
+    __slots__ = ("name", "ports", "id")
+
+    def __init__(self, name, ports=0):
         self.name = name
-        self.nodes = kwargs.get("routers")
-        self.interfaces = []
+        self.ports = ports
+        self.id = None
+
+    def add_id(self, node_id):
+        self.id = node_id
+
+    def __repr__(self):
+        return "<Switch {}>".format(self.name)
+
+
+def switch_name(key):
+    return "sw-" + key_to_string(key).replace("/", "-")
+
+
+# the links to create from the subnet index after pruning and port
+# assignment, each one a pair of (node, adapter, port) ends. a two
+# interface network is a single link, a bigger one gets a switch with a
+# link from every interface to its own switch port
 
-    def add_intf(self, interface):
-        self.interfaces.append(interface)
+def segment_links(subnet_index):
+    switches = []
+    links = []
+    for key in sorted(subnet_index):
+        ends = [(gns_node, i.adapter, i.port)
+                for gns_node, i in subnet_index[key]]
+        if len(ends) == 2:
+            links.append(ends)
+        elif len(ends) > 2:
+            switch = Switch(switch_name(key), len(ends))
+            switches.append(switch)
+            for port, end in enumerate(ends):
+                links.append([end, (switch, 0, port)])
+    return switches, links
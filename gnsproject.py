@@ -1,13 +1,245 @@
 #!/usr/bin/env python3
 
 import json
+import time
 import requests
 
-from gnsmodel import Node
-from gnsmodel import Link
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.exceptions import NewConnectionError
 
+from ports import switch_ports
+from timing import profiler
 
 
+'''
+Client for the GNS3 v2 REST API. All calls go through one pooled session
+with keep-alive, nodes and links are created concurrently by a pool of
+workers, and calls that fail with a 5xx or a connection error are retried
+with exponential backoff.
 
+Only idempotent calls are retried like that. A POST that creates a node or
+a link may have been done by the server before it failed, doing it again
+would create it twice, so a POST is only retried when it never got to the
+server (the connection couldn't be made).
+'''
 
-# Create a project based on random name and return id
+
+RETRY_STATUS = (500, 502, 503, 504)
+
+IDEMPOTENT = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+# true when the request failed before anything was sent
+
+def not_sent(error):
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class GnsClient():
+
+    # server is "ip:port". nodes are created with the gns3 2.2 template
+    # endpoint, which takes the node name in the create request. the older
+    # appliance endpoint doesn't so the node is renamed after. by default
+    # (use_templates None) the template endpoint is tried first and the
+    # appliance one used from then on when the server doesn't have it,
+    # True or False always uses one of them
+
+    def __init__(self, server, workers=8, retries=3, backoff=0.5,
+                 timeout=30, use_templates=None):
+        self.url = "http://" + server + "/v2"
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.use_templates = use_templates
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # idempotent is for a POST that is safe to send twice (start, open),
+    # by default only the idempotent methods are retried
+
+    def request(self, method, path, data=None, idempotent=None):
+        url = self.url + path
+        if data is not None:
+            data = json.dumps(data)
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            profiler.count("rest_calls")
+            profiler.count("rest_bytes_sent", len(data or ""))
+            try:
+                resp = self.session.request(
+                    method, url, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last or not (idempotent or not_sent(e)):
+                    raise
+            else:
+                profiler.count("rest_bytes_received", len(resp.content))
+                if (resp.status_code not in RETRY_STATUS or last or
+                        not idempotent):
+                    resp.raise_for_status()
+                    if resp.content:
+                        return resp.json()
+                    return None
+            time.sleep(self.backoff * 2 ** attempt)
+
+    # run func over items with the worker pool, results keep the item order
+
+    def run_all(self, func, items):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(func, items))
+
+    # create a project and return the id
+
+    def create_project(self, name):
+        return self.request("POST", "/projects", {"name": name})["project_id"]
+
+    def project_url(self, project_id):
+        return self.url + "/projects/" + project_id
+
+    # create one node from the appliance/template on a compute server and
+    # return the gns3 node data (node_id, name, node_directory ...)
+
+    def create_node(self, project_id, app_id, name, x=0, y=0,
+                    compute_id="local"):
+        prj_path = "/projects/" + project_id
+        node_data = {"compute_id": compute_id, "x": x, "y": y}
+        if self.use_templates is False:
+            return self.create_appliance_node(prj_path, app_id, name,
+                                              node_data)
+        try:
+            node = self.request("POST", prj_path + "/templates/" + app_id,
+                                dict(node_data, name=name))
+        except requests.HTTPError as e:
+            if (self.use_templates or
+                    e.response.status_code not in (404, 405)):
+                raise
+
+            # a 404 is also a template that doesn't exist, the endpoint is
+            # only given up on when the appliance one works
+
+            node = self.create_appliance_node(prj_path, app_id, name,
+                                              node_data)
+            self.use_templates = False
+            return node
+        self.use_templates = True
+        return node
+
+    # gns3 2.1, the name gns3 picks is changed when it isn't ours
+
+    def create_appliance_node(self, prj_path, app_id, name, node_data):
+        node = self.request("POST", prj_path + "/appliances/" + app_id,
+                            node_data)
+        if node["name"] != name:
+            node = self.request(
+                "PUT", prj_path + "/nodes/" + node["node_id"],
+                {"name": name})
+        return node
+
+    # puts a node somewhere else on the canvas
+
+    def move_node(self, project_id, node_id, x, y):
+        return self.request(
+            "PUT", "/projects/" + project_id + "/nodes/" + node_id,
+            {"x": x, "y": y})
+
+    # nodes is a list of {"name": .., "x": .., "y": ..} dicts, a node can
+    # set its own "app_id" and "compute_id"
+
+    def create_nodes(self, project_id, app_id, nodes):
+        return self.run_all(
+            lambda n: self.create_node(project_id, n.get("app_id", app_id),
+                                       n["name"], n.get("x", 0),
+                                       n.get("y", 0),
+                                       n.get("compute_id", "local")), nodes)
+
+    # a builtin ethernet switch with one access port per interface on the
+    # network, it doesn't need a template
+
+    def create_switch(self, project_id, name, ports, x=0, y=0,
+                      compute_id="local"):
+        node_data = {"name": name, "node_type": "ethernet_switch",
+                     "compute_id": compute_id, "x": x, "y": y,
+                     "properties": {"ports_mapping": switch_ports(ports)}}
+        return self.request(
+            "POST", "/projects/" + project_id + "/nodes", node_data)
+
+    # switches is a list of {"name": .., "ports": .., "x": .., "y": ..}
+    # dicts, with "compute_id" when it isn't the local one
+
+    def create_switches(self, project_id, switches):
+        return self.run_all(
+            lambda s: self.create_switch(project_id, s["name"], s["ports"],
+                                         s.get("x", 0), s.get("y", 0),
+                                         s.get("compute_id", "local")),
+            switches)
+
+    # the compute servers of the controller, with their capabilities (cpus,
+    # memory in bytes ...)
+
+    def get_computes(self):
+        return self.request("GET", "/computes")
+
+    # template (gns3 2.2) or appliance (2.1) data, used for the port layout
+
+    def get_template(self, app_id):
+        try:
+            return self.request("GET", "/templates/" + app_id)
+        except requests.HTTPError:
+            pass
+        for appliance in self.request("GET", "/appliances"):
+            if appliance.get("appliance_id") == app_id:
+                return appliance
+        raise ValueError("no template or appliance " + app_id)
+
+    # link_data is the gns3 link body {"nodes": [{"node_id", "adapter_number",
+    # "port_number"}, ...]}
+
+    def create_link(self, project_id, link_data):
+        return self.request(
+            "POST", "/projects/" + project_id + "/links", link_data)
+
+    def create_links(self, project_id, links):
+        return self.run_all(
+            lambda l: self.create_link(project_id, l), links)
+
+    def open_project(self, project_id):
+        return self.request("POST", "/projects/" + project_id + "/open",
+                            idempotent=True)
+
+    def get_nodes(self, project_id):
+        return self.request("GET", "/projects/" + project_id + "/nodes")
+
+    def get_links(self, project_id):
+        return self.request("GET", "/projects/" + project_id + "/links")
+
+    def delete_node(self, project_id, node_id):
+        return self.request(
+            "DELETE", "/projects/" + project_id + "/nodes/" + node_id)
+
+    def start_node(self, project_id, node_id):
+        return self.request(
+            "POST", "/projects/" + project_id + "/nodes/" + node_id +
+            "/start", {}, idempotent=True)
+
+    # the notification stream of a project, an open response with a json
+    # event per line. it has its own connection, it stays open as long as
+    # it is read
+
+    def notifications(self, project_id):
+        resp = requests.get(self.project_url(project_id) + "/notifications",
+                            stream=True, timeout=(self.timeout, None))
+        resp.raise_for_status()
+        return resp
+
+    def delete_link(self, project_id, link_id):
+        return self.request(
+            "DELETE", "/projects/" + project_id + "/links/" + link_id)
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+
+import itertools
+import json
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+'''
+A stand-in for the GNS3 v2 REST API, enough of it for netmodel to create a
+project, its nodes, switches and links without a real server. State is kept
+in memory, links are checked like gns3 does (both nodes exist, no port used
+twice) and latency adds a delay to every call so runs against the stub look
+more like runs against a real server. computes are the compute servers
+the stub pretends to have (compute id -> cpus and memory in bytes), a node
+created on one it doesn't have is refused like gns3 does, so a lab spread
+over several servers can be built against it:
+
+    StubServer(computes={"gns1": {"cpus": 16, "memory": 32 * 2 ** 30},
+                         "gns2": {"cpus": 8, "memory": 16 * 2 ** 30}})
+
+Started nodes take boot_time seconds to come up (a tenth more for every
+fifth node so they don't all finish together), then a node.updated with
+status started goes out on the project notification stream. The stream
+also sends a compute.updated for every compute each ping_interval, its
+cpu_usage_percent is boot_cpu per node booting plus idle_cpu per node
+running there. Every node's console is one telnet listener that answers
+with a prompt. drop_notifications ends the notification streams like a
+controller restart does.
+
+    python3 gnsstub.py 3080
+    python3 netmodel.py build --offline --gns-server 127.0.0.1:3080 \\
+        --no-upload
+
+or from python:
+
+    stub = StubServer()
+    stub.start()
+    ... GnsClient(stub.address) ...
+    stub.stop()
+
+Failures can be injected to see how a client copes with them, the next
+calls of a method on a path fail with a status, before the stub did
+anything or after (applied, a server that did the work and then failed):
+
+    stub.gns.inject("POST", r"/projects/[^/]+/links", 503, applied=True)
+'''
+
+
+# the template every node is created from unless others are given, an iou
+# router with 16 adapters of 4 ports
+
+DEFAULT_TEMPLATES = {
+    "55258fc4-42a7-4b1a-b0ca-6775f471d3cb": {
+        "template_id": "55258fc4-42a7-4b1a-b0ca-6775f471d3cb",
+        "template_type": "iou",
+        "name": "IOU L3",
+        "ethernet_adapters": 16,
+        "serial_adapters": 0,
+        "default_name_format": "IOU{0}",
+    },
+}
+
+
+DEFAULT_COMPUTES = {
+    "local": {"cpus": 8, "memory": 16 * 2 ** 30},
+}
+
+
+class HttpError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class StubGns():
+
+    def __init__(self, templates=None, computes=None, boot_time=0,
+                 boot_cpu=0, idle_cpu=0):
+        self.templates = templates or DEFAULT_TEMPLATES
+        self.computes = computes or DEFAULT_COMPUTES
+        self.boot_time = boot_time
+        self.boot_cpu = boot_cpu
+        self.idle_cpu = idle_cpu
+        self.projects = {}
+        self.lock = threading.Lock()
+        self.numbers = itertools.count(1)
+        self.calls = 0
+        self.connections = 0
+        self.faults = []
+        self.listeners = {}
+        self.boots = {}
+        self.booting = dict((x, 0) for x in self.computes)
+        self.running = dict((x, 0) for x in self.computes)
+        self.max_booting = 0
+        self.console_port = None
+        self.route_table = [(method, re.compile(pattern), func)
+                            for method, pattern, func in self.routes()]
+
+    def project(self, project_id):
+        if project_id not in self.projects:
+            raise HttpError(404, "project {} doesn't exist".format(project_id))
+        return self.projects[project_id]
+
+    def node(self, project, node_id):
+        if node_id not in project["nodes"]:
+            raise HttpError(404, "node {} doesn't exist".format(node_id))
+        return project["nodes"][node_id]
+
+    def template(self, template_id):
+        if template_id not in self.templates:
+            raise HttpError(404, "template {} doesn't exist".format(
+                template_id))
+        return self.templates[template_id]
+
+    def compute(self, compute_id):
+        if compute_id not in self.computes:
+            raise HttpError(404, "compute {} doesn't exist".format(
+                compute_id))
+        capabilities = dict(self.computes[compute_id])
+        capabilities.setdefault("node_types", ["ethernet_switch", "iou",
+                                               "qemu", "dynamips"])
+        return {"compute_id": compute_id, "name": compute_id,
+                "connected": True, "capabilities": capabilities,
+                "cpu_usage_percent": self.cpu_usage(compute_id),
+                "memory_usage_percent": self.computes[compute_id].get(
+                    "memory_usage_percent", 0)}
+
+    def cpu_usage(self, compute_id):
+        return min(100, self.booting[compute_id] * self.boot_cpu +
+                   self.running[compute_id] * self.idle_cpu)
+
+    # the notification stream of a project is a queue per listener
+
+    def listen(self, project_id):
+        events = queue.Queue()
+        with self.lock:
+            self.project(project_id)
+            self.listeners.setdefault(project_id, []).append(events)
+        return events
+
+    def unlisten(self, project_id, events):
+        with self.lock:
+            self.listeners[project_id].remove(events)
+
+    def emit(self, project_id, action, event):
+        for events in self.listeners.get(project_id, ()):
+            events.put({"action": action, "event": event})
+
+    # end every notification stream, like a controller that restarts
+
+    def drop_notifications(self):
+        with self.lock:
+            for listeners in self.listeners.values():
+                for events in listeners:
+                    events.put(None)
+
+    def compute_events(self):
+        with self.lock:
+            return [{"action": "compute.updated", "event": self.compute(x)}
+                    for x in self.computes]
+
+    def start_node(self, project_id, node_id):
+        node = self.node(self.project(project_id), node_id)
+        if node["status"] == "started" or node_id in self.boots:
+            return node
+        self.boots[node_id] = node["compute_id"]
+        self.booting[node["compute_id"]] += 1
+        self.max_booting = max(self.max_booting, sum(self.booting.values()))
+        delay = self.boot_time * (1 + (next(self.numbers) % 5) / 10)
+        timer = threading.Timer(delay, self.booted, (project_id, node_id))
+        timer.daemon = True
+        timer.start()
+        return node
+
+    def booted(self, project_id, node_id):
+        with self.lock:
+            self.booting[self.boots.pop(node_id)] -= 1
+            node = self.projects[project_id]["nodes"].get(node_id)
+            if node is None:
+                return
+            node["status"] = "started"
+            self.running[node["compute_id"]] += 1
+            self.emit(project_id, "node.updated", node)
+
+    def stop_node(self, project_id, node_id):
+        node = self.node(self.project(project_id), node_id)
+        if node["status"] == "started":
+            node["status"] = "stopped"
+            self.running[node["compute_id"]] -= 1
+            self.emit(project_id, "node.updated", node)
+        return node
+
+    def create_project(self, data):
+        project_id = str(uuid.uuid4())
+        self.projects[project_id] = {
+            "project_id": project_id, "name": data["name"],
+            "status": "opened", "nodes": {}, "links": {}, "ports": set()}
+        return {"project_id": project_id, "name": data["name"],
+                "status": "opened"}
+
+    def add_node(self, project_id, node_type, name, data, properties=None):
+        project = self.project(project_id)
+        compute_id = data.get("compute_id", "local")
+        self.compute(compute_id)
+        node_id = str(uuid.uuid4())
+        num = next(self.numbers)
+        properties = dict(properties or {})
+        if node_type == "iou":
+            properties["application_id"] = num
+        node = {
+            "node_id": node_id, "project_id": project_id,
+            "name": name or "node" + str(num), "node_type": node_type,
+            "compute_id": compute_id,
+            "x": data.get("x", 0), "y": data.get("y", 0),
+            "status": "stopped", "properties": properties,
+            "console": self.console_port, "console_host": "127.0.0.1",
+            "console_type": "telnet",
+            "node_directory": "/opt/gns3/projects/{}/project-files/{}/{}"
+                              .format(project_id, node_type, node_id),
+        }
+        project["nodes"][node_id] = node
+        return node
+
+    def create_from_template(self, project_id, template_id, data):
+        template = self.template(template_id)
+        node_type = template.get("template_type", template.get("node_type"))
+        name = data.get("name") or template.get(
+            "default_name_format", "node{0}").format(len(
+                self.project(project_id)["nodes"]) + 1)
+        return self.add_node(project_id, node_type, name, data)
+
+    def create_node(self, project_id, data):
+        return self.add_node(project_id, data["node_type"], data.get("name"),
+                             data, data.get("properties"))
+
+    def update_node(self, project_id, node_id, data):
+        node = self.node(self.project(project_id), node_id)
+        node.update((k, v) for k, v in data.items()
+                    if k in ("name", "x", "y"))
+        return node
+
+    def delete_node(self, project_id, node_id):
+        project = self.project(project_id)
+        self.node(project, node_id)
+        for link_id, link in list(project["links"].items()):
+            if any(x["node_id"] == node_id for x in link["nodes"]):
+                self.delete_link(project_id, link_id)
+        del project["nodes"][node_id]
+
+    def create_link(self, project_id, data):
+        project = self.project(project_id)
+        ports = []
+        for end in data["nodes"]:
+            self.node(project, end["node_id"])
+            port = (end["node_id"], end["adapter_number"], end["port_number"])
+            if port in project["ports"] or port in ports:
+                raise HttpError(409, "port {} is already used".format(port))
+            ports.append(port)
+        project["ports"].update(ports)
+        link_id = str(uuid.uuid4())
+        link = {"link_id": link_id, "project_id": project_id,
+                "nodes": data["nodes"]}
+        project["links"][link_id] = link
+        return link
+
+    def delete_link(self, project_id, link_id):
+        project = self.project(project_id)
+        if link_id not in project["links"]:
+            raise HttpError(404, "link {} doesn't exist".format(link_id))
+        link = project["links"].pop(link_id)
+        for end in link["nodes"]:
+            project["ports"].discard(
+                (end["node_id"], end["adapter_number"], end["port_number"]))
+
+    # method, path pattern and handler. handlers get the path groups and
+    # the json body
+
+    def routes(self):
+        return [
+            ("POST", r"/projects", lambda d: self.create_project(d)),
+            ("POST", r"/projects/([^/]+)/open",
+             lambda p, d: self.project(p) and None),
+            ("GET", r"/computes",
+             lambda d: [self.compute(x) for x in self.computes]),
+            ("GET", r"/computes/([^/]+)", lambda c, d: self.compute(c)),
+            ("GET", r"/templates/([^/]+)", lambda t, d: self.template(t)),
+            ("GET", r"/appliances",
+             lambda d: [dict(v, appliance_id=k)
+                        for k, v in self.templates.items()]),
+            ("POST", r"/projects/([^/]+)/templates/([^/]+)",
+             lambda p, t, d: self.create_from_template(p, t, d)),
+            ("POST", r"/projects/([^/]+)/appliances/([^/]+)",
+             lambda p, t, d: self.create_from_template(p, t, d)),
+            ("GET", r"/projects/([^/]+)/nodes",
+             lambda p, d: list(self.project(p)["nodes"].values())),
+            ("POST", r"/projects/([^/]+)/nodes",
+             lambda p, d: self.create_node(p, d)),
+            ("POST", r"/projects/([^/]+)/nodes/([^/]+)/start",
+             lambda p, n, d: self.start_node(p, n)),
+            ("POST", r"/projects/([^/]+)/nodes/([^/]+)/stop",
+             lambda p, n, d: self.stop_node(p, n)),
+            ("PUT", r"/projects/([^/]+)/nodes/([^/]+)",
+             lambda p, n, d: self.update_node(p, n, d)),
+            ("DELETE", r"/projects/([^/]+)/nodes/([^/]+)",
+             lambda p, n, d: self.delete_node(p, n)),
+            ("GET", r"/projects/([^/]+)/links",
+             lambda p, d: list(self.project(p)["links"].values())),
+            ("POST", r"/projects/([^/]+)/links",
+             lambda p, d: self.create_link(p, d)),
+            ("DELETE", r"/projects/([^/]+)/links/([^/]+)",
+             lambda p, l, d: self.delete_link(p, l)),
+        ]
+
+    # the next times calls of method on a path matching pattern fail with
+    # status, after they are done when applied
+
+    def inject(self, method, pattern, status=503, times=1, applied=False):
+        with self.lock:
+            self.faults.append([method, re.compile(pattern), status, times,
+                                applied])
+
+    def fault(self, method, path):
+        for fault in self.faults:
+            if fault[0] == method and fault[1].fullmatch(path):
+                fault[3] -= 1
+                if not fault[3]:
+                    self.faults.remove(fault)
+                return fault
+        return None
+
+    def handle(self, method, path, data):
+        with self.lock:
+            self.calls += 1
+            fault = self.fault(method, path)
+            if fault and not fault[4]:
+                raise HttpError(fault[2], "injected failure")
+            for route_method, pattern, func in self.route_table:
+                match = pattern.fullmatch(path)
+                if match and route_method == method:
+                    result = func(*match.groups(), data)
+                    if fault:
+                        raise HttpError(fault[2], "injected failure")
+                    return result
+        raise HttpError(404, "no route for {} {}".format(method, path))
+
+
+NOTIFICATIONS = re.compile(r"/projects/([^/]+)/notifications")
+
+
+def make_handler(gns, latency, ping_interval):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+
+        # headers and body go out in separate writes, without this every
+        # keep-alive call waits for a delayed ack
+
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with gns.lock:
+                gns.connections += 1
+
+        def respond(self, status, body):
+            payload = b""
+            if body is not None:
+                payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        # a json event per line, chunked like gns3 sends it, for as long as
+        # the client reads them
+
+        def notifications(self, project_id):
+            try:
+                events = gns.listen(project_id)
+            except HttpError as e:
+                self.respond(e.status, {"status": e.status,
+                                        "message": str(e)})
+                return
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            try:
+                while True:
+                    try:
+                        lines = [events.get(timeout=ping_interval)]
+                    except queue.Empty:
+                        lines = gns.compute_events()
+                    if lines == [None]:
+                        self.wfile.write(b"0\r\n\r\n")
+                        return
+                    payload = b"".join(json.dumps(x).encode() + b"\n"
+                                       for x in lines)
+                    self.wfile.write("{:x}\r\n".format(
+                        len(payload)).encode() + payload + b"\r\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                gns.unlisten(project_id, events)
+
+        def run(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            data = {}
+            if length:
+                data = json.loads(self.rfile.read(length))
+            path = self.path.split("?")[0]
+            if path.startswith("/v2"):
+                path = path[3:]
+            match = NOTIFICATIONS.fullmatch(path)
+            if match and self.command == "GET":
+                self.notifications(match.group(1))
+                return
+            if latency:
+                time.sleep(latency)
+            try:
+                body = gns.handle(self.command, path, data)
+            except HttpError as e:
+                self.respond(e.status, {"status": e.status,
+                                        "message": str(e)})
+                return
+            status = 201 if self.command == "POST" else 200
+            if self.command == "DELETE":
+                status = 204
+            self.respond(status, body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = run
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# the node consoles: telnet option offers like an iou console, then a
+# prompt for every line the client sends
+
+class ConsoleHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            self.request.sendall(b"\xff\xfb\x01\xff\xfb\x03\r\n")
+            while True:
+                data = self.request.recv(1024)
+                if not data:
+                    return
+                if b"\r" in data or b"\n" in data:
+                    self.request.sendall(b"\r\nRouter>")
+        except OSError:
+            pass
+
+
+class StubServer():
+
+    def __init__(self, templates=None, latency=0, port=0, computes=None,
+                 boot_time=0, boot_cpu=0, idle_cpu=0, ping_interval=1):
+        self.gns = StubGns(templates, computes, boot_time, boot_cpu,
+                           idle_cpu)
+        self.httpd = ThreadingHTTPServer(
+            ("127.0.0.1", port),
+            make_handler(self.gns, latency, ping_interval))
+        self.httpd.daemon_threads = True
+        self.console = socketserver.ThreadingTCPServer(("127.0.0.1", 0),
+                                                       ConsoleHandler)
+        self.console.daemon_threads = True
+        self.gns.console_port = self.console.server_address[1]
+        self.thread = None
+
+    @property
+    def address(self):
+        return "127.0.0.1:" + str(self.httpd.server_address[1])
+
+    # a short poll so stop doesn't wait half a second for each server
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       args=(0.05,), daemon=True)
+        self.thread.start()
+        threading.Thread(target=self.console.serve_forever, args=(0.05,),
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.console.shutdown()
+        self.console.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 3080
+    server = StubServer(port=port)
+    print("Stub gns3 server on", server.address)
+    threading.Thread(target=server.console.serve_forever,
+                     daemon=True).start()
+    server.httpd.serve_forever()
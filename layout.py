@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import math
+import random
+
+
+'''
+Places the nodes on the gns3 canvas before they are created. Two layouts:
+
+force       a force-directed (Fruchterman-Reingold) layout in numpy. Nodes
+            repel each other and links pull them together. Repulsion is
+            computed against the centre of mass of grid cells instead of
+            every other node (a one level Barnes-Hut approximation), which
+            keeps 5k nodes down to a few seconds.
+hierarchy   rows by tier, driven by the nornir groups in hosts.yaml, e.g.
+            core on top, then distribution, then access. Each row is
+            ordered by where its neighbours in the row above sit.
+
+Both return a dict of node name -> (x, y) in canvas pixels.
+'''
+
+
+# the graph to lay out: one edge per pair of nodes with a link between
+# them. links are the (node, adapter, port) pairs from segment_links, so a
+# multi-access network is a star around its switch
+
+def link_edges(links):
+    edges = set()
+    for (a, _, _), (b, _, _) in links:
+        if a.name != b.name:
+            edges.add(tuple(sorted((a.name, b.name))))
+    return sorted(edges)
+
+
+def force_layout(names, edges, iterations=60, spacing=120, seed=1):
+    import numpy as np
+
+    n = len(names)
+    if n == 0:
+        return {}
+    size = spacing * math.sqrt(n)
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2)) * size
+    index = dict((name, x) for x, name in enumerate(names))
+    if edges:
+        edge = np.array([(index[a], index[b]) for a, b in edges])
+    else:
+        edge = np.zeros((0, 2), dtype=int)
+
+    k = size / math.sqrt(n)
+    temp = size / 10
+    grid = max(1, int(round(2 * n ** 0.25)))
+    rows = np.arange(n)
+
+    for _ in range(iterations):
+
+        # bin the nodes into grid cells and get each cell's mass and
+        # centre of mass
+
+        low = pos.min(axis=0)
+        span = np.maximum(pos.max(axis=0) - low, 1e-9)
+        cell_xy = np.minimum((pos - low) / span * grid, grid - 1).astype(int)
+        cell = cell_xy[:, 0] * grid + cell_xy[:, 1]
+        cells, own = np.unique(cell, return_inverse=True)
+        mass = np.bincount(own).astype(float)
+        sums = np.stack([np.bincount(own, weights=pos[:, 0]),
+                         np.bincount(own, weights=pos[:, 1])], axis=1)
+        centre = sums / mass[:, None]
+
+        # repulsion from every cell. in its own cell a node is pushed by the
+        # other nodes of that cell, so take itself out of the centre
+
+        dx = pos[:, 0, None] - centre[None, :, 0]
+        dy = pos[:, 1, None] - centre[None, :, 1]
+        weight = np.broadcast_to(mass, (n, len(cells))).copy()
+        own_mass = mass[own] - 1
+        own_delta = pos - (sums[own] - pos) / np.maximum(own_mass, 1)[:, None]
+        dx[rows, own] = own_delta[:, 0]
+        dy[rows, own] = own_delta[:, 1]
+        weight[rows, own] = own_mass
+        force = k * k * weight / (dx * dx + dy * dy + 1e-2)
+        disp = np.stack([(dx * force).sum(axis=1),
+                         (dy * force).sum(axis=1)], axis=1)
+
+        # attraction along the links
+
+        if len(edge):
+            diff = pos[edge[:, 0]] - pos[edge[:, 1]]
+            dist = np.sqrt((diff ** 2).sum(axis=1)) + 1e-9
+            pull = diff * (dist / k)[:, None]
+            np.add.at(disp, edge[:, 0], -pull)
+            np.add.at(disp, edge[:, 1], pull)
+
+        length = np.sqrt((disp ** 2).sum(axis=1)) + 1e-9
+        pos += disp / length[:, None] * np.minimum(length, temp)[:, None]
+        temp *= 0.95
+
+    pos -= pos.mean(axis=0)
+    return dict((name, (int(x), int(y))) for name, (x, y) in zip(names, pos))
+
+
+# the tier of every node from its groups, nodes in none of the tiers go in
+# a last row of their own
+
+def node_tiers(names, groups, tiers):
+    result = {}
+    for name in names:
+        result[name] = len(tiers)
+        for num, tier in enumerate(tiers):
+            if tier in groups.get(name, []):
+                result[name] = num
+                break
+    return result
+
+
+# a tier with more than row_size nodes is wrapped onto several rows
+
+def hierarchy_layout(names, edges, groups, tiers, spacing=120,
+                     row_spacing=250, row_size=50):
+    tier_of = node_tiers(names, groups, tiers)
+    neighbours = dict((name, []) for name in names)
+    for a, b in edges:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    rows = [[] for _ in range(len(tiers) + 1)]
+    for name in names:
+        rows[tier_of[name]].append(name)
+    rows = [x for x in rows if x]
+
+    # order each row by the average position of its neighbours in the rows
+    # already placed, that keeps links from crossing all over the canvas.
+    # slot is where a node sits in its tier, 0 on the left to 1 on the right
+
+    slot = {}
+    positions = {}
+    y = 0
+    for row in rows:
+        def barycenter(name):
+            placed = [slot[x] for x in neighbours[name] if x in slot]
+            if not placed:
+                return float("inf")
+            return sum(placed) / len(placed)
+        row.sort(key=barycenter)
+        width = (min(len(row), row_size) - 1) * spacing
+        for x, name in enumerate(row):
+            slot[name] = x / len(row)
+            positions[name] = (int((x % row_size) * spacing - width / 2),
+                               y + (x // row_size) * row_spacing // 2)
+        y += ((len(row) - 1) // row_size + 2) * row_spacing // 2
+    return positions
+
+
+def random_layout(names, spacing=120, seed=None):
+    rnd = random.Random(seed)
+    size = int(spacing * math.sqrt(max(len(names), 1)))
+    return dict((name, (rnd.randint(0, size), rnd.randint(0, size)))
+                for name in names)
+
+
+# groups per host from a nornir hosts.yaml file
+
+def load_groups(filename):
+    import yaml
+    with open(filename) as f:
+        hosts = yaml.safe_load(f) or {}
+    return dict((name, data.get("groups") or [])
+                for name, data in hosts.items())
@@ -9,4 +9,3 @@ import pprint
 from ciscoconfparse import CiscoConfParse
 
 from gnsmodel import Node
-from gnsmodel import Link
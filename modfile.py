@@ -1,16 +1,102 @@
 #!/usr/bin/env python3
 
-import fileinput
 import re
 
 
-def mod_intf(filename, intfs):
+'''
+Interface rename engine. All the old -> new interface names of a node are
+compiled into one regex and the config is rewritten in a single pass, so
+renames can't chain into each other (Ethernet1/1 -> Ethernet1/0 ->
+Ethernet1/1) and Ethernet1/1 doesn't match inside Ethernet1/10 or
+Ethernet1/1/1. Each old name also matches the abbreviations IOS accepts,
+e.g. GigabitEthernet1/0/1 matches Gi1/0/1 and Gig1/0/1.
+'''
+
+
+# full interface type and the short forms we see in ios configs
+
+IOS_ABBREVIATIONS = {
+    "Ethernet": ["Et", "Eth"],
+    "FastEthernet": ["Fa"],
+    "GigabitEthernet": ["Gi", "Gig"],
+    "TwoGigabitEthernet": ["Tw"],
+    "TenGigabitEthernet": ["Te", "Ten"],
+    "TwentyFiveGigE": ["Twe"],
+    "FortyGigabitEthernet": ["Fo"],
+    "HundredGigE": ["Hu"],
+    "AppGigabitEthernet": ["Ap"],
+    "Port-channel": ["Po"],
+    "Serial": ["Se"],
+    "Tunnel": ["Tu"],
+    "Vlan": ["Vl"],
+    "Loopback": ["Lo"],
+}
+
+INTF_NAME = re.compile(r"^([A-Za-z-]+)\s*(\d\S*)$")
+
+
+# the full type for a full or abbreviated type, e.g. "gi" -> GigabitEthernet
+
+def full_intf_type(intf_type):
+    for full, short in IOS_ABBREVIATIONS.items():
+        if intf_type.lower() in [x.lower() for x in [full] + short]:
+            return full
+    return intf_type
+
+
+# every spelling of an interface name we want to replace
+
+def intf_aliases(name):
+    match = INTF_NAME.match(name.strip())
+    if not match:
+        return [name]
+    intf_type, intf_num = match.groups()
+    full = full_intf_type(intf_type)
+    aliases = [name, full + intf_num]
+    for short in IOS_ABBREVIATIONS.get(full, []):
+        aliases.append(short + intf_num)
+    return aliases
 
-    with fileinput.FileInput(filename, inplace=True, backup='.bak') as file:
-        for line in file:
-                line = re.sub(intfs[0], intfs[1], line.rstrip())
-                print(line)
 
+class Renamer():
 
-for intfs in mod_list:
-    mod_intf(filename, intfs)
+    def __init__(self, renames):
+        self.lookup = {}
+        for old, new in renames.items():
+            for alias in intf_aliases(old):
+                self.lookup[alias.lower()] = new
+
+        # longest names first so the alternation prefers the full match, the
+        # lookarounds stop partial matches. a trailing "." is allowed so
+        # subinterfaces are renamed with their parent
+
+        alts = sorted(self.lookup, key=len, reverse=True)
+        self.regex = None
+        if alts:
+            self.regex = re.compile(
+                r"(?<![\w/.:-])(" + "|".join(re.escape(x) for x in alts) +
+                r")(?![\w/:])", re.IGNORECASE)
+
+    def sub(self, text):
+        if self.regex is None:
+            return text
+        return self.regex.sub(
+            lambda m: self.lookup[m.group(1).lower()], text)
+
+
+# renames is a dict of old -> new interface names
+
+def rename_intfs(text, renames):
+    return Renamer(renames).sub(text)
+
+
+# rewrite a config file in place. intfs is an (old, new) tuple or a dict of
+# old -> new names
+
+def mod_intf(filename, intfs):
+    if isinstance(intfs, tuple):
+        intfs = dict([intfs])
+    with open(filename) as f:
+        text = f.read()
+    with open(filename, 'w') as f:
+        f.write(rename_intfs(text, intfs))
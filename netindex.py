@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import socket
+import struct
+
+
+'''
+The subnet index maps every network found on the node interfaces to the
+nodes and interfaces attached to it. It is built in one pass over the
+interface data and keyed by a normalized (version, network, prefix) integer
+tuple, so create_netmap and segment_links can look up a network instead of
+looping through every node and interface for every network. ipv4 and ipv6
+networks live in the same index, the version keeps them apart.
+
+Example of what is being created:
+{(4, 167837952, 30): [(<Node r1>, <Interface e1 10.1.1.1/30>),
+                      (<Node r2>, <Interface e1 10.1.1.2/30>)]}
+'''
+
+
+BITS = {4: 32, 6: 128}
+
+
+# napalm gives us prefix lengths but the mask can also be a dotted string
+# like "255.255.255.252", so normalize both to a prefix length
+
+def mask_to_prefix(mask):
+    if isinstance(mask, int):
+        return mask
+    mask = str(mask)
+    if "." not in mask:
+        return int(mask)
+    return bin(struct.unpack("!I", socket.inet_aton(mask))[0]).count("1")
+
+
+def ip_version(ip):
+    return 6 if ":" in str(ip) else 4
+
+
+def ip_to_int(ip):
+    if isinstance(ip, int):
+        return ip
+    ip = str(ip)
+    if ":" in ip:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(ip, version=4):
+    if version == 6:
+        return socket.inet_ntop(socket.AF_INET6, ip.to_bytes(16, "big"))
+    return socket.inet_ntoa(struct.pack("!I", ip))
+
+
+def network_int(ip, prefix, version=4):
+    bits = BITS[version]
+    return ip & ~((1 << (bits - prefix)) - 1) & ((1 << bits) - 1)
+
+
+# fe80::/10, every ipv6 interface has one and they all look the same
+# network, so they can't tell us which interfaces share a segment
+
+def is_link_local(ip, version):
+    return version == 6 and ip >> 118 == 0x3FA
+
+
+# takes ip and mask and returns the (version, network, prefix) key, the
+# integer form of a cidr-notated network string (e.g. "10.1.1.0/24")
+
+def net_key(ip, mask, version=None):
+    version = version or ip_version(ip)
+    prefix = mask_to_prefix(mask)
+    return (version, network_int(ip_to_int(ip), prefix, version), prefix)
+
+
+# convert a cidr-notated network string (e.g. "10.1.1.0/30") to a key and
+# back again
+
+def string_to_key(network):
+    ip, prefix = str(network).split("/")
+    return net_key(ip, prefix)
+
+
+def key_to_string(key):
+    version, network, prefix = key
+    return int_to_ip(network, version) + "/" + str(prefix)
+
+
+# decides which networks we model. skip_prefixes is a dict of ip version ->
+# prefix lengths to leave out, e.g. {4: [24, 32], 6: [128]}, and
+# skip_networks a list of networks whose subnets are left out, e.g. the
+# management range
+
+class PrefixFilter():
+
+    def __init__(self, skip_prefixes=None, skip_networks=()):
+        self.skip_prefixes = dict((int(k), set(v)) for k, v
+                                  in (skip_prefixes or {}).items())
+        self.skip_networks = [string_to_key(x) for x in skip_networks]
+
+    def __call__(self, key):
+        version, network, prefix = key
+        if prefix in self.skip_prefixes.get(version, ()):
+            return False
+        for skip_version, skip_network, skip_prefix in self.skip_networks:
+            if (skip_version == version and prefix >= skip_prefix and
+                    network_int(network, skip_prefix, version) ==
+                    skip_network):
+                return False
+        return True
+
+
+# one pass over all the addresses of all the nodes. the attached list keeps
+# the gns_node_list and interface order so the results match the nested loops
+
+def build_subnet_index(gns_node_list):
+    index = {}
+    for gns_node in gns_node_list:
+        for intf in gns_node.interfaces:
+            for key in intf.keys:
+                index.setdefault(key, []).append((gns_node, intf))
+    return index
+
+
+# an interface with both an ipv4 and an ipv6 address is on two networks that
+# are really one segment, and a port can only be on one link. networks that
+# share an interface are merged into the first one in the netlist order,
+# which has ipv4 before ipv6. returns the netlist without the merged ones
+
+def merge_segments(index, netlist):
+    keys = sorted(string_to_key(x) for x in netlist)
+    parent = dict((key, key) for key in keys)
+
+    def root(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    owner = {}
+    for key in keys:
+        for gns_node, intf in index.get(key, []):
+            first = root(owner.setdefault(id(intf), key))
+            if first != root(key):
+                parent[max(first, root(key))] = min(first, root(key))
+
+    merged = {}
+    seen = {}
+    for key in keys:
+        top = root(key)
+        attached = merged.setdefault(top, [])
+        ids = seen.setdefault(top, set())
+        for gns_node, intf in index.pop(key, []):
+            if id(intf) not in ids:
+                ids.add(id(intf))
+                attached.append((gns_node, intf))
+    index.update(merged)
+    return [key_to_string(x) for x in sorted(merged)]
+
+
+# drop every network we are not modeling, the interfaces on those networks
+# are pruned from the nodes as well
+
+def prune_subnet_index(index, subnets):
+    keep = set(string_to_key(x) for x in subnets)
+    for key in list(index):
+        if key not in keep:
+            del index[key]
+    return index
+
+
+# creates a list of networks with list of node objects attached to each
+
+def map_networks(netlist, index):
+    netmap = []
+    for id, network in enumerate(netlist, 1):
+        net_obj = {}
+        net_obj["name"] = network
+        net_obj["nodes"] = [
+            gns_node for gns_node, intf
+            in index.get(string_to_key(network), [])
+            ]
+        net_obj["id"] = id
+        netmap.append(net_obj)
+    return netmap
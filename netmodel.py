@@ -1,24 +1,35 @@
 #!/usr/bin/env python3
 
-import ipaddress
-import json
-import requests
+import argparse
+import os
 import random
-import re
-import fileinput
-import paramiko
-
-from nornir.core import InitNornir
-from nornir.plugins.tasks.networking import netmiko_send_command
-from nornir.plugins.functions.text import print_result
-from nornir.plugins.tasks.networking import napalm_get
-from napalm import get_network_driver
-from ciscoconfparse import CiscoConfParse
+import sys
+import time
 
 from gnsmodel import Node
-from gnsmodel import Link
 from gnsmodel import Interface
-from gnsconfig import create_gns_config
+from gnsmodel import segment_links
+from netindex import build_subnet_index
+from netindex import prune_subnet_index
+from netindex import map_networks
+from netindex import merge_segments
+from netindex import key_to_string
+from netindex import string_to_key
+from netindex import ip_to_int
+from netindex import ip_version
+from netindex import is_link_local
+from netindex import PrefixFilter
+from ports import PortAllocator
+from ports import template_layout
+from collect import Collector
+from collect import nornir_hosts
+from cache import DiscoveryCache
+from sync import plan_sync
+from sync import print_plan
+from sync import apply_deletes
+from sync import desired_links
+from sync import link_string
+from timing import profiler
 
 
 '''
@@ -36,39 +47,125 @@ gns3 topology:
 6. Get the configs for the interfaces left on the nodes
 7. Create starup configs for the nodes
 8. Create the gns tpology
-'''
-
-
-# initialize nornir, and other variables
-
-nr = InitNornir()
-node_list = []
-gns_node_list = []
-network = {"networks": []}
-
-# get all the interface data and store it in the intfs variable
-
-router_get = nr.run(task=napalm_get, getters=["config", "interfaces_ip"])
-router_get = router_get.items()
-
-# gns server, project id, appliance id, random project name
-
-gns_ip = "172.28.88.11:3080"
-p_id = ""
-app_id = "55258fc4-42a7-4b1a-b0ca-6775f471d3cb"
-r = str(random.randint(100, 999))
-prj_name = "netmodel" + r
 
+The steps are split into subcommands:
+    netmodel.py discover    log into the devices and fill the cache
+    netmodel.py plan        build the model and show what would be created
+    netmodel.py slice       show the hosts of a slice of the network
+    netmodel.py build       build the model and the gns3 project, --resume
+                            picks up a failed build at a stage, --boot
+                            starts the nodes after
+    netmodel.py upload      upload generated configs to an existing project
+    netmodel.py boot        start the nodes of a project in waves
+    netmodel.py export      write a .gns3project file to import instead
+    netmodel.py invalidate  forget built configs so they are rebuilt
+
+nornir, napalm, requests, paramiko and ciscoconfparse are only imported by
+the subcommands that need them so the cli and offline planning start fast.
+'''
 
-# create the gns3 project
 
-def create_project():
-    p_data = {"name": prj_name}
-    p_data = json.dumps(p_data)
-    p_url = "http://" + gns_ip + "/v2/projects"
-    p_create = requests.post(p_url, data=p_data)
-    p_id = json.loads(p_create.text)['project_id']
-    return p_id
+# settings and their defaults. they can be set in a yaml file (--config,
+# netmodel.yaml by default) and flags override the file.
+#
+# gns_server, appliance id and credentials for the gns3 server.
+# gns_workers is how many nodes and links we create at the same time.
+# nodes get their name when created from a gns3 2.2 template, a server
+# without the template endpoint gets the 2.1 appliance one, gns_templates
+# true or false always uses one of them. collect_workers and the timeouts
+# control how many devices we log into at the same time and how long we
+# wait for each one, failed hosts are written to failure_report.
+# templates lists the template ids a node can be created from (app_id when
+# empty), each node gets the smallest one with enough ports starting at
+# first_adapter. layout is how nodes are placed on the canvas: force,
+# hierarchy (rows by the layout_tiers groups of each host in
+# inventory_hosts) or random. skip_prefixes (ip version ->
+# prefix lengths) and skip_networks (cidr list) are the networks we don't
+# model. profile times every stage and writes profile_report, profile_stage
+# runs cProfile on one stage. config_workers is how many processes
+# generate the configs, 0 is one per cpu. the gns configs are written to
+# output_dir, debug_configs also keeps the running config and the result of
+# every config stage in output_dir/debug. config_rules is a yaml file with
+# the sections of the running config to keep per platform, see configrules.py.
+# build snapshots its model after every stage in snapshot_dir (empty turns
+# it off) and resume restarts a build at one of the BUILD_STAGES. pipeline
+# overlaps the stages of a build per device, stage_workers sets how many
+# tasks of each of its stages run at the same time, see pipeline.py.
+# build_cache keeps the built configs in cache_dir/builds, a device whose
+# config, interfaces, ports and rules are unchanged isn't built or uploaded
+# again. build_cache_max_mb is its size before old devices are evicted.
+# computes spreads the nodes over several gns3 compute servers, a list of
+# {"compute_id": .., "ram_mb": .., "cpus": ..} (the capacity is read from
+# the server when left out), see partition.py. empty puts every node on
+# the local compute. boot starts the nodes after a build, boot_wave at a
+# time with at most boot_workers booting together, holding back nodes on a
+# compute above boot_max_cpu or boot_max_memory percent. a node is up when
+# gns3 says it has started, with boot_console when its console shows
+# boot_prompt, boot_timeout is how long it gets. boot times go to
+# boot_report, see boot.py. slice models part of the network: the hosts
+# in slice and their neighbours within slice_hops, the hosts on a shortest
+# path between the two hosts of slice_path and the hosts in the
+# slice_groups of inventory_hosts. with the topology of an earlier build
+# only the slice is discovered, see topology.py
+
+DEFAULTS = {
+    "gns_server": "172.28.88.11:3080",
+    "app_id": "55258fc4-42a7-4b1a-b0ca-6775f471d3cb",
+    "project_id": "",
+    "project_name": "",
+    "gns_workers": 8,
+    "gns_templates": None,
+    "ssh_user": "gns3",
+    "ssh_pass": "gns3",
+    "sftp_channels": 4,
+    "collect_workers": 20,
+    "connect_timeout": 10,
+    "command_timeout": 60,
+    "failure_report": "failures.json",
+    "cache_dir": ".netmodel-cache",
+    "cache_ttl": 3600,
+    "cache_max_mb": 100,
+    "refresh": "",
+    "offline": False,
+    "plan_only": False,
+    "no_upload": False,
+    "templates": [],
+    "template_layouts": {},
+    "first_adapter": 1,
+    "layout": "force",
+    "layout_tiers": ["core", "distribution", "access"],
+    "layout_spacing": 120,
+    "inventory_hosts": "hosts.yaml",
+    "skip_prefixes": {4: [24, 32], 6: [128]},
+    "skip_networks": [],
+    "config_workers": 0,
+    "output_dir": "configs",
+    "debug_configs": False,
+    "config_rules": "",
+    "snapshot_dir": ".netmodel-snapshots",
+    "resume": "",
+    "pipeline": False,
+    "build_cache": True,
+    "build_cache_max_mb": 50,
+    "stage_workers": {},
+    "computes": [],
+    "boot": False,
+    "boot_wave": 20,
+    "boot_workers": 8,
+    "boot_max_cpu": 80,
+    "boot_max_memory": 90,
+    "boot_timeout": 600,
+    "boot_console": False,
+    "boot_prompt": r"[>#]\s*$",
+    "boot_report": "boot.json",
+    "slice": [],
+    "slice_hops": 1,
+    "slice_path": [],
+    "slice_groups": [],
+    "profile": False,
+    "profile_stage": "",
+    "profile_report": "profile.json",
+}
 
 
 # create_node_list and create_interface_list are creating the data model
@@ -76,47 +173,33 @@ def create_project():
 
 '''
 Example of what is being created:
-[{"name":"r1","interfaces":[{"int":"e1","ip":"192.168.12.1",
-      "mask":"255.255.255.0"},{"int":"e2","ip":"192.168.13.1",
-      "mask":"255.255.255.0"}]},
-{"name":"r2","interfaces":[{"int":"e1","ip":"192.168.12.2",
-      "mask":"255.255.255.0"},{"int":"e2","ip":"192.168.23.2",
-      "mask":"255.255.255.0"}]}]
+[<Node r1 interfaces=[<Interface e1 192.168.12.1/24>,
+                      <Interface e2 192.168.13.1/24>]>,
+ <Node r2 interfaces=[<Interface e1 192.168.12.2/24>,
+                      <Interface e2 192.168.23.2/24>]>]
 '''
 
 
 def create_node_list(router_get):
-    for x in router_get:
-
-        # clear out the router list, we create a new router dictionary
-        # everytime through.
-
-        node = {}
-        node["name"] = x[0]
-
-        intf_result = x[1][0].result["interfaces_ip"]
-        node["interfaces"] = create_interface_list(intf_result)
-
-        # create network list for the router similar to interface list but
-        # just networks, this is for network comparison when we add routers
-        # to the link list
-
-        node["networks"] = []
-        for intf in node["interfaces"]:
-            net_obj = str(ipaddress.IPv4Network(
-                str(intf["ip"]) + "/" + str(intf["mask"]), strict=False))
-            node["networks"].append(net_obj)
+    node_list = []
+    for name, result in router_get.items():
+        node_list.append(create_node(name, result))
+    return node_list
 
-        # this node list is only used for creating the netmap.
 
-        node_list.append(node)
+# creates the node for one router from its getter results
 
-    return node_list
+def create_node(name, result):
+    intf_result = result["interfaces_ip"]
+    return Node(name, create_interface_list(intf_result))
 
 
 def create_interface_list(intf_result):
 
-    # loop through the ip interfaces and add only the ones with ipv4 addresses
+    # loop through the ip interfaces and add the ones with ipv4 or global
+    # ipv6 addresses. the last ipv4 address is the one we look the interface
+    # up by, ipv6 addresses are added to it. link-local addresses are
+    # skipped, every link has the same fe80::/64 so they tell us nothing
     # there is lots of unpacking here so use print to find out what you have
 
     # k = interface names, v = ipv4 or ipv6 dict
@@ -125,46 +208,36 @@ def create_interface_list(intf_result):
 
     intf_list = []
     for k, v in intf_result.items():
+        addresses = []
         for y, z in v.items():
-            intf_obj = {}
-            if "ipv4" in y:
-                intf_obj["intf"] = k
+            if "ipv4" in y and z:
+                for a, b in z.items():
+                    ip = a
+                    mask = b["prefix_length"]
+                addresses.insert(0, (ip, mask))
+            elif "ipv6" in y and z:
                 for a, b in z.items():
-                    intf_obj["ip"] = a
-                    intf_obj["mask"] = b["prefix_length"]
-                intf_list.append(intf_obj)
+                    if not is_link_local(ip_to_int(a), ip_version(a)):
+                        addresses.append((a, b["prefix_length"]))
+        if addresses:
+            intf = Interface(k, *addresses[0])
+            for ip, mask in addresses[1:]:
+                intf.add_address(ip, mask)
+            intf_list.append(intf)
 
     return intf_list
 
 
 # creates a list of networks with list of node objects attached to each
 
-def create_netmap(netlist, node_list, gns_node_list):
-
-    # initiliaze some variables we need to append to or increment
-
-    id = 0
-    netmap = []
-
-    # loop through each network and each node, when the a network on the node
-    # list matches the network we are looping thourgh, add the node to the
-    # network node list
-
-    for network in netlist:
+def create_netmap(netlist, subnet_index):
 
-        # id is used for our identification if we want to delete links
+    # look up the nodes attached to each network in the subnet index, the
+    # index is built once from the interfaces so this is a single pass over
+    # the netlist. the id is used for our identification if we want to
+    # delete links
 
-        id += 1
-        net_obj = {}
-        net_obj["name"] = network
-        net_obj["nodes"] = []
-        net_obj["id"] = id
-
-        for gns_node in gns_node_list:
-            for net in gns_node.node["networks"]:
-                if network == net:
-                    net_obj["nodes"].append(gns_node)
-        netmap.append(net_obj)
+    netmap = map_networks(netlist, subnet_index)
 
     # remove networks that have only 1 router, we don't model These
 
@@ -176,11 +249,12 @@ def create_netmap(netlist, node_list, gns_node_list):
     for index, value in enumerate(netmap, 1):
         print("{}. Network {} connects nodes: ".format(
             value["id"], value["name"]), end="")
-        [print(node.node["name"], end=" ") for node in value["nodes"]]
+        [print(node.name, end=" ") for node in value["nodes"]]
         print(" ")
 
     # prompt user to delete any links they don't want modeled and delete the
-    # ones they list. toggle it by manually setting q1 to not "y"
+    # ones they list. toggle it by manually setting q1 to not "y". to model
+    # only part of the network use a slice, see slice_model
 
     # q1 = input("Would you like to delete any links? [y/n]")
     q1 = "n"
@@ -194,294 +268,1268 @@ def create_netmap(netlist, node_list, gns_node_list):
     for index, value in enumerate(netmap, 1):
         print("{}. Network {} connects nodes: ".format(
             value["id"], value["name"]), end="")
-        [print(node.node["name"], end=" ") for node in value["nodes"]]
+        [print(node.name, end=" ") for node in value["nodes"]]
         print(" ")
 
     return netmap
 
 
-# This is called from create_netmap to retrieve list of all p2p networks. I am
-# pruning /24 and /32 for now but that may change
+# This is called from create_netmap to retrieve list of all networks.
+# prefix_filter decides which ones we model, by default /24 and /32 (and
+# ipv6 /128) are pruned. ipv4 networks sort before ipv6
 
-def create_netlist(node_list):
+def create_netlist(node_list, prefix_filter):
     print("Creating the netlist...")
 
-    netlist_init = []
+    netlist_init = set()
     for n in node_list:
-        rnets = []
-        for int in n["interfaces"]:
-            if int["mask"] == 24 or int["mask"] == 32:
-                continue
-            else:
-                ip = (int["ip"], int["mask"])
-                net = str(ipaddress.IPv4Network(ip, strict=False))
-                rnets.append(net)
-                netlist_init.append(net)
-        n["networks"] = rnets
-    return netlist_init
+        for int in n.interfaces:
+            netlist_init.update(x for x in int.keys if prefix_filter(x))
+    return [key_to_string(x) for x in sorted(netlist_init)]
 
 
 # use list comprehension to remove unneeded interfaces from
 # gns nodes, these address
 
 def prune_gns_node_intfs(gns_node_list, subnets):
+    keep = set(string_to_key(x) for x in subnets)
     for gns_node in gns_node_list:
-        gns_node.node["interfaces"] = [
+        gns_node.interfaces = [
             x for x
-            in gns_node.node["interfaces"]
-            if net_string(x["ip"], x["mask"])
-            in subnets
+            in gns_node.interfaces
+            if not keep.isdisjoint(x.keys)
             ]
 
 
-# takes ip and mask and creates a cidr-notated network string
-# (e.g. "10.1.1.0/24")
-
-def net_string(ip, mask):
-    intf_net = ipaddress.IPv4Network(str(ip) + "/" + str(mask), strict=False)
-    return str(intf_net)
-
+def create_gns_nodes(gns, app_id, gns_node_list, p_id, positions,
+                     switches=(), computes=None):
+    computes = computes or {}
 
-def create_gns_node(node, app_url, prj_url):
+    # the canvas spot of each router comes from the layout, its compute
+    # from place_computes
 
-    # generate random graph spot for router
+    nodes = []
+    for node in gns_node_list:
+        x, y = positions.get(node.name, (0, 0))
+        nodes.append({"name": node.name, "x": x, "y": y,
+                      "app_id": node.template or app_id,
+                      "compute_id": computes.get(node.name, "local")})
 
-    x = (random.randint(0, 300))
-    y = (random.randint(0, 300))
-    node_data = {"x": x, "y": y}
-    node_data = json.dumps(node_data)
-    node_create = requests.post(app_url, data=node_data)
+    # create the nodes in parallel, the results come back in the same order
 
-    # gather info about node to assign to instance attributes
+    results = gns.create_nodes(p_id, app_id, nodes)
 
-    node_id = json.loads(node_create.text)['node_id']
-    node_name = json.loads(node_create.text)['name']
-    node_dir = json.loads(node_create.text)['node_directory']
-    node_url = prj_url + "/nodes/" + node_id
+    for node, result in zip(gns_node_list, results):
+        add_gns_node_info(node, result)
 
-    # update node name
+    # the switches of the multi-access networks
 
-    node_data = {"name": node.node["name"]}
-    node_data = json.dumps(node_data)
-    node_update = requests.put(node_url, data=node_data)
+    switch_list = []
+    for switch in switches:
+        x, y = positions.get(switch.name, (0, 0))
+        switch_list.append({"name": switch.name, "ports": switch.ports,
+                            "x": x, "y": y,
+                            "compute_id": computes.get(switch.name, "local")})
+    for switch, result in zip(switches, gns.create_switches(p_id,
+                                                            switch_list)):
+        switch.add_id(result["node_id"])
 
-    # add id to node object, will be used when creating links
 
-    node.add_id(node_id)
-    node.add_dir(node_dir)
+# add id to node object, will be used when creating links. the nodes are
+# created in parallel so take the iou application id from gns3 instead
+# of trusting the creation order for the startup config name
 
-
-# this is where we give gns adapter, port and interface names to the
-# remaining interfaces of the node. we do this after pruning.
-
-def add_gns_interfaces(gns_interface, gns_port_info):
-    gns_interface["gns_adapter"] = gns_port_info[0]
-    gns_interface["gns_port"] = gns_port_info[1]
-    gns_interface["gns_ifname"] = gns_port_info[2]
-
-
-# similar to code of create_netmap but i needed gns router_id to create this
-
-def create_linkmap(netlist, node_list, gns_node_list):
-
-    id = 0
-    linkmap = []
-    for network in netlist:
-        id += 1
-        net_obj = {}
-        net_obj["name"] = network
-        net_obj["interfaces"] = []
-        net_obj["id"] = id
-        for gns_node in gns_node_list:
-            for i in gns_node.node["interfaces"]:
-                if network == net_string(i["ip"], i["mask"]):
-                    intf_obj = {}
-                    intf_obj["id"] = gns_node.id
-                    intf_obj["adapter"] = i["gns_adapter"]
-                    intf_obj["port"] = i["gns_port"]
-                    net_obj["interfaces"].append(intf_obj)
-        linkmap.append(net_obj)
-    return linkmap
+def add_gns_node_info(node, result):
+    node.add_id(result["node_id"])
+    node.add_dir(result["node_directory"])
+    app_num = result.get("properties", {}).get("application_id")
+    if app_num is not None:
+        node.add_startup("i" + str(app_num) + "_startup-config.cfg")
 
 
 # create configs for gns router nodes based on live config and gns
 # interface names
 
-def add_node_cfg(router_get, gns_node_list):
-
-    for x in router_get:
-        for gns_node in gns_node_list:
-
-            # this is how we match gns node object to nornir results
-
-            if x[0] == gns_node.node["name"]:
-                config = x[1][0].result["config"]
-                config = config["running"]
-                config_file = str(x[0]) + ".cfg"
-                config_gns = str(x[0]) + "-gns.cfg"
-
-                # this is where we write config to file
-
-                with open(config_file, 'w') as f:
-                    f.write(config)
-
-                create_gns_config(config_file, config_gns)
-
-                # convert interfaces to gns names
-
-                add_int_config(gns_node, config_file, config_gns)
-
-                # add the config filename as an attribute to the node object
-
-                gns_node.add_config(config_gns)
-
+@profiler.timed("config")
+def add_node_cfg(router_get, gns_node_list, workers=1, output_dir=".",
+                 debug=False, rules=None, build_cache=None):
+    from configgen import write_config
+
+    jobs = config_jobs(router_get, gns_node_list, debug, rules)
+    os.makedirs(output_dir, exist_ok=True)
+    keys = {}
+    if build_cache is not None:
+        jobs, keys = reuse_configs(jobs, build_cache, output_dir)
+
+    # the configs are generated in worker processes and come back in the
+    # same order. a device that fails is reported and left without a config.
+    # the finished config is the only file written
+
+    failures = {}
+    for (gns_node, config, _, _), (gns_config, steps, seconds, error) in zip(
+            jobs, run_config_jobs(jobs, workers)):
+        profiler.add_device("config", gns_node.name, seconds)
+        if error:
+            failures[gns_node.name] = error
+            continue
+
+        # add the config filename as an attribute to the node object
+
+        gns_node.add_config(write_config(
+            output_dir, gns_node.name, gns_config,
+            config if debug else None, steps))
+        if build_cache is not None:
+            build_cache.add_artifact(gns_node.name, keys[gns_node.name],
+                                     gns_config)
+
+    if build_cache is not None:
+        build_cache.save()
+    print_config_failures(failures)
+    return failures
+
+
+# devices whose inputs haven't changed get their config from the build
+# cache and nothing is generated for them. debug builds always run, the
+# cache has no intermediate configs. returns the jobs still to run and the
+# build key of each of their devices
+
+def reuse_configs(jobs, build_cache, output_dir):
+    from configgen import build_key
+    from configgen import write_config
+
+    todo = []
+    keys = {}
+    for job in jobs:
+        gns_node, config, debug, rules = job
+        key = build_key(gns_node, config, rules)
+        gns_config = None
+        if not debug:
+            gns_config = build_cache.artifact(gns_node.name, key)
+        if gns_config is None:
+            todo.append(job)
+            keys[gns_node.name] = key
+        else:
+            gns_node.add_config(write_config(output_dir, gns_node.name,
+                                             gns_config))
+    profiler.count("configs_reused", len(jobs) - len(todo))
+    return todo, keys
+
+
+# this is how we match gns node object to the collected results, each
+# device gets the rules of its platform
+
+def config_jobs(router_get, gns_node_list, debug=False, rules=None):
+    from configrules import DEFAULT_PLATFORM
+    from configrules import load_rules
+    from configrules import platform_rules
+
+    rules = rules or load_rules()
+    jobs = []
+    for gns_node in gns_node_list:
+        result = router_get[gns_node.name]
+        jobs.append((gns_node, result["config"]["running"], debug,
+                     platform_rules(rules, result.get(
+                         "platform", DEFAULT_PLATFORM))))
+    return jobs
 
-def add_int_config(gns_node, config_file, config_gns):
 
-    # loop through the interfaces to get the ip we will feed
-    # to ciscoconfparse
+def print_config_failures(failures):
+    if failures:
+        print("Config generation failed for {} devices:".format(
+            len(failures)))
+        for name, error in sorted(failures.items()):
+            print("  {}: {}".format(name, error))
 
-    # config_intf = str(gns_node.node["name"]) + "-gns.cfg"
-    # with open(config_intf, 'w') as f:
-    #    f.write("! GENERATED BY B-TOWN\n\n")
 
-    with open(config_gns, 'a') as f:
-        for intf in gns_node.node["interfaces"]:
-            ip = intf["ip"]
-            parse = CiscoConfParse(config_file)
-            ip_ints = parse.find_objects_w_child("^interface", ip)
-            for i in ip_ints:
-                # i is a <class 'ciscoconfparse.models_cisco.IOSCfgLine'>
-                for j in i.ioscfg:
-                    if "bfd" not in j:
-                        f.write(j+"\n")
-                f.write("!\n")
-    # return config_gns
+# workers is the number of processes, 1 runs the jobs here
 
+def run_config_jobs(jobs, workers):
+    if workers == 1 or len(jobs) < 2:
+        return [config_job(x) for x in jobs]
 
-# update the config interface names with the gns names
+    from concurrent.futures import ProcessPoolExecutor
 
-def modify_cfg(gns_node):
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(config_job, jobs, chunksize=chunksize))
 
-    filename = str(gns_node.node["name"]) + "-gns.cfg"
+    # the parses happened in the workers where the profiler can't see them
 
-    # create the tuple for interface name replacement then call the mod func
+    profiler.count("config_parses", len(jobs))
+    return results
 
-    for i in gns_node.node["interfaces"]:
-        intfs = (i["intf"], i["gns_ifname"])
-        modify_intf(filename, intfs)
 
+# one device, returns (gns config, debug steps, seconds, error) instead of
+# raising so one bad config doesn't stop the rest
 
-def modify_intf(filename, intfs):
+def config_job(job):
+    from configgen import build_config
 
-    with fileinput.FileInput(filename, inplace=True, backup='.bak') as file:
-        for line in file:
-            line = re.sub(intfs[0], intfs[1], line.rstrip())
-            print(line)
+    gns_node, config, debug, rules = job
+    start = time.perf_counter()
+    try:
+        gns_config, steps = build_config(gns_node, config, rules, debug=debug)
+    except Exception as e:
+        return None, [], time.perf_counter() - start, "{}: {}".format(
+            type(e).__name__, e)
+    return gns_config, steps, time.perf_counter() - start, None
 
 
-def create_gns_link(link, prj_url):
+def create_gns_link(ends):
 
-    # converting the linkmap into gns nomenclature
+    # converting the (node, adapter, port) ends into gns nomenclature
 
     link_data = {}
     link_data["nodes"] = []
-    for i in link["interfaces"]:
+    for node, adapter, port in ends:
         port_obj = {}
-        port_obj["adapter_number"] = i["adapter"]
-        port_obj["node_id"] = i["id"]
-        port_obj["port_number"] = i["port"]
+        port_obj["adapter_number"] = adapter
+        port_obj["node_id"] = node.id
+        port_obj["port_number"] = port
         link_data["nodes"].append(port_obj)
-    link_url = prj_url + "/links"
-    link_data = json.dumps(link_data)
-    link_create = requests.post(link_url, data=link_data)
-    print(link_create.text)
+    return link_data
+
+
+# load the yaml settings file and put the flags on top
+
+def load_config(args):
+    cfg = dict(DEFAULTS)
+    filename = getattr(args, "config", "netmodel.yaml")
+    if os.path.exists(filename):
+        import yaml
+        with open(filename) as f:
+            cfg.update(yaml.safe_load(f) or {})
+    cfg.update(vars(args))
+    if not cfg["project_name"]:
+        cfg["project_name"] = "netmodel" + str(random.randint(100, 999))
+    return argparse.Namespace(**cfg)
+
+
+def gns_client(cfg):
+    from gnsproject import GnsClient
+    return GnsClient(cfg.gns_server, workers=cfg.gns_workers,
+                     use_templates=cfg.gns_templates)
+
+
+# get the getter results for every host. cached data is used where we have
+# it, hosts listed in --refresh are always rediscovered. offline only uses
+# the cache and doesn't need the nornir inventory. with a slice and the
+# topology of an earlier build only the hosts of the slice are fetched, see
+# topology.py
+
+@profiler.timed("discovery")
+def discover(cfg):
+    cache = DiscoveryCache(cfg.cache_dir, ttl=cfg.cache_ttl,
+                           max_bytes=cfg.cache_max_mb * 1024 * 1024)
+    cache.invalidate([x for x in cfg.refresh.split(",") if x])
+    collector = Collector(workers=cfg.collect_workers,
+                          connect_timeout=cfg.connect_timeout,
+                          command_timeout=cfg.command_timeout)
+    if cfg.offline:
+        hosts = dict((x, None) for x in sorted(cache.index))
+    else:
+        from nornir.core import InitNornir
+        nr = InitNornir()
+        hosts = dict((x["name"], x) for x in nornir_hosts(nr))
+
+    def fetch(names):
+        router_get = {}
+        if cfg.offline:
+            for name in names:
+                if name in hosts:
+                    router_get[name] = cache.get(name, ttl=None)
+            print("Using cached data for {} hosts".format(len(router_get)))
+            return router_get
+
+        todo = []
+        for name in names:
+            if name not in hosts:
+                continue
+            result = cache.get(name, hosts[name]["hostname"])
+            if result is None:
+                todo.append(hosts[name])
+            else:
+                router_get[name] = result
+        print("Using cached data for {} hosts".format(len(router_get)))
+
+        # hosts that fail are left out and listed in the failure report.
+        # the platform is kept with the results, config generation picks
+        # its rules by it
+
+        for name, result in collector.collect(todo):
+            result["platform"] = nr.inventory.hosts[name].platform
+            router_get[name] = result
+            cache.put(name, result, nr.inventory.hosts[name].hostname)
+        return router_get
+
+    topology = load_topology(cfg) if has_slice(cfg) else None
+    if topology is None:
+        router_get = fetch(hosts)
+    else:
+        from topology import crawl
+        from topology import node_networks
+        skip = prefix_filter(cfg)
+        router_get = crawl(
+            topology, slice_budgets(cfg, topology), fetch,
+            lambda name, result: node_networks(create_node(name, result),
+                                               skip))
+        topology.save(topology_file(cfg))
+        print("Crawled {} hosts of the slice".format(len(router_get)))
+    if not cfg.offline:
+        collector.print_failure_report(cfg.failure_report)
+        cache.save()
+    return router_get
+
+
+# the port layout of every template we can use. layouts can be given in
+# the settings file (template_layouts, same fields as the gns3 template),
+# otherwise they are read from the gns3 server
+
+def port_allocator(cfg):
+    layouts = {}
+    templates = {}
+    gns = None
+    for template_id in cfg.templates or [cfg.app_id]:
+        template = cfg.template_layouts.get(template_id)
+        if template is None:
+            gns = gns or gns_client(cfg)
+            template = gns.get_template(template_id)
+        templates[template_id] = template
+        layouts[template_id] = template_layout(template, cfg.first_adapter)
+    return PortAllocator(layouts, templates)
 
 
-# create the GNS3 project and set URLs
+# loop through each gns node interface reamining and add gns port info
 
-if p_id == "":
-    p_id = create_project()
-prj_url = "http://" + gns_ip + "/v2/projects/" + p_id
-app_url = prj_url + "/appliances/" + app_id
+def assign_ports(gns_node_list, allocator):
+    for gns_node in gns_node_list:
+        try:
+            allocator.allocate(gns_node)
+        except ValueError as e:
+            sys.exit("{}: {}".format(gns_node.name, e))
 
-# create a node list based on nornir and napalm results. We also create
-# a Node instance since we have methods that will add stuff to the node
 
-node_list = create_node_list(router_get)
-for node in node_list:
-    gns_node = Node(node)
-    gns_node_list.append(gns_node)
+# everything we can work out without gns3: nodes, networks, the netmap and
+# the gns port of every interface we keep
 
-# create list of networks for netmap and linkmap functions, removes duplicates
+def build_model(router_get, allocator, prefix_filter, gns_node_list=None):
 
-netlist = list(set(create_netlist(node_list)))
+    # create a node list based on nornir and napalm results, unless the
+    # nodes were already made as the results came in
 
-# g_id is an internal gns number used for naming the startup config
+    if gns_node_list is None:
+        with profiler.stage("nodes"):
+            gns_node_list = create_node_list(router_get)
 
-g_id = 1
-for gns_node in gns_node_list:
-    startup_config = "i" + str(g_id) + "_startup-config.cfg"
-    create_gns_node(gns_node, app_url, prj_url)
-    gns_node.add_startup(startup_config)
-    g_id += 1
+    # index every address by its network once, create_netmap and
+    # segment_links both look up networks in it
 
-netmap = create_netmap(netlist, node_list, gns_node_list)
+    with profiler.stage("netlist"):
+        subnet_index = build_subnet_index(gns_node_list)
 
-# create a list of networks that we can use in list comprehension to delete
-# unneded interfaces from the gns_node objects
+        # create list of networks for the netmap, removes duplicates. the
+        # ipv4 and ipv6 networks of a dual stack segment are merged into one
 
-subnets = []
-for nets in netmap:
-    subnets.append(str(nets["name"]))
+        netlist = merge_segments(subnet_index,
+                                 create_netlist(gns_node_list, prefix_filter))
 
-prune_gns_node_intfs(gns_node_list, subnets)
+    # g_id is an internal gns number used for naming the startup config
 
-# loop through each gns node interface reamining and add gns port info
+    g_id = 1
+    for gns_node in gns_node_list:
+        startup_config = "i" + str(g_id) + "_startup-config.cfg"
+        gns_node.add_startup(startup_config)
+        g_id += 1
 
-for gns_node in gns_node_list:
-    port_num = 0
-    for i in gns_node.node["interfaces"]:
-        gns_adapter = 1
-        gns_port = port_num
-        gns_ifname = "Ethernet" + str(gns_adapter) + "/" + str(gns_port)
-        gns_port_info = (gns_adapter, gns_port, gns_ifname)
-        add_gns_interfaces(i, gns_port_info)
-        port_num += 1
-        if gns_port == 8:
-            print("quitting until you add counter to adapter")
-            exit()
+    with profiler.stage("netmap"):
+        netmap = create_netmap(netlist, subnet_index)
 
-# recreate the netmap to add gns port info
+    # create a list of networks that we can use in list comprehension to
+    # delete unneded interfaces from the gns_node objects
 
-linkmap = create_linkmap(netlist, node_list, gns_node_list)
+    with profiler.stage("pruning"):
+        subnets = []
+        for nets in netmap:
+            subnets.append(str(nets["name"]))
 
-# call the function to add configs to the nodes
+        prune_gns_node_intfs(gns_node_list, subnets)
+        prune_subnet_index(subnet_index, subnets)
+    with profiler.stage("ports"):
+        assign_ports(gns_node_list, allocator)
+        switches, links = segment_links(subnet_index)
 
-add_node_cfg(router_get, gns_node_list)
+    model = {}
+    model["gns_node_list"] = gns_node_list
+    model["netlist"] = netlist
+    model["netmap"] = netmap
+    model["subnet_index"] = subnet_index
+    model["switches"] = switches
+    model["links"] = links
+    return model
 
-# update the interfaces with the gns names
 
-for gns_node in gns_node_list:
-    modify_cfg(gns_node)
+def config_workers(cfg):
+    return cfg.config_workers or os.cpu_count() or 1
 
-print("Creating the GNS3 Link objects...")
 
-for link in linkmap:
-    create_gns_link(link, prj_url)
+def config_rules(cfg):
+    from configrules import load_rules
+    try:
+        return load_rules(cfg.config_rules)
+    except ValueError as e:
+        sys.exit("{}: {}".format(cfg.config_rules, e))
 
-ssh_client = paramiko.SSHClient()
-ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh_client.connect(hostname="172.28.88.11", username="gns3", password="gns3")
 
-for gns_node in gns_node_list:
-    print(gns_node.__dict__)
-    ftp_client = ssh_client.open_sftp()
-    remote_file = gns_node.dir + "/configs/" + gns_node.startup
-    ftp_client.put(gns_node.config, remote_file)
-    ftp_client.close()
+def prefix_filter(cfg):
+    return PrefixFilter(cfg.skip_prefixes, cfg.skip_networks)
+
+
+# the hosts to discover for the slice when there is a topology to find
+# them in, None for every host
+
+def discovery_slice(cfg):
+    if not has_slice(cfg):
+        return None
+    topology = load_topology(cfg)
+    if topology is None:
+        return None
+    names = set()
+    for name, hops in slice_budgets(cfg, topology).items():
+        names.update(topology.neighbourhood([name], hops))
+    return names
+
+
+# the part of the network to model: the slice hosts and their neighbours
+# within slice_hops, the hosts on a shortest path between the two
+# slice_path hosts and the hosts in slice_groups
+
+def has_slice(cfg):
+    return bool(cfg.slice or cfg.slice_path or cfg.slice_groups)
+
+
+def topology_file(cfg):
+    return os.path.join(cfg.cache_dir, "topology.json")
+
+
+def load_topology(cfg):
+    from topology import TopologyIndex
+    return TopologyIndex.load(topology_file(cfg))
+
+
+# the topology of a model of the whole network is kept for the next slice.
+# a slice only has part of it, its crawl keeps the topology up to date
+
+def save_topology(cfg, model):
+    from topology import TopologyIndex
+    if has_slice(cfg) and os.path.exists(topology_file(cfg)):
+        return
+    TopologyIndex.from_netmap(
+        model["netmap"], [x.name for x in model["gns_node_list"]]).save(
+            topology_file(cfg))
+
+
+# hops left to crawl from each host that starts the crawl. it goes one
+# hop past the slice: the interfaces of a host at the edge of the slice
+# are only all modeled, and get the ports a model of the whole network
+# gives them, when the hosts on the other end are known
+
+def slice_budgets(cfg, topology):
+    budgets = dict((x, 1) for x in select_slice(cfg, topology, seeds=False))
+    budgets.update((x, cfg.slice_hops + 1) for x in cfg.slice)
+    return budgets
+
+
+# the hosts of the slice, by name in the order of the neighbourhood
+# queries. seeds=False leaves out the slice hosts and their neighbours
+
+def select_slice(cfg, topology, seeds=True):
+    from layout import load_groups
+
+    missing = topology.missing(list(cfg.slice) + list(cfg.slice_path))
+    if missing:
+        sys.exit("{} not in the topology".format(", ".join(missing)))
+    names = {}
+    if seeds and cfg.slice:
+        names.update(topology.neighbourhood(cfg.slice, cfg.slice_hops))
+    if cfg.slice_path:
+        if len(cfg.slice_path) != 2:
+            sys.exit("slice_path is two hosts")
+        path = topology.shortest_path(*cfg.slice_path)
+        if path is None:
+            sys.exit("no path from {} to {}".format(*cfg.slice_path))
+        names.update((x, 0) for x in path)
+    if cfg.slice_groups:
+        groups = {}
+        if os.path.exists(cfg.inventory_hosts):
+            groups = load_groups(cfg.inventory_hosts)
+        names.update((x, 0) for x in sorted(
+            topology.group(cfg.slice_groups, groups)))
+    return list(names)
 
-# display project info to user
 
-print("Project URL is: ", prj_url)
-print("Project name is: ", prj_name)
+# the model cut down to the hosts of the slice, the links between them
+# and the switches they are on. the hosts keep the interfaces and ports
+# they have in the whole model, an interface to a host outside the slice
+# is configured but not linked, so a slice synced into a project of the
+# whole network fits it. the whole model when there is no slice
+
+def slice_model(cfg, router_get, model):
+    from gnsmodel import Switch
+    from topology import TopologyIndex
+
+    save_topology(cfg, model)
+    if not has_slice(cfg):
+        model["slice"] = None
+        return router_get, model
+    names = set(select_slice(cfg, TopologyIndex.from_netmap(
+        model["netmap"], [x.name for x in model["gns_node_list"]])))
+    if not names:
+        sys.exit("the slice has no hosts")
+    print("The slice has {} of {} hosts".format(len(names), len(router_get)))
+
+    links = [ends for ends in model["links"]
+             if all(isinstance(x, Switch) or x.name in names
+                    for x, _, _ in ends)]
+    switches = set(x.name for ends in links for x, _, _ in ends
+                   if isinstance(x, Switch))
+    netmap = []
+    for network in model["netmap"]:
+        nodes = [x for x in network["nodes"] if x.name in names]
+        if nodes:
+            netmap.append(dict(network, nodes=nodes))
+    subnet_index = {}
+    for key, attached in model["subnet_index"].items():
+        attached = [x for x in attached if x[0].name in names]
+        if attached:
+            subnet_index[key] = attached
+    kept = set(x["name"] for x in netmap)
+
+    model["gns_node_list"] = [x for x in model["gns_node_list"]
+                              if x.name in names]
+    model["switches"] = [x for x in model["switches"] if x.name in switches]
+    model["links"] = links
+    model["netmap"] = netmap
+    model["netlist"] = [x for x in model["netlist"] if x in kept]
+    model["subnet_index"] = subnet_index
+    model["slice"] = sorted(names)
+    return dict((k, v) for k, v in router_get.items() if k in names), model
+
+
+# where every node and switch goes on the canvas, from the links
+
+@profiler.timed("layout")
+def place_nodes(cfg, model):
+    import layout
+
+    names = [x.name for x in model["gns_node_list"] + model["switches"]]
+    edges = layout.link_edges(model["links"])
+    if cfg.layout == "force":
+        return layout.force_layout(names, edges, spacing=cfg.layout_spacing)
+    if cfg.layout == "hierarchy":
+        groups = {}
+        if os.path.exists(cfg.inventory_hosts):
+            groups = layout.load_groups(cfg.inventory_hosts)
+        return layout.hierarchy_layout(names, edges, groups, cfg.layout_tiers,
+                                       spacing=cfg.layout_spacing)
+    if cfg.layout == "random":
+        return layout.random_layout(names, spacing=cfg.layout_spacing)
+    sys.exit("unknown layout {}".format(cfg.layout))
+
+
+# the compute servers of the settings with their capacity, what isn't
+# given is read from the server
+
+def compute_capacity(gns, computes):
+    result = []
+    server = None
+    for compute in computes:
+        compute = dict(compute)
+        if not compute.get("ram_mb") or not compute.get("cpus"):
+            if server is None:
+                server = dict((x["compute_id"], x)
+                              for x in gns.get_computes())
+            if compute["compute_id"] not in server:
+                sys.exit("compute {} isn't on the gns3 server".format(
+                    compute["compute_id"]))
+            capabilities = server[compute["compute_id"]].get(
+                "capabilities", {})
+            compute["ram_mb"] = compute.get("ram_mb") or (
+                capabilities.get("memory", 0) // (1024 * 1024))
+            compute["cpus"] = compute.get("cpus") or capabilities.get(
+                "cpus", 0)
+        result.append(compute)
+    return result
+
+
+# spread the nodes and switches over the computes so each gets its share
+# and few links go between them. fixed is node name -> compute id of the
+# nodes that are already in the project. returns node name -> compute id,
+# empty when there are no computes in the settings
+
+@profiler.timed("placement")
+def place_computes(cfg, gns, model, fixed=None):
+    from partition import compute_loads
+    from partition import cut_links
+    from partition import partition
+    from partition import template_demand
+
+    if not cfg.computes:
+        return {}
+    computes = compute_capacity(gns, cfg.computes)
+    ids = [x["compute_id"] for x in computes]
+    templates = port_allocator(cfg).templates
+    demand = {}
+    for gns_node in model["gns_node_list"]:
+        demand[gns_node.name] = template_demand(
+            templates.get(gns_node.template or cfg.app_id, {}))
+    for switch in model["switches"]:
+        demand[switch.name] = (0, 0)
+    edges = [(a.name, b.name) for (a, _, _), (b, _, _) in model["links"]]
+    fixed = dict((k, ids.index(v)) for k, v in (fixed or {}).items()
+                 if k in demand and v in ids)
+    parts = partition(list(demand), edges, demand,
+                      [(x["ram_mb"], x["cpus"]) for x in computes], fixed)
+    print_placement(computes, compute_loads(parts, demand, len(ids)),
+                    cut_links(edges, parts), len(edges))
+    return dict((name, ids[part]) for name, part in parts.items())
+
+
+def print_placement(computes, loads, cut, links):
+    print("Placement on {} computes:".format(len(computes)))
+    for compute, (count, ram, cpus) in zip(computes, loads):
+        full = ""
+        if ram > compute["ram_mb"] or cpus > compute["cpus"]:
+            full = " (over capacity)"
+        print("  {}: {} nodes, {:.0f} of {} MB ram, {:.0f} of {} cpus{}"
+              .format(compute["compute_id"], count, ram, compute["ram_mb"],
+                      cpus, compute["cpus"], full))
+    print("{} of {} links go between computes".format(cut, links))
+
+
+# create the GNS3 project, or when syncing an existing project work out
+# what has changed and only create what is missing. returns the project id
+# and the links to create (None means all of them). model["computes"] gets
+# the compute of every node. created is called with the id of a new
+# project before any node is made in it
+
+@profiler.timed("node_creation")
+def provision_nodes(cfg, gns, model, created=None):
+    gns_node_list = model["gns_node_list"]
+    switches = model["switches"]
+    p_id = cfg.project_id
+    if p_id == "":
+        p_id = gns.create_project(cfg.project_name)
+        if created is not None:
+            created(p_id)
+        new_nodes = gns_node_list
+        new_switches = switches
+        new_links = None
+        model["computes"] = {}
+    else:
+        new_nodes, new_switches, new_links = sync_project(
+            cfg, gns, p_id, model)
+    model["computes"].update(place_computes(cfg, gns, model,
+                                            model["computes"]))
+
+    create_gns_nodes(gns, cfg.app_id, new_nodes, p_id, model["positions"],
+                     new_switches, model["computes"])
+    return p_id, new_links
+
+
+# a slice only syncs its own nodes, the rest of the project is left alone
+
+def sync_scope(model):
+    if model.get("slice") is None:
+        return None
+    return set(model["slice"]) | set(x.name for x in model["switches"])
+
+
+# delete what the model no longer has from an existing project and take the
+# ids and computes of the nodes we keep. returns the nodes, switches and
+# links that still have to be created
+
+def sync_project(cfg, gns, p_id, model):
+    gns_node_list = model["gns_node_list"]
+    switches = model["switches"]
+    plan = plan_sync(gns, p_id, gns_node_list + switches, model["links"],
+                     sync_scope(model))
+    print_plan(plan)
+    if cfg.plan_only:
+        sys.exit()
+    apply_deletes(gns, p_id, plan)
+    for gns_node in gns_node_list:
+        if gns_node.name in plan["keep_nodes"]:
+            add_gns_node_info(gns_node, plan["keep_nodes"][gns_node.name])
+    for switch in switches:
+        if switch.name in plan["keep_nodes"]:
+            switch.add_id(plan["keep_nodes"][switch.name]["node_id"])
+    model["computes"] = dict((k, v.get("compute_id", "local"))
+                             for k, v in plan["keep_nodes"].items())
+    new_nodes = [x for x in gns_node_list if x.name in plan["create_nodes"]]
+    new_switches = [x for x in switches if x.name in plan["create_nodes"]]
+    return new_nodes, new_switches, set(plan["create_links"])
+
+
+@profiler.timed("link_creation")
+def provision_links(gns, p_id, model, new_links=None):
+    import requests
+
+    print("Creating the GNS3 Link objects...")
+
+    # gns3 links join two ports, networks with one node were pruned and
+    # multi-access networks go through their switch. a link gns3 refuses
+    # doesn't stop the others
+
+    todo = links_to_create(model["links"], new_links)
+
+    def create(ends):
+        try:
+            return gns.create_link(p_id, create_gns_link(ends)), None
+        except requests.HTTPError as e:
+            return None, http_error(e)
+
+    failures = []
+    for ends, (link, error) in zip(todo, gns.run_all(create, todo)):
+        if error:
+            failures.append((ends, error))
+            continue
+        print(link)
+    if failures:
+        print("These links couldn't be created:")
+        for ends, error in failures:
+            print("  {}: {}".format(link_string(desired_links([ends]).pop()),
+                                    error))
+        sys.exit("{} of {} links failed, build --resume links creates the "
+                 "missing ones".format(len(failures), len(todo)))
+
+
+def http_error(e):
+    try:
+        message = e.response.json()["message"]
+    except (ValueError, KeyError, TypeError):
+        message = e.response.reason
+    return "{} {}".format(e.response.status_code, message)
+
+
+# the links of the model that a resumed build still has to create: the
+# stage that failed may have made some of them already
+
+def missing_links(gns, p_id, model):
+    plan = plan_sync(gns, p_id, model["gns_node_list"] + model["switches"],
+                     model["links"], sync_scope(model))
+    print("{} links are in the project already, {} to create".format(
+        len(model["links"]) - len(plan["create_links"]),
+        len(plan["create_links"])))
+    return set(plan["create_links"])
+
+
+# the links of the model that aren't in the project yet, new_links is None
+# for a new project
+
+def links_to_create(links, new_links):
+    if new_links is None:
+        return list(links)
+    return [ends for ends in links
+            if frozenset((x.name, adapter, port)
+                         for x, adapter, port in ends) in new_links]
+
+
+# the hashes of the configs on the gns3 server, see upload.py
+
+def upload_manifest(cfg):
+    return os.path.join(cfg.cache_dir, "uploads.json")
+
+
+# upload the startup configs over one ssh connection. a config the build
+# cache has seen go to the same file is left alone, when that is all of
+# them we don't even log in
+
+@profiler.timed("upload")
+def upload_configs(cfg, gns_node_list, build_cache=None):
+    from cache import file_digest
+    from upload import Uploader
+    from upload import print_upload_report
+
+    print("Uploading the startup configs...")
+
+    files = []
+    uploads = []
+    for gns_node in gns_node_list:
+        for local, remote in node_files([gns_node]):
+            digest = None
+            if build_cache is not None:
+                digest = file_digest(local)
+                if build_cache.uploaded(gns_node.name, remote, digest):
+                    continue
+            files.append((local, remote))
+            uploads.append((gns_node.name, remote, digest))
+    reused = len(node_files(gns_node_list)) - len(files)
+    if reused:
+        profiler.count("uploads_reused", reused)
+        print("{} configs are already on the server".format(reused))
+    if not files:
+        return
+
+    uploader = Uploader(cfg.gns_server.split(":")[0], cfg.ssh_user,
+                        cfg.ssh_pass, channels=cfg.sftp_channels,
+                        manifest=upload_manifest(cfg))
+    try:
+        results = uploader.upload_all(files)
+    finally:
+        uploader.close()
+    print_upload_report(results)
+    if build_cache is not None:
+        for (name, remote, digest), result in zip(uploads, results):
+            if not result["error"]:
+                build_cache.add_upload(name, remote, digest)
+        build_cache.save()
+    failed = [x["remote"] for x in results if x["error"]]
+    if failed:
+        sys.exit("{} configs failed to upload".format(len(failed)))
+
+
+# start the nodes of the project, only the ones in names when given.
+# switches are always running
+
+@profiler.timed("boot")
+def boot_project(cfg, gns, p_id, names=None):
+    from boot import LabBoot
+
+    nodes = [x for x in gns.get_nodes(p_id)
+             if x["node_type"] != "ethernet_switch" and
+             (names is None or x["name"] in names)]
+    print("Booting {} nodes...".format(len(nodes)))
+    lab = LabBoot(gns, p_id, nodes, wave=cfg.boot_wave,
+                  workers=cfg.boot_workers, max_cpu=cfg.boot_max_cpu,
+                  max_memory=cfg.boot_max_memory, timeout=cfg.boot_timeout,
+                  console=cfg.boot_console, prompt=cfg.boot_prompt,
+                  server=cfg.gns_server.split(":")[0])
+    lab.run()
+    lab.print_report(cfg.boot_report)
+    return lab
+
+
+def node_files(gns_node_list):
+    files = []
+    for gns_node in gns_node_list:
+        if not gns_node.config:
+            continue
+        remote_file = gns_node.dir + "/configs/" + gns_node.startup
+        files.append((gns_node.config, remote_file))
+    return files
+
+
+def cmd_discover(cfg):
+    router_get = discover(cfg)
+    print("Discovered {} hosts".format(len(router_get)))
+
+
+def cmd_plan(cfg):
+    router_get = discover(cfg)
+    model = build_model(router_get, port_allocator(cfg), prefix_filter(cfg))
+    _, model = slice_model(cfg, router_get, model)
+    if cfg.project_id:
+        plan = plan_sync(gns_client(cfg), cfg.project_id,
+                         model["gns_node_list"] + model["switches"],
+                         model["links"], sync_scope(model))
+        print_plan(plan)
+        return
+    for gns_node in model["gns_node_list"]:
+        print(gns_node.name)
+        for i in gns_node.interfaces:
+            print("    {} -> {}".format(i.name, i.gns_name))
+    for switch in model["switches"]:
+        print("{} ({} ports)".format(switch.name, switch.ports))
+
+
+# the stages of a build. the model is snapshot after each one so a build
+# can be resumed from any of them, a resumed build uses the cached device
+# data however old it is
+
+BUILD_STAGES = ["model", "layout", "nodes", "config", "links", "upload",
+                "boot"]
+
+
+def build_cache_dir(cfg):
+    return os.path.join(cfg.cache_dir, "builds")
+
+
+def build_cache(cfg):
+    from cache import BuildCache
+    if not cfg.build_cache:
+        return None
+    return BuildCache(build_cache_dir(cfg),
+                      max_bytes=cfg.build_cache_max_mb * 1024 * 1024)
+
+
+def snapshot_store(cfg):
+    from snapshot import SnapshotStore
+    if not cfg.snapshot_dir:
+        return None
+    return SnapshotStore(cfg.snapshot_dir)
+
+
+def cmd_build(cfg):
+    from snapshot import SnapshotError
+
+    if cfg.pipeline and not cfg.resume:
+        from pipeline import PipelinedBuild
+        build = PipelinedBuild(cfg)
+        model = build.run()
+        if (model is not None and model["project_id"] and cfg.boot and
+                not build.failed):
+            boot_project(cfg, gns_client(cfg), model["project_id"],
+                         set(x.name for x in model["gns_node_list"]))
+        if model is not None and model["project_id"]:
+            print("Project URL is: ", gns_client(cfg).project_url(
+                model["project_id"]))
+            print("Project name is: ", cfg.project_name)
+
+        # like a failed stage of the sequential build, the project is left
+        # for build --resume to finish
+
+        if build.failed:
+            sys.exit("{} tasks of the build failed".format(build.failed))
+        return
+
+    snapshots = snapshot_store(cfg)
+    start = 0
+    model = None
+    if cfg.resume:
+        if snapshots is None:
+            sys.exit("--resume needs a snapshot_dir")
+        start = BUILD_STAGES.index(cfg.resume)
+        cfg.offline = True
+        if start:
+            try:
+                with profiler.stage("snapshot_load"):
+                    model = snapshots.load(BUILD_STAGES[start - 1])
+            except SnapshotError as e:
+                sys.exit(str(e))
+            print("Resuming from {} with {} nodes".format(
+                cfg.resume, len(model["gns_node_list"])))
+
+    def done(stage):
+        if snapshots is not None:
+            with profiler.stage("snapshot"):
+                snapshots.save(stage, model)
+
+    def run(stage):
+        return BUILD_STAGES.index(stage) >= start
+
+    router_get = None
+    builds = build_cache(cfg)
+    if run("model"):
+        router_get = discover(cfg)
+        model = build_model(router_get, port_allocator(cfg),
+                            prefix_filter(cfg))
+        router_get, model = slice_model(cfg, router_get, model)
+        done("model")
+    if run("layout"):
+        model["positions"] = place_nodes(cfg, model)
+        done("layout")
+    gns = gns_client(cfg)
+    if run("nodes"):
+
+        # the layout snapshot gets the project as soon as there is one, a
+        # build that stops while it creates the nodes is resumed by syncing
+        # that project instead of making another
+
+        if cfg.resume and not cfg.project_id and model.get("project_id"):
+            cfg.project_id = model["project_id"]
+            cfg.project_name = model["project_name"] or cfg.project_name
+
+        def created(p_id):
+            model["project_id"] = p_id
+            model["project_name"] = cfg.project_name
+            done("layout")
+
+        if cfg.project_id:
+            created(cfg.project_id)
+        model["project_id"], model["new_links"] = provision_nodes(
+            cfg, gns, model, created)
+        model["project_name"] = cfg.project_name
+        done("nodes")
+    p_id = model["project_id"]
+    cfg.project_name = model["project_name"]
+
+    # call the function to add configs to the nodes
+
+    if run("config"):
+        router_get = router_get or discover(cfg)
+        add_node_cfg(router_get, model["gns_node_list"], config_workers(cfg),
+                     cfg.output_dir, cfg.debug_configs, config_rules(cfg),
+                     builds)
+        done("config")
+    if run("links"):
+        new_links = model["new_links"]
+        if cfg.resume:
+            new_links = missing_links(gns, p_id, model)
+        provision_links(gns, p_id, model, new_links)
+        done("links")
+    if run("upload"):
+        if not cfg.no_upload:
+            upload_configs(cfg, model["gns_node_list"], builds)
+        done("upload")
+    if run("boot") and cfg.boot:
+        boot_project(cfg, gns, p_id,
+                     set(x.name for x in model["gns_node_list"]))
+
+    # display project info to user
+
+    print("Project URL is: ", gns.project_url(p_id))
+    print("Project name is: ", cfg.project_name)
+
+
+# write the topology to a .gns3project file instead of building it over
+# the REST API, then read it back to check it
+
+def cmd_export(cfg):
+    from export import add_node_ids
+    from export import export_project
+    from export import validate_project
+
+    router_get = discover(cfg)
+    allocator = port_allocator(cfg)
+    model = build_model(router_get, allocator, prefix_filter(cfg))
+    router_get, model = slice_model(cfg, router_get, model)
+    add_node_ids(model["gns_node_list"] + model["switches"])
+    add_node_cfg(router_get, model["gns_node_list"], config_workers(cfg),
+                 cfg.output_dir, cfg.debug_configs, config_rules(cfg),
+                 build_cache(cfg))
+    positions = place_nodes(cfg, model)
+    with profiler.stage("export"):
+        export_project(cfg.output, cfg.project_name, model["gns_node_list"],
+                       model["links"], allocator.templates, positions,
+                       model["switches"])
+    counts = validate_project(cfg.output)
+    print("Wrote {}: {} nodes, {} links, {} ports, {} configs".format(
+        cfg.output, counts["nodes"], counts["links"], counts["ports"],
+        counts["configs"]))
+
+
+# upload the -gns.cfg files in the output directory to the nodes with the
+# same name in an existing project
+
+def cmd_upload(cfg):
+    from configgen import config_file
+
+    if not cfg.project_id:
+        sys.exit("upload needs --project-id")
+    gns = gns_client(cfg)
+    gns.open_project(cfg.project_id)
+    gns_node_list = []
+    for result in gns.get_nodes(cfg.project_id):
+        config_gns = config_file(cfg.output_dir, result["name"])
+        if not os.path.exists(config_gns):
+            continue
+        gns_node = Node(result["name"])
+        add_gns_node_info(gns_node, result)
+        gns_node.add_config(config_gns)
+        gns_node_list.append(gns_node)
+    upload_configs(cfg, gns_node_list, build_cache(cfg))
+
+
+# the hosts a slice selects in the topology of the last build, a path in
+# order
+
+def cmd_slice(cfg):
+    topology = load_topology(cfg)
+    if topology is None:
+        sys.exit("no topology in {}, run plan or build first".format(
+            cfg.cache_dir))
+    if not has_slice(cfg):
+        sys.exit("slice needs --slice, --slice-path or --slice-groups")
+    if cfg.slice_path:
+        path = topology.shortest_path(*cfg.slice_path)
+        if path is not None:
+            print("Path: " + " -> ".join(path))
+    names = select_slice(cfg, topology)
+    for name in names:
+        print(name)
+    print("{} of {} hosts".format(len(names), len(topology.devices)))
+
+
+# start the nodes of an existing project
+
+def cmd_boot(cfg):
+    if not cfg.project_id:
+        sys.exit("boot needs --project-id")
+    gns = gns_client(cfg)
+    gns.open_project(cfg.project_id)
+    lab = boot_project(cfg, gns, cfg.project_id)
+    if lab.failures:
+        sys.exit(1)
+
+
+# forget the built configs of some hosts, or of all of them, so the next
+# build generates and uploads them again
+
+def cmd_invalidate(cfg):
+    from cache import BuildCache
+
+    builds = BuildCache(build_cache_dir(cfg),
+                        max_bytes=cfg.build_cache_max_mb * 1024 * 1024)
+    before = len(builds.index)
+    builds.invalidate(cfg.hosts or None)
+    builds.save()
+    print("Dropped the builds of {} hosts".format(before - len(builds.index)))
+
+
+# comma separated hosts or groups
+
+def name_list(value):
+    return [x for x in value.split(",") if x]
+
+
+# --computes gns1,gns2 is the computes setting with the capacity read from
+# the server
+
+def compute_list(value):
+    return [{"compute_id": x} for x in value.split(",") if x]
+
+
+# command line options, the discovery cache lets us rebuild the topology
+# without logging into the devices again. options are shared by all the
+# subcommands and only set when given so the yaml file isn't overridden by
+# the flag defaults
+
+def make_parser():
+    common = argparse.ArgumentParser(
+        add_help=False, argument_default=argparse.SUPPRESS)
+    common.add_argument("--config", help="yaml settings file "
+                        "(default netmodel.yaml)")
+    common.add_argument("--gns-server", help="gns3 server ip:port")
+    common.add_argument("--app-id", help="gns3 appliance or template id")
+    common.add_argument("--project-id",
+                        help="sync an existing gns3 project instead of "
+                        "creating a new one")
+    common.add_argument("--project-name", help="name of a new project")
+    common.add_argument("--cache-dir", help="where device data is cached")
+    common.add_argument("--cache-ttl", type=int,
+                        help="seconds before cached device data is stale")
+    common.add_argument("--cache-max-mb", type=int,
+                        help="size of the cache before old hosts are "
+                        "evicted")
+    common.add_argument("--refresh",
+                        help="comma separated hosts to rediscover, "
+                        "e.g. r1,r2")
+    common.add_argument("--offline", action="store_true",
+                        help="only use cached device data, however old")
+    common.add_argument("--profile", action="store_true",
+                        help="time every stage and write profile.json")
+    common.add_argument("--profile-stage",
+                        help="run cProfile on one stage, e.g. netmap, and "
+                        "write <stage>.pstats")
+    common.add_argument("--config-workers", type=int,
+                        help="processes generating configs, 0 is one per "
+                        "cpu")
+    common.add_argument("--output-dir",
+                        help="where the gns configs are written")
+    common.add_argument("--debug-configs", action="store_true",
+                        help="keep the intermediate configs in "
+                        "<output-dir>/debug")
+    common.add_argument("--no-build-cache", dest="build_cache",
+                        action="store_false",
+                        help="build and upload every config")
+    common.add_argument("--config-rules",
+                        help="yaml file with the config sections to keep "
+                        "per platform")
+    common.add_argument("--computes", type=compute_list,
+                        help="comma separated gns3 compute ids to spread "
+                        "the nodes over, e.g. gns1,gns2")
+    common.add_argument("--slice", type=name_list,
+                        help="only model these hosts and their "
+                        "neighbours, e.g. r1,r2")
+    common.add_argument("--slice-hops", type=int,
+                        help="how far from the --slice hosts to go")
+    common.add_argument("--slice-path", type=name_list,
+                        help="only model a shortest path between two "
+                        "hosts, e.g. r1,r9")
+    common.add_argument("--slice-groups", type=name_list,
+                        help="only model the hosts in these inventory "
+                        "groups")
+    common.add_argument("--boot-wave", type=int,
+                        help="how many nodes start before the load is "
+                        "checked again")
+    common.add_argument("--boot-workers", type=int,
+                        help="how many nodes boot at the same time")
+    common.add_argument("--boot-console", action="store_true",
+                        help="a node is only up when its console shows a "
+                        "prompt")
+    common.add_argument("--layout", choices=["force", "hierarchy", "random"],
+                        help="how nodes are placed on the canvas")
+
+    parser = argparse.ArgumentParser(
+        description="Create a GNS3 topology based on a live network")
+    sub = parser.add_subparsers(dest="command")
+    sub.required = True
+    sub.add_parser("discover", parents=[common],
+                   help="log into the devices and fill the cache")
+    sub.add_parser("plan", parents=[common],
+                   help="build the model and show what would be created")
+    build = sub.add_parser("build", parents=[common],
+                           help="build the model and the gns3 project")
+    build.add_argument("--plan-only", action="store_true",
+                       default=argparse.SUPPRESS,
+                       help="with --project-id, print the sync plan and "
+                       "stop")
+    build.add_argument("--no-upload", action="store_true",
+                       default=argparse.SUPPRESS,
+                       help="don't upload the startup configs")
+    build.add_argument("--pipeline", action="store_true",
+                       default=argparse.SUPPRESS,
+                       help="overlap discovery, node creation, configs, "
+                       "links and uploads per device")
+    build.add_argument("--boot", action="store_true",
+                       default=argparse.SUPPRESS,
+                       help="start the nodes in waves once the project is "
+                       "built")
+    build.add_argument("--resume", choices=BUILD_STAGES,
+                       default=argparse.SUPPRESS,
+                       help="start at this stage from the snapshot of the "
+                       "one before it")
+    sub.add_parser("upload", parents=[common],
+                   help="upload generated configs to an existing project")
+    sub.add_parser("slice", parents=[common],
+                   help="show the hosts a slice selects")
+    sub.add_parser("boot", parents=[common],
+                   help="start the nodes of an existing project in waves")
+    export = sub.add_parser("export", parents=[common],
+                            help="write a .gns3project file to import")
+    export.add_argument("output", help="the .gns3project file to write")
+    invalidate = sub.add_parser(
+        "invalidate", parents=[common],
+        help="drop built configs so they are built and uploaded again")
+    invalidate.add_argument("hosts", nargs="*",
+                            help="the hosts to drop, all of them if none")
+    return parser
+
+
+COMMANDS = {
+    "discover": cmd_discover,
+    "plan": cmd_plan,
+    "build": cmd_build,
+    "upload": cmd_upload,
+    "slice": cmd_slice,
+    "boot": cmd_boot,
+    "export": cmd_export,
+    "invalidate": cmd_invalidate,
+}
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    cfg = load_config(args)
+    if cfg.profile or cfg.profile_stage:
+        profiler.enable(cfg.profile_stage or None)
+    try:
+        COMMANDS[cfg.command](cfg)
+    finally:
+        if profiler.enabled:
+            profiler.print_report()
+            profiler.write_report(cfg.profile_report)
+
+
+if __name__ == "__main__":
+    main()
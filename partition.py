@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import collections
+
+
+'''
+Spreads the nodes of a big lab over several gns3 compute servers. Every
+node needs some RAM and CPU (from its template) and every compute has so
+much of both. The nodes are split so each compute gets a share of the lab
+in proportion to its size, while as few links as possible go between
+computes: gns3 makes those UDP tunnels between the servers.
+
+The partitioner works on the graph of the links (switches are nodes that
+cost nothing) in two steps:
+
+grow      the nodes are walked breadth first, so neighbours come one after
+          the other, and the walk is cut into one run per compute. each run
+          is a connected piece of the network.
+refine    boundary nodes move to the compute most of their neighbours are
+          on when that cuts links and both computes stay within imbalance
+          of their share, a few passes over the graph (greedy
+          Fiduccia-Mattheyses).
+
+Both steps are linear in the number of links, 10k nodes take well under a
+second.
+
+A node's RAM (MB) and CPUs are the ram and cpus of its template, the ones
+that don't say (iou has no cpus, vpcs neither) get DEFAULT_RAM_MB and one
+CPU.
+'''
+
+
+DEFAULT_RAM_MB = 256
+
+
+def template_demand(template):
+    return (template.get("ram") or DEFAULT_RAM_MB, template.get("cpus") or 1)
+
+
+# a node's share of the whole lab, ram and cpu weighted the same
+
+def node_size(demand, total):
+    return sum(x / t for x, t in zip(demand, total) if t)
+
+
+def neighbours(names, edges):
+    adj = dict((name, []) for name in names)
+    for a, b in edges:
+        if a in adj and b in adj:
+            adj[a].append(b)
+            adj[b].append(a)
+    return adj
+
+
+# breadth first from the lowest degree node of each component, components
+# one after the other
+
+def bfs_order(names, adj):
+    seen = set()
+    order = []
+    for start in sorted(names, key=lambda x: (len(adj[x]), x)):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = collections.deque([start])
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for x in adj[name]:
+                if x not in seen:
+                    seen.add(x)
+                    queue.append(x)
+    return order
+
+
+def cut_links(edges, parts):
+    return sum(1 for a, b in edges if parts[a] != parts[b])
+
+
+# names and edges are the graph, demand is name -> (ram, cpus) and
+# capacity a (ram, cpus) per compute. fixed is name -> compute index for
+# nodes that can't move, e.g. ones already in the project. returns name ->
+# compute index
+
+def partition(names, edges, demand, capacity, fixed=None, passes=8,
+              imbalance=0.05):
+    fixed = fixed or {}
+    adj = neighbours(names, edges)
+    dims = len(capacity[0])
+    need = [sum(demand[x][d] for x in names) for d in range(dims)]
+    have = [sum(c[d] for c in capacity) for d in range(dims)]
+
+    # each compute keeps within the imbalance of its share of the lab,
+    # above it and below it
+
+    upper = []
+    lower = []
+    for cap in capacity:
+        share = [cap[d] * need[d] / have[d] if have[d] else 0
+                 for d in range(dims)]
+        upper.append([x * (1 + imbalance) for x in share])
+        lower.append([x * (1 - imbalance) for x in share])
+    load = [[0.0] * dims for _ in capacity]
+    parts = {}
+
+    def place(name, part):
+        parts[name] = part
+        for d in range(dims):
+            load[part][d] += demand[name][d]
+
+    for name, part in fixed.items():
+        if name in adj:
+            place(name, part)
+
+    # grow: cut the walk into runs, a compute takes nodes until it has its
+    # share of the lab
+
+    share = [node_size(cap, have) / dims for cap in capacity]
+    total = sum(node_size(demand[x], have) for x in names) or 1
+    filled = [0.0] * len(capacity)
+    for name, part in parts.items():
+        filled[part] += node_size(demand[name], have) / total
+    part = 0
+    for name in bfs_order(names, adj):
+        if name in parts:
+            continue
+        size = node_size(demand[name], have) / total
+        while part < len(capacity) - 1 and filled[part] + size / 2 > \
+                share[part]:
+            part += 1
+        place(name, part)
+        filled[part] += size
+
+    # refine: move boundary nodes to the compute most of their neighbours
+    # are on if it cuts links, fits there and doesn't leave its own compute
+    # short of its share
+
+    def fits(name, own, part):
+        return all(load[part][d] + demand[name][d] <= upper[part][d] + 1e-9
+                   and load[own][d] - demand[name][d] >= lower[own][d] - 1e-9
+                   for d in range(dims) if demand[name][d])
+
+    for _ in range(passes):
+        moved = 0
+        for name in names:
+            if name in fixed or not adj[name]:
+                continue
+            own = parts[name]
+            counts = collections.Counter(parts[x] for x in adj[name])
+            best, count = max(counts.items(), key=lambda x: (x[1], -x[0]))
+            if best == own or count <= counts.get(own, 0):
+                continue
+            if not fits(name, own, best):
+                continue
+            for d in range(dims):
+                load[own][d] -= demand[name][d]
+            place(name, best)
+            moved += 1
+        if not moved:
+            break
+    return parts
+
+
+# nodes, ram and cpus that went on each compute, for the report
+
+def compute_loads(parts, demand, count):
+    loads = [[0, 0.0, 0.0] for _ in range(count)]
+    for name, part in parts.items():
+        loads[part][0] += 1
+        loads[part][1] += demand[name][0]
+        loads[part][2] += demand[name][1]
+    return loads
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+
+import collections
+import copy
+import functools
+import os
+
+from cache import DiscoveryCache
+from collect import Collector
+from collect import nornir_hosts
+from gnsmodel import Node
+from gnsmodel import Switch
+from scheduler import Scheduler
+from timing import profiler
+
+import netmodel
+
+
+'''
+netmodel build with the stages overlapped (--pipeline). Every device goes
+through its own chain of tasks instead of waiting for the slowest device of
+each stage:
+
+    fetch -> parse -> create node ----------------> | model | -> move node
+                   -> config, once its ports -----> |       | -> link
+                      are known                     |       | -> upload
+
+The gns3 project and the ssh login for the uploads are started with the
+fetches. While devices are still being fetched a router is created as soon
+as it is parsed when its template is certain, i.e. the smallest template
+has a port for every interface that could be modeled. Its ports are known
+once every such interface is on a network another device is on too, then
+its config is generated. Neither needs the slowest device.
+
+model is what the rest waits for: which networks are modeled, the
+switches, the links and the layout need every device, so the model is
+built once all the fetches have finished, failed or timed out. The routers
+created before are then moved to their spot of the layout, and a config
+generated before whose ports turned out different is generated again.
+From there every node, config, link and upload goes as soon as what it
+needs is done. A sync of an existing project, a slice and a build on
+several computes need the model to know which nodes to create where, so
+they create and configure everything after it.
+
+The stage limits come from the usual settings (collect_workers,
+gns_workers, config_workers, sftp_channels) and stage_workers can set any
+of them, e.g. {"links": 16}. The project that comes out is the one the
+sequential build makes: the same nodes, ports, links and configs.
+'''
+
+
+def stage_limits(cfg):
+    limits = {
+        "project": 1,
+        "connect": 1,
+        "fetch": cfg.collect_workers,
+        "parse": 1,
+        "model": 1,
+        "create": cfg.gns_workers,
+        "config": netmodel.config_workers(cfg),
+        "links": cfg.gns_workers,
+        "upload": cfg.sftp_channels,
+    }
+    limits.update(cfg.stage_workers or {})
+    return limits
+
+
+class PipelinedBuild():
+
+    def __init__(self, cfg):
+        from gnsproject import GnsClient
+
+        self.cfg = cfg
+        self.limits = stage_limits(cfg)
+        self.cache = DiscoveryCache(cfg.cache_dir, ttl=cfg.cache_ttl,
+                                    max_bytes=cfg.cache_max_mb * 1024 * 1024)
+        self.collector = Collector(workers=self.limits["fetch"],
+                                   connect_timeout=cfg.connect_timeout,
+                                   command_timeout=cfg.command_timeout)
+
+        # config generation is in worker processes like add_node_cfg, with
+        # one worker it runs in a thread here
+
+        executors = {}
+        if self.limits["config"] > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            executors["config"] = ProcessPoolExecutor(
+                max_workers=self.limits["config"])
+        self.sched = Scheduler(self.limits, executors,
+                               {"fetch": self.collector.deadline()})
+        self.gns = GnsClient(
+            cfg.gns_server, use_templates=cfg.gns_templates,
+            workers=self.limits["create"] + self.limits["links"])
+
+        self.p_id = cfg.project_id
+        self.allocator = netmodel.port_allocator(cfg)
+        self.filter = netmodel.prefix_filter(cfg)
+        self.rules = netmodel.config_rules(cfg)
+        self.builds = netmodel.build_cache(cfg)
+        self.keys = {}
+
+        # what is done before the model: the number of interfaces on each
+        # network, the parsed routers whose ports aren't known yet, the
+        # build key of the configs generated early, and the routers
+        # created early, with their gns3 data once they are
+
+        self.early_configs = not netmodel.has_slice(cfg)
+        self.early_nodes = self.early_configs and not (
+            cfg.project_id or cfg.computes)
+        self.members = collections.Counter()
+        self.users = {}
+        self.unresolved = set()
+        self.early = {}
+        self.early_results = {}
+        self.accepted = {}
+        self.config_tasks = {}
+        self.placed = set()
+        self.created = {}
+        self.hosts = 0
+        self.uploader = None
+        self.router_get = {}
+        self.order = []
+        self.nodes = {}
+        self.model = None
+        self.new_nodes = set()
+        self.config_failures = {}
+        self.links = []
+        self.uploads = {}
+        self.failed = 0
+
+    def run(self):
+        with profiler.stage("pipeline"):
+            if not self.p_id:
+                self.sched.add("project", "project", self.gns.create_project,
+                               self.cfg.project_name, done=self.set_project)
+            if not self.cfg.no_upload:
+                self.sched.add("connect", "connect", self.connect,
+                               done=self.set_uploader)
+            self.sched.add("model", "model", self.build_model,
+                           after=self.discover(), done=self.provision)
+            try:
+                self.sched.run()
+            finally:
+                if self.uploader is not None:
+                    self.uploader.close()
+                if self.builds is not None:
+                    self.builds.save()
+        self.failed = len(self.report())
+        if self.model is not None:
+            self.save_snapshots()
+        return self.model
+
+    # the stages overlap, so the snapshots of the later stages are all the
+    # finished model. a failed upload resumes with build --resume upload,
+    # a failed boot with build --resume boot. the layout one gets the
+    # project too, build --resume nodes syncs it instead of making another
+
+    def save_snapshots(self):
+        store = netmodel.snapshot_store(self.cfg)
+        if store is None:
+            return
+        self.model["project_id"] = self.p_id
+        self.model["project_name"] = self.cfg.project_name
+        with profiler.stage("snapshot"):
+            for stage in ("layout", "nodes", "config", "links", "upload"):
+                store.save(stage, self.model)
+
+    # the devices in the cache go straight to parse, the others are fetched
+    # first. returns the parse tasks, the model waits for all of them. a
+    # slice is found in the topology of the last build, the fetches all go
+    # at once so there is no crawl
+
+    def discover(self):
+        cfg = self.cfg
+        self.cache.invalidate([x for x in cfg.refresh.split(",") if x])
+        wanted = netmodel.discovery_slice(cfg)
+        if cfg.offline:
+            parse = [self.add_result(x, self.cache.get(x, ttl=None))
+                     for x in sorted(self.cache.index)
+                     if wanted is None or x in wanted]
+            print("Using cached data for {} hosts".format(len(parse)))
+            self.hosts = len(parse)
+            return parse
+
+        from nornir.core import InitNornir
+        nr = InitNornir()
+        fetch = []
+        parse = []
+        for host in nornir_hosts(nr):
+            if wanted is not None and host["name"] not in wanted:
+                continue
+            result = self.cache.get(host["name"], host["hostname"])
+            if result is None:
+                fetch.append(host)
+            else:
+                parse.append(self.add_result(host["name"], result))
+        print("Using cached data for {} hosts".format(len(parse)))
+
+        # hosts that fail are left out and listed in the failure report
+
+        for host in fetch:
+            fetch_task = self.sched.add(
+                "fetch:" + host["name"], "fetch", self.collector.fetch, host,
+                done=functools.partial(self.fetched, host))
+            parse.append(self.sched.add(
+                "parse:" + host["name"], "parse", self.create_node,
+                host["name"], deps=[fetch_task], done=self.parsed))
+        self.hosts = len(parse)
+        return parse
+
+    def add_result(self, name, result):
+        self.router_get[name] = result
+        self.order.append(name)
+        return self.sched.add("parse:" + name, "parse", self.create_node,
+                              name, done=self.parsed)
+
+    def create_node(self, name):
+        return netmodel.create_node(name, self.router_get[name])
+
+    # a fetched host goes in the cache and after the cached hosts in the
+    # order it answered, the order discover gives the sequential build
+
+    def fetched(self, host, result):
+        result["platform"] = host["platform"]
+        self.router_get[host["name"]] = result
+        self.order.append(host["name"])
+        self.cache.put(host["name"], result, host["hostname"])
+
+    # counts the interfaces on each network that could be modeled. a router
+    # whose interfaces all share a network with another one has the ports
+    # it will keep, its config can be generated. a new network member can
+    # do that for the routers already on the network
+
+    def parsed(self, gns_node):
+        name = gns_node.name
+        self.nodes[name] = gns_node
+        if not self.early_configs:
+            return
+        grown = set()
+        for intf in self.candidates(gns_node):
+            for key in set(x for x in intf.keys if self.filter(x)):
+                self.members[key] += 1
+                self.users.setdefault(key, []).append(name)
+                if self.members[key] == 2:
+                    grown.add(key)
+        self.create_early(gns_node)
+        self.unresolved.add(name)
+        for other in set([name]).union(*(self.users[x] for x in grown)):
+            if other in self.unresolved and self.resolved(other):
+                self.unresolved.discard(other)
+                self.configure_early(self.nodes[other])
+
+    # the interfaces that are kept if their network has another device,
+    # the others are pruned whatever happens
+
+    def candidates(self, gns_node):
+        return [x for x in gns_node.interfaces
+                if any(self.filter(k) for k in x.keys)]
+
+    def resolved(self, name):
+        return all(any(self.members[k] >= 2 for k in x.keys if self.filter(k))
+                   for x in self.candidates(self.nodes[name]))
+
+    # only while devices are still being fetched, once they are all in the
+    # model comes as soon and the router doesn't have to be moved. it goes
+    # to its place in the layout when the model is there by the time it is
+    # created, otherwise it is moved there after the model
+
+    def create_early(self, gns_node):
+        if not self.early_nodes or (
+                len(self.router_get) + len(self.sched.failures) >=
+                self.hosts):
+            return
+        try:
+            template, _ = self.allocator.choose(0)
+            largest, _ = self.allocator.choose(
+                len(self.candidates(gns_node)))
+        except ValueError:
+            return
+        if template != largest:
+            return
+        self.placed.add(gns_node.name)
+        self.sched.add("create:" + gns_node.name, "create", self.create_router,
+                       gns_node.name, template, deps=["project"],
+                       done=functools.partial(self.created_early, gns_node))
+
+    def create_router(self, name, template):
+        x, y = 0, 0
+        model = self.model
+        if model is not None:
+            x, y = model["positions"].get(name, (0, 0))
+        return self.gns.create_node(self.p_id, template, name, x, y)
+
+    def created_early(self, gns_node, result):
+        self.created[gns_node.name] = result
+        if self.model is not None:
+            netmodel.add_gns_node_info(gns_node, result)
+
+    # the config of a copy of the router with the ports it will have, the
+    # model checks them with the build key before it takes the config
+
+    def configure_early(self, gns_node):
+        from configgen import build_key
+
+        kept = [x for x in gns_node.interfaces
+                if any(self.members[k] >= 2 for k in x.keys if self.filter(k))]
+        node = Node(gns_node.name, [copy.copy(x) for x in kept])
+        try:
+            self.allocator.allocate(node)
+        except ValueError:
+            return
+        job, = netmodel.config_jobs(self.router_get, [node],
+                                    self.cfg.debug_configs, self.rules)
+        key = build_key(node, job[1], job[3])
+        if (self.builds is not None and not job[2] and
+                self.builds.artifact(node.name, key) is not None):
+            return
+        self.early[node.name] = key
+        self.sched.add("config:" + node.name, "config", netmodel.config_job,
+                       job, done=functools.partial(self.configured_early,
+                                                   node.name))
+
+    def configured_early(self, name, result):
+        self.early_results[name] = result
+        job = self.accepted.pop(name, None)
+        if job is not None:
+            self.configured(job, result)
+
+    def set_project(self, p_id):
+        self.p_id = p_id
+
+    def connect(self):
+        from upload import Uploader
+        return Uploader(self.cfg.gns_server.split(":")[0], self.cfg.ssh_user,
+                        self.cfg.ssh_pass, channels=self.limits["upload"],
+                        manifest=netmodel.upload_manifest(self.cfg))
+
+    def set_uploader(self, uploader):
+        self.uploader = uploader
+
+    # the barrier: every device has been fetched and parsed or has failed
+
+    def build_model(self):
+        cfg = self.cfg
+        for name, error in list(self.sched.failures.items()):
+            if name.startswith("fetch:"):
+                self.collector.failures[name[6:]] = error
+        self.collector.print_failure_report(cfg.failure_report)
+        self.cache.save()
+
+        router_get = dict((x, self.router_get[x]) for x in self.order
+                          if x in self.nodes)
+        model = netmodel.build_model(
+            router_get, self.allocator, self.filter,
+            [self.nodes[x] for x in router_get])
+        router_get, model = netmodel.slice_model(cfg, router_get, model)
+        model["positions"] = netmodel.place_nodes(cfg, model)
+        model["router_get"] = router_get
+
+        # an existing project is synced, only what is missing gets created
+
+        model["new_links"] = None
+        model["computes"] = {}
+        new_nodes = model["gns_node_list"] + model["switches"]
+        if cfg.project_id:
+            new_nodes, new_switches, model["new_links"] = (
+                netmodel.sync_project(cfg, self.gns, cfg.project_id, model))
+            new_nodes = new_nodes + new_switches
+        model["new_nodes"] = set(x.name for x in new_nodes)
+        model["computes"].update(netmodel.place_computes(
+            cfg, self.gns, model, model["computes"]))
+        return model
+
+    # runs in the scheduler thread once the model is built and adds the
+    # tasks of every node, link and upload that didn't start before
+
+    def provision(self, model):
+        from configgen import build_key
+
+        cfg = self.cfg
+        self.model = model
+        store = netmodel.snapshot_store(cfg)
+        if store is not None:
+            with profiler.stage("snapshot"):
+                store.save("model", model)
+                store.save("layout", model)
+
+        # build_model gave every router a startup config name, the routers
+        # created already have theirs from gns3
+
+        for name, result in self.created.items():
+            netmodel.add_gns_node_info(self.nodes[name], result)
+        project = [] if cfg.project_id else ["project"]
+        self.new_nodes = model["new_nodes"]
+        for node in model["gns_node_list"] + model["switches"]:
+            if node.name not in self.new_nodes:
+                continue
+            if node.name in self.placed:
+                self.sched.add("move:" + node.name, "create", self.move_node,
+                               node, deps=["create:" + node.name])
+            else:
+                self.sched.add("create:" + node.name, "create",
+                               self.create_gns_node, node, deps=project)
+
+        # an early config is taken when the router got the ports it was
+        # generated with, the others are generated now
+
+        os.makedirs(cfg.output_dir, exist_ok=True)
+        jobs = []
+        for job in netmodel.config_jobs(
+                model["router_get"], model["gns_node_list"],
+                cfg.debug_configs, self.rules):
+            name = job[0].name
+            if self.early.get(name) == build_key(job[0], job[1], job[3]):
+                self.keys[name] = self.early[name]
+                self.config_tasks[name] = "config:" + name
+                if name in self.early_results:
+                    self.configured(job, self.early_results[name])
+                else:
+                    self.accepted[name] = job
+            else:
+                jobs.append(job)
+        if self.builds is not None:
+            jobs, keys = netmodel.reuse_configs(
+                jobs, self.builds, cfg.output_dir)
+            self.keys.update(keys)
+        for job in jobs:
+            name = job[0].name
+            task = ("reconfig:" if name in self.early else "config:") + name
+            self.config_tasks[name] = task
+            self.sched.add(task, "config", netmodel.config_job, job,
+                           done=functools.partial(self.configured, job))
+
+        for num, ends in enumerate(netmodel.links_to_create(
+                model["links"], model["new_links"])):
+            self.sched.add("link:" + str(num), "links", self.create_link,
+                           ends, deps=project + self.creates(ends),
+                           done=self.links.append)
+
+        # a node that is already in the project with a config from the
+        # build cache that went up last time has nothing to upload
+
+        if not cfg.no_upload:
+            for gns_node in model["gns_node_list"]:
+                deps = ["connect"] + self.creates([(gns_node, None, None)])
+                if gns_node.name in self.config_tasks:
+                    deps.append(self.config_tasks[gns_node.name])
+                elif len(deps) == 1 and self.upload_file(gns_node) is None:
+                    profiler.count("uploads_reused")
+                    continue
+                self.sched.add(
+                    "upload:" + gns_node.name, "upload", self.upload,
+                    gns_node, deps=deps,
+                    done=functools.partial(self.uploaded, gns_node))
+
+    # the create tasks a link or upload has to wait for, nodes that are
+    # already in the project have none
+
+    def creates(self, ends):
+        return ["create:" + x.name for x, _, _ in ends
+                if x.name in self.new_nodes]
+
+    def create_gns_node(self, node):
+        x, y = self.model["positions"].get(node.name, (0, 0))
+        compute_id = self.model["computes"].get(node.name, "local")
+        if isinstance(node, Switch):
+            result = self.gns.create_switch(self.p_id, node.name, node.ports,
+                                            x, y, compute_id)
+            node.add_id(result["node_id"])
+            return result
+        result = self.gns.create_node(
+            self.p_id, node.template or self.cfg.app_id, node.name, x, y,
+            compute_id)
+        netmodel.add_gns_node_info(node, result)
+        return result
+
+    def move_node(self, node):
+        x, y = self.model["positions"].get(node.name, (0, 0))
+        created = self.created[node.name]
+        if (created.get("x"), created.get("y")) == (x, y):
+            return created
+        return self.gns.move_node(self.p_id, node.id, x, y)
+
+    def configured(self, job, result):
+        from configgen import write_config
+
+        gns_node, config, debug, _ = job
+        gns_config, steps, seconds, error = result
+        if error:
+            self.config_failures[gns_node.name] = error
+            return
+        gns_node.add_config(write_config(
+            self.cfg.output_dir, gns_node.name, gns_config,
+            config if debug else None, steps))
+        if self.builds is not None:
+            self.builds.add_artifact(gns_node.name, self.keys[gns_node.name],
+                                     gns_config)
+
+    def create_link(self, ends):
+        return self.gns.create_link(self.p_id, netmodel.create_gns_link(ends))
+
+    # the (local, remote, digest) of the config to upload, None when there
+    # is none or the build cache has it on the server already
+
+    def upload_file(self, gns_node):
+        from cache import file_digest
+
+        files = netmodel.node_files([gns_node])
+        if not files:
+            return None
+        local, remote = files[0]
+        digest = None
+        if self.builds is not None:
+            digest = file_digest(local)
+            if self.builds.uploaded(gns_node.name, remote, digest):
+                return None
+        return local, remote, digest
+
+    def upload(self, gns_node):
+        upload = self.upload_file(gns_node)
+        if upload is None:
+            return None
+        local, remote, digest = upload
+        result = self.uploader.upload(local, remote)
+        if result["error"]:
+            raise IOError(result["error"])
+        return result, digest
+
+    def uploaded(self, gns_node, result):
+        if result is None:
+            return
+        result, digest = result
+        self.uploads[gns_node.name] = result
+        if self.builds is not None:
+            self.builds.add_upload(gns_node.name, result["remote"], digest)
+
+    def report(self):
+        from upload import print_upload_report
+
+        netmodel.print_config_failures(self.config_failures)
+        for link in self.links:
+            print(link)
+        if self.uploads and self.model is not None:
+            print_upload_report([self.uploads[x.name]
+                                 for x in self.model["gns_node_list"]
+                                 if x.name in self.uploads])
+        problems = dict(
+            (k, v) for k, v in self.sched.failures.items()
+            if not k.startswith("fetch:"))
+        problems.update(self.sched.skipped)
+        if problems:
+            print("These tasks didn't run to the end:")
+            for name, reason in sorted(problems.items()):
+                print("  {}: {}".format(name, reason))
+        return problems
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+
+'''
+Gives every interface we model a gns3 adapter, port and interface name.
+The layout of each template (how many adapters, how many ports on each and
+what the router calls them) comes from the gns3 template or appliance
+data, so a node can use every port its template has. With more than one
+template each node gets the smallest template its interfaces fit on.
+
+Example of a layout, one (adapter, port, name) tuple per usable port:
+[(1, 0, "Ethernet1/0"), (1, 1, "Ethernet1/1"), (1, 2, "Ethernet1/2"), ...]
+'''
+
+
+IOU_PORTS = 4
+
+# ports on the dynamips adapters we know about
+
+DYNAMIPS_PORTS = {
+    "C7200-IO-FE": 1,
+    "C7200-IO-2FE": 2,
+    "C7200-IO-GE-E": 1,
+    "PA-FE-TX": 1,
+    "PA-2FE-TX": 2,
+    "PA-GE": 1,
+    "PA-4E": 4,
+    "PA-8E": 8,
+    "NM-1FE-TX": 1,
+    "NM-1E": 1,
+    "NM-4E": 4,
+    "NM-16ESW": 16,
+    "GT96100-FE": 2,
+    "Leopard-2FE": 2,
+    "C1700-MB-1FE": 1,
+    "C2600-MB-1E": 1,
+    "C2600-MB-2E": 2,
+    "C2600-MB-1FE": 1,
+    "C2600-MB-2FE": 2,
+    "C3600-MB-1FE": 1,
+}
+
+
+def dynamips_intf_type(adapter):
+    if "GE" in adapter:
+        return "GigabitEthernet"
+    if "FE" in adapter or "ESW" in adapter:
+        return "FastEthernet"
+    return "Ethernet"
+
+
+# gns3 names qemu ports with port_name_format, e.g. "Gi0/{0}" or
+# "Ethernet{segment0}/{port0}"
+
+def qemu_port_name(props, adapter):
+    if adapter == 0 and props.get("first_port_name"):
+        return props["first_port_name"]
+    fmt = props.get("port_name_format") or "Ethernet{0}"
+    segment_size = props.get("port_segment_size") or 0
+    port = adapter
+    segment = 0
+    if segment_size:
+        segment = adapter // segment_size
+        port = adapter % segment_size
+    return fmt.format(port, segment, port0=port, port1=port + 1,
+                      segment0=segment, segment1=segment + 1)
+
+
+# template is the gns3 template (2.2) or appliance (2.1) data. adapters
+# below first_adapter are left alone, adapter 0 is usually management
+
+def template_layout(template, first_adapter=1):
+    props = template.get("properties", template)
+    node_type = template.get("template_type") or template.get("node_type")
+    layout = []
+    if node_type == "iou":
+        for adapter in range(first_adapter, props.get("ethernet_adapters", 2)):
+            for port in range(IOU_PORTS):
+                layout.append((adapter, port,
+                               "Ethernet{}/{}".format(adapter, port)))
+    elif node_type == "qemu":
+        for adapter in range(first_adapter, props.get("adapters", 1)):
+            layout.append((adapter, 0, qemu_port_name(props, adapter)))
+    elif node_type == "dynamips":
+        for slot in range(first_adapter, 7):
+            adapter = props.get("slot" + str(slot))
+            if not adapter:
+                continue
+            intf_type = dynamips_intf_type(adapter)
+            for port in range(DYNAMIPS_PORTS.get(adapter, 0)):
+                layout.append((slot, port,
+                               "{}{}/{}".format(intf_type, slot, port)))
+    else:
+        raise ValueError("can't allocate ports on a {} template".format(
+            node_type))
+    return layout
+
+
+class PortAllocator():
+
+    # layouts is a dict of template id -> layout, templates is a dict of
+    # template id -> the gns3 template data the layout came from
+
+    def __init__(self, layouts, templates=None):
+        self.layouts = sorted(layouts.items(), key=lambda x: len(x[1]))
+        self.templates = templates or {}
+
+    # the smallest template with enough ports
+
+    def choose(self, count):
+        for template_id, layout in self.layouts:
+            if len(layout) >= count:
+                return template_id, layout
+        raise ValueError(
+            "no template has {} ports, the largest has {}".format(
+                count, len(self.layouts[-1][1])))
+
+    def allocate(self, gns_node):
+        template_id, layout = self.choose(len(gns_node.interfaces))
+        gns_node.add_template(template_id)
+        for intf, port_info in zip(gns_node.interfaces, layout):
+            intf.add_port(*port_info)
+
+
+# the ports_mapping of a gns3 ethernet switch with count access ports in
+# vlan 1
+
+def switch_ports(count):
+    return [{"name": "Ethernet" + str(port), "port_number": port,
+             "type": "access", "vlan": 1, "ethertype": ""}
+            for port in range(count)]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import collections
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from timing import profiler
+from workers import DaemonPool
+
+
+'''
+Runs tasks as soon as what they depend on is done instead of stage by
+stage. Every task belongs to a stage and every stage has its own pool:
+
+    sched = Scheduler({"fetch": 20, "create": 8, "upload": 4})
+    sched.add("fetch:r1", "fetch", fetch, host)
+    sched.add("create:r1", "create", create, "r1", deps=["fetch:r1"])
+    sched.run()
+
+A stage limits how many of its tasks run at the same time, ready tasks
+beyond that wait their turn in the order they became ready. deps have to
+succeed, a task whose dep failed is skipped. after only has to be finished,
+that is how a task waits for every device whatever happened to them. done
+is called with the result in the thread running the scheduler, it can add
+more tasks, so state that isn't thread safe is only touched there. A stage
+can also be given its own executor, e.g. a process pool.
+
+A stage with a deadline gives up on tasks that run longer than it, their
+thread is left to finish on its own like the collector does. The stages
+run on daemon threads (workers.py) so such a task doesn't keep the program
+from exiting.
+'''
+
+
+class Task():
+
+    __slots__ = ("name", "stage", "func", "args", "deps", "done", "pending",
+                 "started")
+
+    def __init__(self, name, stage, func, args, deps, done):
+        self.name = name
+        self.stage = stage
+        self.func = func
+        self.args = args
+        self.deps = set(deps)
+        self.done = done
+        self.pending = 0
+        self.started = None
+
+
+class Scheduler():
+
+    def __init__(self, limits, executors=None, deadlines=None):
+        self.limits = dict((k, max(1, v)) for k, v in limits.items())
+        self.executors = dict(executors or {})
+        for stage, workers in self.limits.items():
+            if stage not in self.executors:
+                self.executors[stage] = DaemonPool(workers)
+        self.deadlines = deadlines or {}
+        self.waiting = {}
+        self.dependents = {}
+        self.ready = dict((x, collections.deque()) for x in self.limits)
+        self.active = dict((x, 0) for x in self.limits)
+        self.running = {}
+        self.results = {}
+        self.failures = {}
+        self.skipped = {}
+
+    def finished(self, name):
+        return (name in self.results or name in self.failures or
+                name in self.skipped)
+
+    # a task waits for the tasks in deps and after that haven't finished
+    # yet, each of them counts it down when it does
+
+    def add(self, name, stage, func, *args, deps=(), after=(), done=None):
+        if stage not in self.limits:
+            raise ValueError("no limit for stage " + stage)
+        task = Task(name, stage, func, args, deps, done)
+        self.waiting[name] = task
+        failed = [x for x in deps if x in self.failures or x in self.skipped]
+        if failed:
+            self.skip(task, failed[0])
+            return name
+        for dep in set(deps) | set(after):
+            if not self.finished(dep):
+                task.pending += 1
+                self.dependents.setdefault(dep, []).append(task)
+        if task.pending == 0:
+            self.ready[stage].append(task)
+        return name
+
+    def skip(self, task, dep):
+        del self.waiting[task.name]
+        self.skipped[task.name] = "needs " + dep
+        self.release(task.name)
+
+    # a task has finished, count down the tasks waiting on it. if it didn't
+    # succeed the ones that need it are skipped, and the ones that need
+    # those
+
+    def release(self, name):
+        ok = name in self.results
+        for task in self.dependents.pop(name, ()):
+            if task.name not in self.waiting:
+                continue
+            if not ok and name in task.deps:
+                self.skip(task, name)
+                continue
+            task.pending -= 1
+            if task.pending == 0:
+                self.ready[task.stage].append(task)
+
+    # ready tasks are held here rather than queued in the pools, so a stage
+    # never has more than its limit submitted and a task's time, the one
+    # checked against the deadline, starts when it really starts
+
+    def submit(self):
+        for stage, ready in self.ready.items():
+            while ready and self.active[stage] < self.limits[stage]:
+                task = ready.popleft()
+                if self.waiting.pop(task.name, None) is None:
+                    continue
+                task.started = time.monotonic()
+                future = self.executors[stage].submit(task.func, *task.args)
+                self.running[future] = task
+                self.active[stage] += 1
+
+    def complete(self, task, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.failures[task.name] = "{}: {}".format(type(e).__name__, e)
+        else:
+            self.results[task.name] = result
+            profiler.add_device(task.stage, task.name,
+                                time.monotonic() - task.started)
+            if task.done is not None:
+                task.done(result)
+        self.release(task.name)
+
+    # a task that ran past its stage deadline is given up on
+
+    def expire(self):
+        now = time.monotonic()
+        for future, task in list(self.running.items()):
+            deadline = self.deadlines.get(task.stage)
+            if deadline is not None and now - task.started > deadline:
+                executor = self.executors[task.stage]
+                if isinstance(executor, DaemonPool):
+                    executor.abandon(future)
+                else:
+                    future.cancel()
+                del self.running[future]
+                self.active[task.stage] -= 1
+                self.failures[task.name] = "timed out after {}s".format(
+                    deadline)
+                self.release(task.name)
+
+    def run(self):
+        try:
+            self.submit()
+            while self.running:
+                done, _ = wait(self.running, timeout=1,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = self.running.pop(future)
+                    self.active[task.stage] -= 1
+                    self.complete(task, future)
+                self.expire()
+                self.submit()
+
+            # tasks that wait on a task that was never added
+
+            for name in list(self.waiting):
+                self.skipped[name] = "needs a task that doesn't exist"
+            self.waiting = {}
+        finally:
+            for executor in set(self.executors.values()):
+                executor.shutdown(wait=False)
+        return self.results
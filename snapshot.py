@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import gc
+import json
+import os
+import time
+import zlib
+
+from gnsmodel import Interface
+from gnsmodel import Node
+from gnsmodel import Switch
+
+
+'''
+Snapshots of the model a build has made so far, one file per stage in the
+snapshot directory. A build that fails part way, e.g. when the sftp connect
+fails at upload, can be resumed from that stage without discovering or
+creating anything again:
+
+    python3 netmodel.py build --resume upload
+
+The snapshot is the node list from create_node_list with its interfaces,
+the netlist, netmap, subnet index, switches and links of build_model, and
+whatever the later stages added: the hosts of a slice, positions, the
+compute of every node, the project id, gns node ids and directories and the
+config files. Objects are written column by column (a list per attribute)
+and point at each other by position, so a 10k node model is a few flat
+lists of numbers and strings. The json is compressed with zlib.
+
+Example of the node columns:
+{"name": ["r1", "r2"], "id": ["4d1f...", "9a0c..."], "interfaces": [2, 3],
+ ...}
+
+VERSION changes whenever the layout of the file does, an older snapshot is
+refused instead of being read wrong.
+'''
+
+
+VERSION = 1
+
+NODE_FIELDS = ("name", "id", "dir", "startup", "config", "template")
+INTF_FIELDS = ("name", "ip", "prefix", "version", "secondary", "adapter",
+               "port", "gns_name")
+SWITCH_FIELDS = ("name", "ports", "id")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def columns(objects, fields):
+    return dict((field, [getattr(x, field) for x in objects])
+                for field in fields)
+
+
+# builds the objects without __init__, the values are already in the form
+# the slots hold
+
+def rows(cls, data, fields):
+    objects = []
+    for values in zip(*[data[x] for x in fields]):
+        obj = cls.__new__(cls)
+        for field, value in zip(fields, values):
+            setattr(obj, field, value)
+        objects.append(obj)
+    return objects
+
+
+def encode_model(model):
+    gns_node_list = model["gns_node_list"]
+    switches = model["switches"]
+    intfs = [i for x in gns_node_list for i in x.interfaces]
+    node_pos = dict((id(x), n) for n, x in enumerate(gns_node_list))
+    intf_pos = dict((id(x), n) for n, x in enumerate(intfs))
+    switch_pos = dict((id(x), n) for n, x in enumerate(switches))
+
+    # a link end is [0, node, adapter, port] or [1, switch, adapter, port]
+
+    def end(obj, adapter, port):
+        if id(obj) in node_pos:
+            return [0, node_pos[id(obj)], adapter, port]
+        return [1, switch_pos[id(obj)], adapter, port]
+
+    nodes = columns(gns_node_list, NODE_FIELDS)
+    nodes["interfaces"] = [len(x.interfaces) for x in gns_node_list]
+    data = {
+        "nodes": nodes,
+        "interfaces": columns(intfs, INTF_FIELDS),
+        "switches": columns(switches, SWITCH_FIELDS),
+        "netlist": model["netlist"],
+        "netmap": {
+            "name": [x["name"] for x in model["netmap"]],
+            "id": [x["id"] for x in model["netmap"]],
+            "nodes": [[node_pos[id(n)] for n in x["nodes"]]
+                      for x in model["netmap"]],
+        },
+        "subnet_index": {
+            "keys": list(model["subnet_index"]),
+            "interfaces": [[intf_pos[id(i)] for _, i in x]
+                           for x in model["subnet_index"].values()],
+        },
+        "links": [[end(*x) for x in ends] for ends in model["links"]],
+    }
+    if model.get("positions") is not None:
+        names = sorted(model["positions"])
+        data["positions"] = {
+            "name": names,
+            "x": [model["positions"][x][0] for x in names],
+            "y": [model["positions"][x][1] for x in names]}
+    data["new_links"] = None
+    if model.get("new_links") is not None:
+        data["new_links"] = [sorted(x) for x in model["new_links"]]
+    data["computes"] = model.get("computes")
+    data["slice"] = model.get("slice")
+    data["project_id"] = model.get("project_id")
+    data["project_name"] = model.get("project_name")
+    return data
+
+
+def decode_model(data):
+    gns_node_list = rows(Node, data["nodes"], NODE_FIELDS)
+    intfs = rows(Interface, data["interfaces"], INTF_FIELDS)
+    switches = rows(Switch, data["switches"], SWITCH_FIELDS)
+
+    # json has no tuples, the secondary addresses are tuples in the model
+
+    for intf in intfs:
+        if intf.secondary is not None:
+            intf.secondary = [tuple(x) for x in intf.secondary]
+    owner = []
+    start = 0
+    for gns_node, count in zip(gns_node_list, data["nodes"]["interfaces"]):
+        gns_node.interfaces = intfs[start:start + count]
+        owner.extend([gns_node] * count)
+        start += count
+
+    netmap = [{"name": name, "nodes": [gns_node_list[n] for n in nodes],
+               "id": num}
+              for name, num, nodes in zip(data["netmap"]["name"],
+                                          data["netmap"]["id"],
+                                          data["netmap"]["nodes"])]
+    subnet_index = dict(
+        (tuple(key), [(owner[i], intfs[i]) for i in members])
+        for key, members in zip(data["subnet_index"]["keys"],
+                                data["subnet_index"]["interfaces"]))
+    objects = (gns_node_list, switches)
+    links = [[(objects[kind][n], adapter, port)
+              for kind, n, adapter, port in ends] for ends in data["links"]]
+
+    model = {
+        "gns_node_list": gns_node_list,
+        "netlist": data["netlist"],
+        "netmap": netmap,
+        "subnet_index": subnet_index,
+        "switches": switches,
+        "links": links,
+        "computes": data.get("computes") or {},
+        "slice": data.get("slice"),
+        "project_id": data.get("project_id"),
+        "project_name": data.get("project_name"),
+    }
+    if "positions" in data:
+        positions = data["positions"]
+        model["positions"] = dict(
+            (name, (x, y)) for name, x, y in zip(
+                positions["name"], positions["x"], positions["y"]))
+    model["new_links"] = None
+    if data.get("new_links") is not None:
+        model["new_links"] = set(
+            frozenset(tuple(x) for x in ends) for ends in data["new_links"])
+    return model
+
+
+class SnapshotStore():
+
+    def __init__(self, path):
+        self.path = path
+
+    def snapshot_file(self, stage):
+        return os.path.join(self.path, stage + ".snap")
+
+    def save(self, stage, model):
+        os.makedirs(self.path, exist_ok=True)
+        data = {"version": VERSION, "stage": stage, "created": time.time(),
+                "model": encode_model(model)}
+        payload = zlib.compress(json.dumps(
+            data, separators=(",", ":")).encode(), 1)
+        filename = self.snapshot_file(stage)
+        with open(filename + ".tmp", 'wb') as f:
+            f.write(payload)
+        os.replace(filename + ".tmp", filename)
+        return filename
+
+    # the cyclic garbage collector is off while loading. the load makes
+    # hundreds of thousands of objects and none of them is garbage, with it
+    # on it rescans them over and over and the load takes twice as long
+
+    def load(self, stage):
+        filename = self.snapshot_file(stage)
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(filename, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()))
+            if data.get("version") != VERSION:
+                raise SnapshotError(
+                    "{} is version {}, this netmodel reads version {}, run "
+                    "the build again from the start".format(
+                        filename, data.get("version"), VERSION))
+            return decode_model(data["model"])
+        except IOError:
+            raise SnapshotError("no snapshot of stage {} in {}".format(
+                stage, self.path))
+        except (zlib.error, ValueError) as e:
+            raise SnapshotError("{} is damaged: {}".format(filename, e))
+        finally:
+            if enabled:
+                gc.enable()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+
+'''
+Incremental sync of an existing gns3 project. The nodes and links already
+in the project are compared with the topology we just built, and only the
+differences are applied: missing nodes and links are created, ones that are
+no longer in the network are deleted. Nodes (and the switches of
+multi-access networks) are matched by name and links by their (node name,
+adapter, port) endpoints. Startup configs for every
+node go through the uploader, which skips the ones that haven't changed.
+
+Example of a plan:
+{"create_nodes": ["r4"],
+ "delete_nodes": [{"name": "r9", "node_id": "..."}],
+ "keep_nodes": {"r1": {<gns3 node data>}, ...},
+ "create_links": [frozenset({("r1", 1, 0), ("r4", 1, 0)})],
+ "delete_links": [{"link_id": "...", "endpoints": frozenset(...)}]}
+'''
+
+
+# the links we want, links are the (node, adapter, port) pairs from
+# segment_links
+
+def desired_links(links):
+    return set(frozenset((x.name, adapter, port)
+                         for x, adapter, port in ends) for ends in links)
+
+
+# gns_node_list is every node we want, switches included. scope is the
+# names of the nodes the model covers when it is a slice: nodes outside it
+# and their links stay as they are
+
+def plan_sync(gns, project_id, gns_node_list, links, scope=None):
+    gns.open_project(project_id)
+    nodes = gns.get_nodes(project_id)
+    project_links = gns.get_links(project_id)
+
+    wanted = set(x.name for x in gns_node_list)
+    current = dict((x["name"], x) for x in nodes)
+    id_to_name = dict((x["node_id"], x["name"]) for x in nodes)
+
+    plan = {}
+    plan["create_nodes"] = [x.name for x in gns_node_list
+                            if x.name not in current]
+    plan["delete_nodes"] = [{"name": x["name"], "node_id": x["node_id"]}
+                            for x in nodes if x["name"] not in wanted and
+                            (scope is None or x["name"] in scope)]
+    plan["keep_nodes"] = dict((k, v) for k, v in current.items()
+                              if k in wanted)
+
+    # links on deleted nodes go away with the node
+
+    deleted = set(x["node_id"] for x in plan["delete_nodes"])
+    existing = {}
+    for link in project_links:
+        if any(x["node_id"] in deleted for x in link["nodes"]):
+            continue
+        endpoints = frozenset(
+            (id_to_name[x["node_id"]], x["adapter_number"], x["port_number"])
+            for x in link["nodes"])
+        existing[endpoints] = link["link_id"]
+
+    wanted_links = desired_links(links)
+    plan["create_links"] = [x for x in wanted_links if x not in existing]
+    plan["delete_links"] = [{"link_id": v, "endpoints": k}
+                            for k, v in existing.items()
+                            if k not in wanted_links and
+                            (scope is None or
+                             all(x[0] in scope for x in k))]
+    return plan
+
+
+def link_string(endpoints):
+    return " <-> ".join("{} {}/{}".format(*x) for x in sorted(endpoints))
+
+
+def print_plan(plan):
+    print("Sync plan:")
+    for name in plan["create_nodes"]:
+        print("  + node", name)
+    for x in plan["delete_nodes"]:
+        print("  - node", x["name"])
+    for x in plan["create_links"]:
+        print("  + link", link_string(x))
+    for x in plan["delete_links"]:
+        print("  - link", link_string(x["endpoints"]))
+    print("{} nodes unchanged, {} to create, {} to delete".format(
+        len(plan["keep_nodes"]), len(plan["create_nodes"]),
+        len(plan["delete_nodes"])))
+    print("{} links to create, {} to delete".format(
+        len(plan["create_links"]), len(plan["delete_links"])))
+
+
+# delete what has to go. creating nodes and links is left to the normal
+# build path, it only gets the parts of the plan that are missing
+
+def apply_deletes(gns, project_id, plan):
+    gns.run_all(lambda x: gns.delete_link(project_id, x["link_id"]),
+                plan["delete_links"])
+    gns.run_all(lambda x: gns.delete_node(project_id, x["node_id"]),
+                plan["delete_nodes"])
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sys
+
+from netindex import int_to_ip
+from netindex import ip_to_int
+
+
+'''
+Fake network data for benchmarks and offline runs. A topology is generated
+as the napalm getter results netmodel collects from a real network: the
+interfaces_ip getter and an IOS running config for every device, with
+loopbacks, point to point /30s, a /24 user lan, ospf with bfd, bgp, a
+prefix-list and a route-map, so config generation has the same work to do
+as on a real device.
+
+    leaf-spine  every leaf has uplinks to a few of the spines spread over
+                all of them, there are enough spines that none has more
+                than ports links
+    hub-spoke   regions of spokes, each spoke has a link to both hubs of
+                its region and the hubs of all the regions form a ring
+    full-mesh   every device has a link to every other device, keep it
+                small, n devices is n * (n - 1) / 2 links
+
+The defaults keep every device within 48 links so the topology fits on the
+router templates gns3 has.
+
+Example of what is being created:
+{"leaf1": {"config": {"running": "hostname leaf1\n..."},
+           "interfaces_ip": {"GigabitEthernet0/1": {"ipv4": {
+               "10.0.0.1": {"prefix_length": 30}}}, ...}}}
+
+The results can be written into the discovery cache, then the netmodel
+subcommands run on them with --offline:
+
+    python3 synthetic.py leaf-spine 10000
+    python3 netmodel.py plan --offline
+'''
+
+
+P2P_BASE = "10.0.0.0"
+LOOPBACK_BASE = "172.16.0.0"
+LAN_BASE = "10.128.0.0"
+
+
+class Topology():
+
+    def __init__(self):
+        self.devices = {}
+        self.roles = {}
+        self.next_p2p = ip_to_int(P2P_BASE)
+
+    def add_device(self, name, role):
+        num = len(self.devices)
+        self.roles[name] = role
+        self.devices[name] = [
+            ("Loopback0", ip_to_int(LOOPBACK_BASE) + num, 32, "router id"),
+            ("Vlan10", ip_to_int(LAN_BASE) + num * 256 + 1, 24, "users"),
+        ]
+
+    def intf_name(self, name):
+        return "GigabitEthernet0/" + str(len(self.devices[name]) - 1)
+
+    # a /30 between two devices
+
+    def connect(self, a, b):
+        net = self.next_p2p
+        self.next_p2p += 4
+        for side, (this, other) in enumerate(((a, b), (b, a)), 1):
+            self.devices[this].append((self.intf_name(this), net + side, 30,
+                                       "to " + other))
+
+    def interfaces_ip(self, name):
+        result = {}
+        for intf, ip, prefix, _ in self.devices[name]:
+            result[intf] = {"ipv4": {int_to_ip(ip): {"prefix_length": prefix}}}
+        return result
+
+    def running_config(self, name):
+        intfs = self.devices[name]
+        router_id = int_to_ip(intfs[0][1])
+        lines = ["!", "version 15.2", "service timestamps debug datetime msec",
+                 "hostname " + name, "!", "ip cef", "ipv6 unicast-routing",
+                 "!"]
+        for intf, ip, prefix, description in intfs:
+            mask = int_to_ip((0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF)
+            lines.append("interface " + intf)
+            lines.append(" description " + description)
+            lines.append(" ip address {} {}".format(int_to_ip(ip), mask))
+            if prefix == 30:
+                lines.append(" ip ospf network point-to-point")
+                lines.append(" bfd interval 300 min_rx 300 multiplier 3")
+            lines.append(" no shutdown")
+            lines.append("!")
+        lines.extend([
+            "router ospf 1",
+            " router-id " + router_id,
+            " passive-interface Vlan10",
+            " network 10.0.0.0 0.255.255.255 area 0",
+            " network 172.16.0.0 0.15.255.255 area 0",
+            " bfd all-interfaces",
+            "!",
+            "router bgp 65000",
+            " bgp router-id " + router_id,
+            " bgp log-neighbor-changes",
+            " neighbor RR peer-group",
+            " neighbor RR remote-as 65000",
+            " neighbor RR update-source Loopback0",
+            " neighbor RR fall-over bfd",
+            " address-family ipv4",
+            "  network " + int_to_ip(intfs[1][1] - 1) + " mask 255.255.255.0",
+            "  neighbor RR route-map RM-OUT out",
+            " exit-address-family",
+            "!",
+            "ip prefix-list LOOPBACKS seq 5 permit 172.16.0.0/12 le 32",
+            "ip prefix-list USERS seq 5 permit 10.128.0.0/9 le 24",
+            "!",
+            "route-map RM-OUT permit 10",
+            " match ip address prefix-list LOOPBACKS USERS",
+            "!",
+            "line vty 0 4",
+            " transport input ssh",
+            "!",
+            "end",
+        ])
+        return "\n".join(lines) + "\n"
+
+    def router_get(self):
+        return dict((name, {"config": {"running": self.running_config(name)},
+                            "interfaces_ip": self.interfaces_ip(name)})
+                    for name in self.devices)
+
+
+# the spines of each of count leaves. the leaves take their uplinks in turn
+# from shuffled rounds of all the spines, so every spine gets the same
+# number of links and the leaves of a round don't all land on the same
+# blocks of spines (that splits the fabric in pods). a leaf that takes its
+# uplinks from two rounds doesn't get a spine twice
+
+def spread_uplinks(count, spines, uplinks, rnd):
+    order = []
+    for _ in range(count):
+        while len(order) < uplinks:
+            spine_round = list(range(spines))
+            rnd.shuffle(spine_round)
+            while set(spine_round[:uplinks - len(order)]) & set(order):
+                rnd.shuffle(spine_round)
+            order.extend(spine_round)
+        yield order[:uplinks]
+        del order[:uplinks]
+
+
+def leaf_spine(size, uplinks=4, ports=48):
+    topo = Topology()
+    spines = max(uplinks, -(-size * uplinks // (ports + uplinks)))
+    for x in range(spines):
+        topo.add_device("spine" + str(x + 1), "core")
+    leaf_uplinks = spread_uplinks(size - spines, spines, uplinks,
+                                  random.Random(size))
+    for x, chosen in enumerate(leaf_uplinks):
+        leaf = "leaf" + str(x + 1)
+        topo.add_device(leaf, "access")
+        for y in chosen:
+            topo.connect(leaf, "spine" + str(y + 1))
+    return topo
+
+
+def hub_spoke(size, region=40):
+    topo = Topology()
+    regions = max(1, -(-size // (region + 2)))
+    hubs = []
+    for x in range(regions):
+        pair = ["hub" + str(2 * x + 1), "hub" + str(2 * x + 2)]
+        for hub in pair:
+            topo.add_device(hub, "core")
+        topo.connect(*pair)
+        hubs.append(pair)
+    for x in range(regions if regions > 2 else regions - 1):
+        topo.connect(hubs[x][1], hubs[(x + 1) % regions][0])
+    for x in range(size - 2 * regions):
+        spoke = "spoke" + str(x + 1)
+        topo.add_device(spoke, "access")
+        for hub in hubs[x % regions]:
+            topo.connect(spoke, hub)
+    return topo
+
+
+def full_mesh(size):
+    topo = Topology()
+    for x in range(size):
+        topo.add_device("r" + str(x + 1), "core")
+        for y in range(x):
+            topo.connect("r" + str(y + 1), "r" + str(x + 1))
+    return topo
+
+
+TOPOLOGIES = {
+    "leaf-spine": leaf_spine,
+    "hub-spoke": hub_spoke,
+    "full-mesh": full_mesh,
+}
+
+
+def generate(kind, size):
+    return TOPOLOGIES[kind](size)
+
+
+# a nornir hosts.yaml with the role of every device as its group, the
+# hierarchy layout uses it
+
+def write_hosts(topo, filename):
+    import yaml
+    hosts = dict((name, {"hostname": name, "groups": [role]})
+                 for name, role in topo.roles.items())
+    with open(filename, 'w') as f:
+        yaml.safe_dump(hosts, f, default_flow_style=False)
+
+
+def main(argv=None):
+    from cache import DiscoveryCache
+
+    parser = argparse.ArgumentParser(
+        description="Write a fake topology into the discovery cache")
+    parser.add_argument("kind", choices=sorted(TOPOLOGIES))
+    parser.add_argument("size", type=int, help="number of devices")
+    parser.add_argument("--cache-dir", default=".netmodel-cache")
+    parser.add_argument("--hosts", help="also write a nornir hosts.yaml")
+    args = parser.parse_args(argv)
+
+    topo = generate(args.kind, args.size)
+    cache = DiscoveryCache(args.cache_dir, max_bytes=sys.maxsize)
+    for name, result in topo.router_get().items():
+        cache.put(name, result, name)
+    cache.save()
+    if args.hosts:
+        write_hosts(topo, args.hosts)
+    print("Wrote {} devices to {}".format(len(topo.devices), args.cache_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import socket
+import threading
+
+import paramiko
+
+
+'''
+A paramiko ssh server with an sftp subsystem over a local directory, for
+the upload tests. It counts logins and channels, and fail_writes makes the
+write of any file with that name in its path fail.
+'''
+
+
+HOST_KEY = paramiko.RSAKey.generate(1024)
+
+
+class Server(paramiko.ServerInterface):
+
+    def __init__(self, stub):
+        self.stub = stub
+
+    def check_auth_password(self, username, password):
+        if (username, password) != ("gns3", "gns3"):
+            return paramiko.AUTH_FAILED
+        with self.stub.lock:
+            self.stub.logins += 1
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        with self.stub.lock:
+            self.stub.channels += 1
+        return paramiko.OPEN_SUCCEEDED
+
+
+class Handle(paramiko.SFTPHandle):
+
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(
+            os.fstat(self.readfile.fileno()))
+
+
+class SftpInterface(paramiko.SFTPServerInterface):
+
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.stub = server.stub
+
+    def path(self, path):
+        return os.path.join(self.stub.root, path.lstrip("/"))
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        with self.stub.lock:
+            self.stub.opened.append(path)
+        if flags & (os.O_WRONLY | os.O_RDWR) and any(
+                x in path for x in self.stub.fail_writes):
+            return paramiko.SFTP_PERMISSION_DENIED
+        try:
+            fd = os.open(self.path(path), flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        mode = "r+b" if flags & (os.O_WRONLY | os.O_RDWR) else "rb"
+        handle = Handle(flags)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.path(path), attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class SftpStub():
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.logins = 0
+        self.channels = 0
+        self.opened = []
+        self.fail_writes = set()
+        self.transports = []
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(HOST_KEY)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer,
+                                            SftpInterface)
+            transport.start_server(server=Server(self))
+            self.transports.append(transport)
+
+    def stop(self):
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+
+from boot import LabBoot
+from gnsproject import GnsClient
+from gnsstub import DEFAULT_TEMPLATES
+from gnsstub import StubServer
+
+
+APP_ID = next(iter(DEFAULT_TEMPLATES))
+
+COMPUTES = {"gns1": {"cpus": 8, "memory": 2 ** 34},
+            "gns2": {"cpus": 8, "memory": 2 ** 34}}
+
+
+@pytest.fixture
+def lab_server(request):
+    server = StubServer(ping_interval=0.05, **request.param).start()
+    yield server
+    server.stop()
+
+
+# a project with nodes on the computes in order, returns the client, the
+# project id and the nodes
+
+def project(server, computes):
+    gns = GnsClient(server.address, use_templates=True, backoff=0)
+    p_id = gns.create_project("lab")
+    nodes = gns.create_nodes(p_id, APP_ID, [
+        {"name": "r" + str(i), "compute_id": x}
+        for i, x in enumerate(computes, 1)])
+    return gns, p_id, nodes
+
+
+# the order the nodes were started in
+
+def record_starts(server):
+    starts = []
+    start_node = server.gns.start_node
+
+    def record(project_id, node_id):
+        starts.append(server.gns.projects[project_id]["nodes"][node_id]
+                      ["name"])
+        return start_node(project_id, node_id)
+
+    server.gns.start_node = record
+    return starts
+
+
+@pytest.mark.parametrize("lab_server", [{"boot_time": 0.05}], indirect=True)
+def test_waves_and_workers(lab_server):
+    gns, p_id, nodes = project(lab_server, ["local"] * 30)
+    lab = LabBoot(gns, p_id, nodes, wave=10, workers=4, timeout=10)
+    lab.run()
+    assert lab.waves == 3
+    assert sorted(lab.times) == sorted(x["name"] for x in nodes)
+    assert not lab.failures
+    assert lab_server.gns.max_booting <= 4
+    assert all(x["status"] == "started" for x in gns.get_nodes(p_id))
+
+
+@pytest.mark.parametrize("lab_server", [{"boot_time": 0}], indirect=True)
+def test_started_nodes_are_left_alone(lab_server):
+    gns, p_id, nodes = project(lab_server, ["local"] * 3)
+    nodes[0]["status"] = "started"
+    starts = record_starts(lab_server)
+    LabBoot(gns, p_id, nodes, timeout=10).run()
+    assert sorted(starts) == ["r2", "r3"]
+
+
+@pytest.mark.parametrize("lab_server", [
+    {"boot_time": 0.2, "boot_cpu": 50, "idle_cpu": 50,
+     "computes": COMPUTES}], indirect=True)
+def test_busy_compute_is_held_back(lab_server):
+    gns, p_id, nodes = project(
+        lab_server, ["gns1", "gns1", "gns1", "gns2", "gns2"])
+    starts = record_starts(lab_server)
+    lab = LabBoot(gns, p_id, nodes, wave=2, workers=2, max_cpu=80,
+                  timeout=0.5)
+    lab.run()
+    assert sorted(starts[:2]) == ["r1", "r2"]
+    assert sorted(starts[2:4]) == ["r4", "r5"]
+    assert starts[4] == "r3"
+    assert not lab.failures
+
+
+@pytest.mark.parametrize("lab_server", [
+    {"boot_time": 0, "computes": {
+        "gns1": {"cpus": 8, "memory": 2 ** 34},
+        "gns2": {"cpus": 8, "memory": 2 ** 34,
+                 "memory_usage_percent": 95}}}], indirect=True)
+def test_memory_threshold(lab_server):
+    gns, p_id, nodes = project(lab_server, ["gns2", "gns1", "gns2", "gns1"])
+    starts = record_starts(lab_server)
+    lab = LabBoot(gns, p_id, nodes, wave=4, max_memory=90, timeout=0.3)
+    lab.run()
+    assert sorted(starts[:2]) == ["r2", "r4"]
+    assert sorted(starts[2:]) == ["r1", "r3"]
+    assert lab.waves == 2
+    assert not lab.failures
+
+
+@pytest.mark.parametrize("lab_server", [{"boot_time": 0.05}], indirect=True)
+def test_node_that_never_starts(lab_server):
+    gns, p_id, nodes = project(lab_server, ["local"] * 4)
+    start_node = lab_server.gns.start_node
+    stuck = nodes[1]["node_id"]
+    lab_server.gns.start_node = lambda p, n: (
+        lab_server.gns.node(lab_server.gns.project(p), n) if n == stuck
+        else start_node(p, n))
+    lab = LabBoot(gns, p_id, nodes, timeout=0.5)
+    lab.run()
+    assert lab.failures == {"r2": "not started after 0.5s"}
+    assert sorted(lab.times) == ["r1", "r3", "r4"]
+
+
+# the stream is back after the nodes have started, they are found when it
+# catches up
+
+@pytest.mark.parametrize("lab_server", [{"boot_time": 0.3}], indirect=True)
+def test_stream_drops_mid_boot(lab_server):
+    gns, p_id, nodes = project(lab_server, ["local"] * 6)
+    lab = LabBoot(gns, p_id, nodes, workers=6, timeout=10)
+    threading.Timer(0.1, lab_server.gns.drop_notifications).start()
+    lab.run()
+    assert not lab.failures
+    assert sorted(lab.times) == sorted(x["name"] for x in nodes)
+
+
+@pytest.mark.parametrize("lab_server", [{"boot_time": 5}], indirect=True)
+def test_stream_gone_for_good(lab_server):
+    gns, p_id, nodes = project(lab_server, ["local"] * 2)
+    lab = LabBoot(gns, p_id, nodes, timeout=10, reconnects=0)
+    threading.Timer(0.1, lab_server.gns.drop_notifications).start()
+    lab.run()
+    assert lab.failures == dict((x["name"], "the notification stream closed")
+                                for x in nodes)
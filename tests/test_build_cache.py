@@ -0,0 +1,103 @@
+import pytest
+
+import netmodel
+from cache import BuildCache
+from cache import DiscoveryCache
+from synthetic import generate
+from test_resume import build
+from test_resume import workdir  # noqa: F401
+from timing import profiler
+
+
+NAMES = sorted(generate("hub-spoke", 12).router_get())
+
+
+@pytest.fixture
+def reused():
+    profiler.reset()
+    profiler.enable()
+    try:
+        yield lambda: profiler.counters.pop("configs_reused", 0)
+    finally:
+        profiler.enabled = False
+        profiler.reset()
+
+
+def invalidate(*hosts):
+    args = netmodel.make_parser().parse_args(["invalidate"] + list(hosts))
+    netmodel.cmd_invalidate(netmodel.load_config(args))
+
+
+def test_artifact_is_kept_for_its_key(tmp_path):
+    builds = BuildCache(str(tmp_path))
+    builds.add_artifact("r1", "key1", "hostname r1\n")
+    builds.save()
+    builds = BuildCache(str(tmp_path))
+    assert builds.artifact("r1", "key1") == "hostname r1\n"
+    assert builds.artifact("r1", "key2") is None
+    assert builds.artifact("r2", "key1") is None
+
+
+def test_a_new_artifact_is_uploaded_again(tmp_path):
+    builds = BuildCache(str(tmp_path))
+    builds.add_artifact("r1", "key1", "hostname r1\n")
+    builds.add_upload("r1", "/r1/startup.cfg", "digest1")
+    assert builds.uploaded("r1", "/r1/startup.cfg", "digest1")
+    assert not builds.uploaded("r1", "/r1/startup.cfg", "digest2")
+    builds.add_artifact("r1", "key2", "hostname r1\n!\n")
+    assert not builds.uploaded("r1", "/r1/startup.cfg", "digest1")
+
+
+def test_invalidate(tmp_path):
+    builds = BuildCache(str(tmp_path))
+    for name in ("r1", "r2", "r3"):
+        builds.add_artifact(name, "key", name)
+    builds.invalidate(["r2"])
+    assert builds.artifact("r2", "key") is None
+    assert builds.artifact("r1", "key") == "r1"
+    builds.invalidate()
+    assert builds.index == {}
+
+
+# every config of an unchanged rebuild comes from the cache, a changed
+# device is the only one built again
+
+def test_rebuild_reuses_unchanged_configs(stub, workdir, reused):
+    build(stub)
+    assert reused() == 0
+    p_id, = stub.gns.projects
+    build(stub, "--project-id", p_id)
+    assert reused() == len(NAMES)
+
+    cache = DiscoveryCache(".netmodel-cache")
+    result = cache.get(NAMES[0], ttl=None)
+    result["config"]["running"] += "ip prefix-list NEW seq 5 permit " \
+        "192.0.2.0/24\n"
+    cache.put(NAMES[0], result, NAMES[0])
+    cache.save()
+    build(stub, "--project-id", p_id)
+    assert reused() == len(NAMES) - 1
+    with open("configs/{}-gns.cfg".format(NAMES[0])) as f:
+        assert "ip prefix-list NEW" in f.read()
+
+
+def test_changed_rules_miss(stub, workdir, reused):
+    build(stub)
+    p_id, = stub.gns.projects
+    rules = workdir / "rules.yaml"
+    rules.write_text("ios:\n  include: [^hostname, ^router]\n")
+    build(stub, "--project-id", p_id, "--config-rules", str(rules))
+    assert reused() == 0
+    build(stub, "--project-id", p_id, "--config-rules", str(rules))
+    assert reused() == len(NAMES)
+
+
+def test_invalidated_hosts_are_built_again(stub, workdir, reused):
+    build(stub)
+    p_id, = stub.gns.projects
+    invalidate(NAMES[0], NAMES[1])
+    build(stub, "--project-id", p_id)
+    assert reused() == len(NAMES) - 2
+    invalidate()
+    build(stub, "--project-id", p_id)
+    assert reused() == 0
@@ -0,0 +1,159 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from collect import Collector
+from collect import FakeDriver
+from topology import TopologyIndex
+from topology import crawl
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def payloads(count):
+    return dict(("r{}".format(i), {"config": {"running": "hostname r{}"
+                                              .format(i)},
+                                   "interfaces_ip": {}})
+                for i in range(count))
+
+
+def hosts(count):
+    return [{"name": "r{}".format(i)} for i in range(count)]
+
+
+# a driver whose hosts in hang never answer
+
+class HangingDriver(FakeDriver):
+
+    release = threading.Event()
+
+    def __init__(self, host, payloads, hang=()):
+        super().__init__(host, payloads)
+        self.hang = hang
+
+    def open(self):
+        if self.host["name"] in self.hang:
+            self.release.wait()
+
+
+# a driver that can't reach the hosts in down
+
+class DownDriver(FakeDriver):
+
+    def __init__(self, host, payloads, down=()):
+        super().__init__(host, payloads)
+        self.down = down
+
+    def open(self):
+        if self.host["name"] in self.down:
+            raise ConnectionError("unreachable")
+
+
+def test_results_and_failures():
+    data = payloads(200)
+    collector = Collector(workers=16, driver_factory=FakeDriver.factory(
+        data, latency=(0, 0.002), failure_rate=0.3, seed=7))
+    results = dict(collector.collect(hosts(200)))
+    assert results and collector.failures
+    assert len(results) + len(collector.failures) == 200
+    assert not set(results) & set(collector.failures)
+    for name, result in results.items():
+        assert result == data[name]
+    for reason in collector.failures.values():
+        assert reason == "ConnectionError: fake connection failure"
+
+
+def test_failures_depend_on_seed_and_host():
+    def failed(seed):
+        collector = Collector(workers=8, driver_factory=FakeDriver.factory(
+            payloads(100), failure_rate=0.5, seed=seed))
+        list(collector.collect(hosts(100)))
+        return set(collector.failures)
+
+    assert failed(3) == failed(3)
+    assert failed(3) != failed(4)
+    assert 0 < len(failed(3)) < 100
+
+
+def test_hung_hosts_time_out_without_holding_workers():
+    HangingDriver.release.clear()
+    collector = Collector(
+        workers=2, connect_timeout=0.2, command_timeout=0, getters=("config",),
+        driver_factory=lambda host, c, t: HangingDriver(
+            host, payloads(10), hang=("r0", "r1")))
+    start = time.monotonic()
+    try:
+        results = dict(collector.collect(hosts(10)))
+    finally:
+        HangingDriver.release.set()
+    assert time.monotonic() - start < 2
+    assert sorted(collector.failures) == ["r0", "r1"]
+    assert collector.failures["r0"] == "timed out after 0.2s"
+    assert len(results) == 8
+
+
+def test_hung_hosts_do_not_block_exit():
+    script = """
+import threading
+from collect import Collector
+from collect import FakeDriver
+from topology import TopologyIndex
+from topology import crawl
+
+class Hang(FakeDriver):
+    def open(self):
+        threading.Event().wait()
+
+collector = Collector(workers=4, connect_timeout=0.2, command_timeout=0,
+                      driver_factory=lambda h, c, t: Hang(h, {}))
+list(collector.collect([{"name": "r1"}, {"name": "r2"}]))
+print(sorted(collector.failures))
+"""
+    start = time.monotonic()
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT,
+                         capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "['r1', 'r2']"
+    assert time.monotonic() - start < 10
+
+
+def test_failure_report(tmp_path, capsys):
+    collector = Collector(workers=4, driver_factory=FakeDriver.factory(
+        payloads(20), failure_rate=0.5, seed=1))
+    list(collector.collect(hosts(20)))
+    report = tmp_path / "failures.json"
+    collector.print_failure_report(str(report))
+    out = capsys.readouterr().out
+    assert out.startswith("These hosts failed")
+    assert json.loads(report.read_text()) == collector.failures
+
+
+# r1 - r2 - r3 - r4 in a line, crawled from r1 a hop at a time like
+# netmodel discover does. r2 fails on the second hop and has to be in the
+# report made after the last one
+
+def test_failures_of_every_crawl_hop(capsys):
+    line = {"10.0.0.0/30": ["r1", "r2"], "10.0.0.4/30": ["r2", "r3"],
+            "10.0.0.8/30": ["r3", "r4"]}
+    data = dict((x, {"networks": sorted(v)})
+                for x, v in TopologyIndex(line).devices.items())
+    collector = Collector(
+        workers=2, getters=("networks",),
+        driver_factory=lambda host, c, t: DownDriver(host, data, ["r2"]))
+    hops = []
+
+    def fetch(names):
+        hops.append(sorted(names))
+        return dict(collector.collect([{"name": x} for x in names]))
+
+    results = crawl(TopologyIndex(line), {"r1": 3}, fetch,
+                    lambda name, result: result["networks"])
+    assert hops == [["r1"], ["r2"], ["r3"], ["r4"]]
+    assert sorted(results) == ["r1", "r3", "r4"]
+    assert collector.failures == {"r2": "ConnectionError: unreachable"}
+    collector.print_failure_report()
+    assert "r2: ConnectionError: unreachable" in capsys.readouterr().out
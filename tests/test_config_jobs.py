@@ -0,0 +1,60 @@
+import contextlib
+import os
+
+import netmodel
+from netindex import PrefixFilter
+from ports import PortAllocator
+from ports import template_layout
+from synthetic import generate
+
+
+ALLOCATOR = PortAllocator({"iou": template_layout(
+    {"template_type": "iou", "ethernet_adapters": 16})})
+
+
+def jobs(size):
+    router_get = generate("hub-spoke", size).router_get()
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            model = netmodel.build_model(router_get, ALLOCATOR,
+                                         PrefixFilter({4: [32]}))
+    return netmodel.config_jobs(router_get, model["gns_node_list"])
+
+
+def test_processes_give_the_same_configs_in_order():
+    todo = jobs(30)
+    here = netmodel.run_config_jobs(todo, 1)
+    pooled = netmodel.run_config_jobs(todo, 3)
+    assert [x[0] for x in pooled] == [x[0] for x in here]
+    assert all(x[0] and x[3] is None for x in pooled)
+    for (gns_node, _, _, _), (config, _, _, _) in zip(todo, pooled):
+        assert "hostname " + gns_node.name in config
+
+
+def test_a_bad_device_is_reported_alone():
+    todo = jobs(12)
+    gns_node, _, debug, rules = todo[4]
+    todo[4] = (gns_node, None, debug, rules)
+    for workers in (1, 3):
+        results = netmodel.run_config_jobs(todo, workers)
+        assert results[4][0] is None
+        assert results[4][3].startswith("AttributeError")
+        assert all(x[0] and x[3] is None
+                   for n, x in enumerate(results) if n != 4)
+
+
+def test_failures_leave_the_device_without_a_config(tmp_path, capsys):
+    router_get = generate("hub-spoke", 6).router_get()
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            model = netmodel.build_model(router_get, ALLOCATOR,
+                                         PrefixFilter({4: [32]}))
+    bad = model["gns_node_list"][2].name
+    router_get[bad]["config"]["running"] = None
+    failures = netmodel.add_node_cfg(router_get, model["gns_node_list"],
+                                     workers=2, output_dir=str(tmp_path))
+    assert list(failures) == [bad]
+    assert "Config generation failed for 1 devices" in capsys.readouterr().out
+    written = sorted(os.listdir(str(tmp_path)))
+    assert bad + "-gns.cfg" not in written
+    assert len(written) == 5
@@ -0,0 +1,121 @@
+import pytest
+
+import netmodel
+from configrules import ConfigRules
+from configrules import DEFAULT_PLATFORM
+from configrules import load_rules
+from configrules import platform_rules
+
+
+CONFIG = """hostname r1
+!
+interface Loopback0
+ ip address 10.255.0.1 255.255.255.255
+interface Ethernet0/0
+ ip address 10.0.0.1 255.255.255.252
+ bfd interval 50 min_rx 50 multiplier 3
+ shutdown
+router ospf 1
+ router-id 10.255.0.1
+ bfd all-interfaces
+ neighbor 10.0.0.2
+  description r2
+ network 10.0.0.0 0.0.0.3 area 0
+ip prefix-list lo seq 5 permit 10.255.0.0/16 le 32
+route-map lo permit 10
+ match ip address prefix-list lo
+""".splitlines()
+
+
+def kept(rules, lines=CONFIG):
+    return ["".join(x) for x in rules.extract(lines)]
+
+
+def test_default_rules():
+    rules = platform_rules(load_rules(), DEFAULT_PLATFORM)
+    text = "".join(kept(rules))
+    assert "hostname r1\n" in text
+    assert "interface Loopback0\n ip address 10.255.0.1" in text
+    assert "router ospf 1\n router-id 10.255.0.1\n" in text
+    assert "route-map lo permit 10\n" in text
+    assert "ip prefix-list lo" in text
+    assert "bfd" not in text
+    assert "Ethernet0/0" not in text
+
+
+def test_sections_come_out_in_rule_order():
+    rules = ConfigRules(include=[r"^route-map", r"^hostname", r"^router"])
+    sections = kept(rules)
+    assert sections[0].startswith("route-map lo permit 10\n")
+    assert sections[1] == "hostname r1\n"
+    assert sections[2].startswith("router ospf 1\n")
+
+
+def test_first_matching_rule_takes_the_line():
+    rules = ConfigRules(include=[r"^interface Loop", r"^interface"])
+    loopbacks, interfaces = kept(rules)
+    assert loopbacks.startswith("interface Loopback0\n")
+    assert "Loopback" not in interfaces
+    assert interfaces.startswith("interface Ethernet0/0\n")
+
+
+def test_an_excluded_line_takes_its_children():
+    rules = ConfigRules(include=[r"^router"], exclude=[r"^ neighbor"])
+    section, = kept(rules)
+    assert "neighbor" not in section
+    assert "description r2" not in section
+    assert " network 10.0.0.0 0.0.0.3 area 0\n" in section
+
+
+def test_only_top_level_lines_start_a_section():
+    rules = ConfigRules(include=[r"^ ?router-id", r"^ip prefix"])
+    router_id, prefix_list = kept(rules)
+    assert router_id == ""
+    assert prefix_list.startswith("ip prefix-list lo")
+
+
+def test_rewrites_apply_in_order():
+    rules = ConfigRules(include=[r"^interface Ethernet"], rewrite=[
+        {"match": r"^( *)shutdown$", "replace": r"\1no shutdown"},
+        {"match": r"^( *)no shutdown$", "replace": r"\1no shutdown ! up"},
+        ])
+    section, = kept(rules)
+    assert " no shutdown ! up\n" in section
+
+
+def test_no_rules_keep_nothing():
+    assert ConfigRules().extract(CONFIG) == []
+
+
+def test_platform_from_a_file(tmp_path):
+    filename = tmp_path / "rules.yaml"
+    filename.write_text("eos:\n  include: [^hostname]\n")
+    rules = load_rules(str(filename))
+    assert kept(platform_rules(rules, "eos")) == ["hostname r1\n"]
+    assert platform_rules(rules, "junos") is rules["ios"]
+    assert len(rules["ios"].include) == 5
+
+
+@pytest.mark.parametrize("text,error", [
+    ("ios:\n  include: ['^(hostname']\n", "bad pattern"),
+    ("ios:\n  include: ^hostname\n", "include is not a list"),
+    ("ios:\n  exclude: [bfd]\n  excludes: [x]\n", "unknown excludes"),
+    ("ios:\n  rewrite: [{match: shutdown}]\n", "needs match and replace"),
+    ("ios:\n  rewrite: [{match: '[', replace: x}]\n", "bad pattern"),
+    ("ios: [^hostname]\n", "not a mapping"),
+])
+def test_invalid_rules_are_refused(tmp_path, text, error):
+    filename = tmp_path / "rules.yaml"
+    filename.write_text(text)
+    with pytest.raises(ValueError, match=error):
+        load_rules(str(filename))
+
+
+def test_invalid_rules_stop_the_build(tmp_path):
+    filename = tmp_path / "rules.yaml"
+    filename.write_text("ios:\n  include: ['^(hostname']\n")
+    args = netmodel.make_parser().parse_args(
+        ["plan", "--offline", "--config-rules", str(filename)])
+    with pytest.raises(SystemExit) as e:
+        netmodel.config_rules(netmodel.load_config(args))
+    assert "rules.yaml: config rules of ios: bad pattern" in str(e.value)
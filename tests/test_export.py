@@ -0,0 +1,128 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from export import add_node_ids
+from export import export_project
+from export import validate_project
+from netindex import PrefixFilter
+from netmodel import add_node_cfg
+from netmodel import build_model
+from ports import PortAllocator
+from ports import template_layout
+from synthetic import generate
+
+
+TEMPLATES = {
+    "iou": {"template_id": "iou", "template_type": "iou",
+            "ethernet_adapters": 4},
+    "c7200": {"template_id": "c7200", "template_type": "dynamips",
+              "slot1": "PA-8E"},
+}
+
+
+# a hub and spoke network with a lan three of the spokes share, so the
+# export has a switch as well
+
+def topology():
+    router_get = generate("hub-spoke", 10).router_get()
+    for num, name in enumerate(["spoke1", "spoke2", "spoke3"], 1):
+        router_get[name]["interfaces_ip"]["GigabitEthernet1/0"] = {
+            "ipv4": {"192.168.50." + str(num): {"prefix_length": 29}}}
+    return router_get
+
+
+@pytest.fixture
+def exported(tmp_path):
+    router_get = topology()
+    allocator = PortAllocator(
+        dict((k, template_layout(v)) for k, v in TEMPLATES.items()),
+        TEMPLATES)
+    model = build_model(router_get, allocator,
+                        PrefixFilter({4: [24, 32]}))
+    add_node_ids(model["gns_node_list"] + model["switches"])
+    add_node_cfg(router_get, model["gns_node_list"],
+                 output_dir=str(tmp_path / "configs"))
+    filename = str(tmp_path / "lab.gns3project")
+    export_project(filename, "lab", model["gns_node_list"], model["links"],
+                   TEMPLATES, switches=model["switches"])
+    return filename, model
+
+
+def rewrite(filename, change):
+    with zipfile.ZipFile(filename) as zf:
+        files = dict((x, zf.read(x)) for x in zf.namelist())
+    project = json.loads(files["project.gns3"])
+    change(project["topology"])
+    files["project.gns3"] = json.dumps(project).encode()
+    with zipfile.ZipFile(filename, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+
+
+def test_counts(exported):
+    filename, model = exported
+    nodes = model["gns_node_list"]
+    assert len(model["switches"]) == 1
+    assert validate_project(filename) == {
+        "nodes": len(nodes) + 1,
+        "links": len(model["links"]),
+        "ports": 2 * len(model["links"]),
+        "configs": len(nodes)}
+
+
+def test_project_file(exported):
+    filename, model = exported
+    with zipfile.ZipFile(filename) as zf:
+        with zf.open("project.gns3") as f:
+            project = json.load(io.TextIOWrapper(f, encoding="utf-8"))
+        names = zf.namelist()
+    nodes = dict((x["name"], x) for x in project["topology"]["nodes"])
+    assert nodes["sw-192.168.50.0-29"]["node_type"] == "ethernet_switch"
+    assert len(nodes["sw-192.168.50.0-29"]["properties"]
+               ["ports_mapping"]) == 3
+    for gns_node in model["gns_node_list"]:
+        node = nodes[gns_node.name]
+        assert node["node_id"] == gns_node.id
+        if node["node_type"] == "iou":
+            path = "project-files/iou/{}/startup-config.cfg"
+        else:
+            path = "project-files/dynamips/{}/configs/"
+        assert any(x.startswith(path.format(gns_node.id)) for x in names)
+
+
+def test_duplicate_port(exported):
+    filename, _ = exported
+
+    def reuse(topology):
+        first, second = topology["links"][:2]
+        second["nodes"][0] = dict(first["nodes"][0])
+
+    rewrite(filename, reuse)
+    with pytest.raises(ValueError, match="is used twice"):
+        validate_project(filename)
+
+
+def test_unknown_node(exported):
+    filename, _ = exported
+
+    def drop(topology):
+        topology["links"][0]["nodes"][1]["node_id"] = "no-such-node"
+
+    rewrite(filename, drop)
+    with pytest.raises(ValueError, match="unknown node no-such-node"):
+        validate_project(filename)
+
+
+def test_link_ends(exported):
+    filename, _ = exported
+
+    def three(topology):
+        link = topology["links"][0]
+        link["nodes"].append(dict(link["nodes"][0], port_number=99))
+
+    rewrite(filename, three)
+    with pytest.raises(ValueError, match="has 3 ends"):
+        validate_project(filename)
@@ -0,0 +1,184 @@
+import socket
+
+import pytest
+import requests
+
+from gnsproject import GnsClient
+from gnsstub import DEFAULT_TEMPLATES
+
+
+APP_ID = next(iter(DEFAULT_TEMPLATES))
+
+
+def client(stub, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return GnsClient(stub.address, use_templates=True, **kwargs)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_session_reuses_one_connection(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    for i in range(20):
+        gns.create_node(project_id, APP_ID, "r" + str(i))
+    assert len(gns.get_nodes(project_id)) == 20
+    assert stub.gns.connections == 1
+
+
+def test_pool_is_bounded_by_workers(stub):
+    gns = client(stub, workers=4)
+    project_id = gns.create_project("lab")
+    gns.create_nodes(project_id, APP_ID,
+                     [{"name": "r" + str(i)} for i in range(40)])
+    assert len(gns.get_nodes(project_id)) == 40
+    assert 1 <= stub.gns.connections <= 1 + 4
+
+
+def test_get_is_retried_on_5xx(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    stub.gns.inject("GET", r"/projects/[^/]+/nodes", 503, times=2)
+    calls = stub.gns.calls
+    assert gns.get_nodes(project_id) == []
+    assert stub.gns.calls - calls == 3
+
+
+def test_retries_run_out(stub):
+    gns = client(stub, retries=2)
+    project_id = gns.create_project("lab")
+    stub.gns.inject("GET", r"/projects/[^/]+/nodes", 502, times=5)
+    with pytest.raises(requests.HTTPError) as e:
+        gns.get_nodes(project_id)
+    assert e.value.response.status_code == 502
+    assert stub.gns.faults[0][3] == 2
+
+
+def test_backoff_doubles(stub, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr("gnsproject.time.sleep", sleeps.append)
+    gns = client(stub, retries=3, backoff=0.5)
+    project_id = gns.create_project("lab")
+    stub.gns.inject("GET", r"/projects/[^/]+/links", 500, times=3)
+    assert gns.get_links(project_id) == []
+    assert sleeps == [0.5, 1.0, 2.0]
+
+
+def test_post_is_not_retried_on_5xx(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    stub.gns.inject("POST", r"/projects/[^/]+/templates/[^/]+", 503,
+                    applied=True)
+    with pytest.raises(requests.HTTPError):
+        gns.create_node(project_id, APP_ID, "r1")
+    assert [x["name"] for x in gns.get_nodes(project_id)] == ["r1"]
+
+
+def test_link_post_is_not_duplicated(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    a, b = gns.create_nodes(project_id, APP_ID, [{"name": "a"}, {"name": "b"}])
+    stub.gns.inject("POST", r"/projects/[^/]+/links", 500, applied=True)
+    link = {"nodes": [
+        {"node_id": a["node_id"], "adapter_number": 0, "port_number": 0},
+        {"node_id": b["node_id"], "adapter_number": 0, "port_number": 0}]}
+    with pytest.raises(requests.HTTPError) as e:
+        gns.create_link(project_id, link)
+    assert e.value.response.status_code == 500
+    assert len(gns.get_links(project_id)) == 1
+
+
+def test_start_is_retried(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    node = gns.create_node(project_id, APP_ID, "r1")
+    stub.gns.inject("POST", r"/projects/[^/]+/nodes/[^/]+/start", 503)
+    assert gns.start_node(project_id, node["node_id"])["name"] == "r1"
+
+
+def test_post_is_retried_when_the_connection_fails(monkeypatch):
+    gns = GnsClient("127.0.0.1:" + str(free_port()), retries=2, backoff=0)
+    attempts = []
+    send = gns.session.request
+    monkeypatch.setattr(gns.session, "request",
+                        lambda *a, **k: attempts.append(a) or send(*a, **k))
+    with pytest.raises(requests.ConnectionError):
+        gns.create_project("lab")
+    assert len(attempts) == 3
+
+
+def test_post_is_not_retried_on_read_timeout(stub, monkeypatch):
+    gns = client(stub, retries=2)
+    attempts = []
+
+    def timeout(*args, **kwargs):
+        attempts.append(args)
+        raise requests.ReadTimeout("read timed out")
+
+    monkeypatch.setattr(gns.session, "request", timeout)
+    with pytest.raises(requests.ReadTimeout):
+        gns.create_project("lab")
+    assert len(attempts) == 1
+
+
+def test_client_errors_are_not_retried(stub):
+    gns = client(stub)
+    calls = stub.gns.calls
+    with pytest.raises(requests.HTTPError) as e:
+        gns.get_nodes("no-such-project")
+    assert e.value.response.status_code == 404
+    assert stub.gns.calls - calls == 1
+
+
+def test_link_on_a_used_port_is_a_conflict(stub):
+    gns = client(stub)
+    project_id = gns.create_project("lab")
+    a, b = gns.create_nodes(project_id, APP_ID, [{"name": "a"}, {"name": "b"}])
+    link = {"nodes": [
+        {"node_id": a["node_id"], "adapter_number": 0, "port_number": 0},
+        {"node_id": b["node_id"], "adapter_number": 0, "port_number": 0}]}
+    gns.create_link(project_id, link)
+    with pytest.raises(requests.HTTPError) as e:
+        gns.create_link(project_id, link)
+    assert e.value.response.status_code == 409
+
+
+def test_node_is_named_when_created(stub):
+    gns = GnsClient(stub.address, backoff=0)
+    project_id = gns.create_project("lab")
+    calls = stub.gns.calls
+    node = gns.create_node(project_id, APP_ID, "r1")
+    assert node["name"] == "r1"
+    assert stub.gns.calls - calls == 1
+    assert gns.use_templates is True
+
+
+def test_server_without_templates(stub):
+    gns = GnsClient(stub.address, backoff=0)
+    project_id = gns.create_project("lab")
+    stub.gns.inject("POST", r"/projects/[^/]+/templates/[^/]+", 404,
+                    times=10)
+    calls = stub.gns.calls
+    assert gns.create_node(project_id, APP_ID, "r1")["name"] == "r1"
+    assert stub.gns.calls - calls == 3
+    assert gns.use_templates is False
+    calls = stub.gns.calls
+    assert gns.create_node(project_id, APP_ID, "r2")["name"] == "r2"
+    assert stub.gns.calls - calls == 2
+    assert sorted(x["name"] for x in gns.get_nodes(project_id)) == [
+        "r1", "r2"]
+
+
+def test_missing_template_keeps_the_template_endpoint(stub):
+    gns = GnsClient(stub.address, backoff=0)
+    project_id = gns.create_project("lab")
+    with pytest.raises(requests.HTTPError) as e:
+        gns.create_node(project_id, "no-such-template", "r1")
+    assert e.value.response.status_code == 404
+    assert gns.use_templates is None
+    gns.create_node(project_id, APP_ID, "r1")
+    assert gns.use_templates is True
@@ -0,0 +1,93 @@
+from modfile import Renamer
+from modfile import full_intf_type
+from modfile import intf_aliases
+from modfile import mod_intf
+from modfile import rename_intfs
+
+
+CONFIG = """interface GigabitEthernet1/0/1
+ description to r2 Gi1/0/10
+ ip address 10.0.0.1 255.255.255.252
+interface GigabitEthernet1/0/10
+ ip address 10.0.0.5 255.255.255.252
+interface TenGigabitEthernet1/1/1
+ ip address 10.0.0.9 255.255.255.252
+router ospf 1
+ passive-interface Gi1/0/1
+ passive-interface Te1/1/1
+"""
+
+
+def test_full_intf_type():
+    assert full_intf_type("gi") == "GigabitEthernet"
+    assert full_intf_type("Te") == "TenGigabitEthernet"
+    assert full_intf_type("Ethernet") == "Ethernet"
+    assert full_intf_type("Nve") == "Nve"
+
+
+def test_intf_aliases():
+    assert intf_aliases("Gi1/0/1") == [
+        "Gi1/0/1", "GigabitEthernet1/0/1", "Gi1/0/1", "Gig1/0/1"]
+    assert intf_aliases("nonsense") == ["nonsense"]
+
+
+def test_abbreviations_are_expanded():
+    text = rename_intfs(CONFIG, {"GigabitEthernet1/0/1": "Ethernet1/0",
+                                 "TenGigabitEthernet1/1/1": "Ethernet1/2"})
+    assert "interface Ethernet1/0\n" in text
+    assert "interface Ethernet1/2\n" in text
+    assert " passive-interface Ethernet1/0\n" in text
+    assert " passive-interface Ethernet1/2\n" in text
+
+
+def test_abbreviated_old_name():
+    text = rename_intfs(CONFIG, {"Te1/1/1": "Ethernet1/2"})
+    assert "interface Ethernet1/2\n" in text
+    assert " passive-interface Ethernet1/2\n" in text
+
+
+def test_case_is_ignored():
+    assert rename_intfs("interface gigabitethernet0/1\n",
+                        {"GigabitEthernet0/1": "Ethernet1/0"}) == \
+        "interface Ethernet1/0\n"
+
+
+def test_word_boundaries():
+    text = rename_intfs(CONFIG, {"GigabitEthernet1/0/1": "Ethernet1/0"})
+    assert "interface GigabitEthernet1/0/10\n" in text
+    assert "description to r2 Gi1/0/10\n" in text
+    assert rename_intfs("interface Ethernet1/1/1\n",
+                        {"Ethernet1/1": "Ethernet2/0"}) == \
+        "interface Ethernet1/1/1\n"
+    assert rename_intfs("neighbor 10.1.1.1 remote-as 1\n",
+                        {"Ethernet1/1": "Ethernet2/0"}) == \
+        "neighbor 10.1.1.1 remote-as 1\n"
+
+
+def test_subinterfaces_follow_their_parent():
+    text = rename_intfs(
+        "interface Gi0/1.100\n encapsulation dot1Q 100\n"
+        "interface Gi0/1\n",
+        {"GigabitEthernet0/1": "Ethernet1/0"})
+    assert text == ("interface Ethernet1/0.100\n encapsulation dot1Q 100\n"
+                    "interface Ethernet1/0\n")
+
+
+def test_renames_dont_chain():
+    text = rename_intfs("interface Ethernet1/0\ninterface Ethernet1/1\n",
+                        {"Ethernet1/0": "Ethernet1/1",
+                         "Ethernet1/1": "Ethernet1/0"})
+    assert text == "interface Ethernet1/1\ninterface Ethernet1/0\n"
+
+
+def test_no_renames():
+    assert Renamer({}).sub(CONFIG) == CONFIG
+
+
+def test_mod_intf(tmp_path):
+    filename = tmp_path / "r1-gns.cfg"
+    filename.write_text(CONFIG)
+    mod_intf(str(filename), ("Gi1/0/1", "Ethernet1/0"))
+    assert filename.read_text() == rename_intfs(
+        CONFIG, {"Gi1/0/1": "Ethernet1/0"})
+    assert [x.name for x in tmp_path.iterdir()] == ["r1-gns.cfg"]
@@ -0,0 +1,118 @@
+import collections
+import contextlib
+import os
+
+import pytest
+
+import netmodel
+from benchmark import PARTITION_COMPUTES
+from benchmark import build_case
+from gnsstub import DEFAULT_TEMPLATES
+from netindex import PrefixFilter
+from partition import compute_loads
+from partition import cut_links
+from partition import partition
+from ports import PortAllocator
+from ports import template_layout
+from synthetic import generate
+
+
+# ram and cpus of the three computes of the benchmark, gns1 is twice the
+# size of the others
+
+CAPACITY = [(x["memory"] // 2 ** 20, x["cpus"])
+            for x in PARTITION_COMPUTES.values()]
+
+
+def graph(kind, size):
+    allocator = PortAllocator(dict(
+        (k, template_layout(v)) for k, v in DEFAULT_TEMPLATES.items()))
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            model = netmodel.build_model(generate(kind, size).router_get(),
+                                         allocator, PrefixFilter({4: [24]}))
+    names = [x.name for x in model["gns_node_list"] + model["switches"]]
+    edges = [(a.name, b.name) for (a, _, _), (b, _, _) in model["links"]]
+    demand = dict((x, (256, 1)) for x in names)
+    demand.update((x.name, (0, 0)) for x in model["switches"])
+    return names, edges, demand
+
+
+def assert_balanced(counts, total, capacity, imbalance=0.05):
+    ram = sum(x[0] for x in capacity)
+    for count, cap in zip(counts, capacity):
+        share = total * cap[0] / ram
+        assert share * (1 - imbalance) - 1 <= count
+        assert count <= share * (1 + imbalance) + 1
+
+
+@pytest.mark.parametrize("kind,size", [
+    ("leaf-spine", 1000), ("hub-spoke", 1000), ("full-mesh", 30)])
+def test_shares_and_cut(kind, size):
+    names, edges, demand = graph(kind, size)
+    parts = partition(names, edges, demand, CAPACITY)
+    loads = compute_loads(parts, demand, len(CAPACITY))
+    assert_balanced([x[1] // 256 for x in loads], size, CAPACITY)
+    spread = dict((x, n % len(CAPACITY)) for n, x in enumerate(names))
+    assert cut_links(edges, parts) < cut_links(edges, spread)
+
+
+def test_two_clusters():
+    names = ["a" + str(i) for i in range(10)] + \
+        ["b" + str(i) for i in range(10)]
+    edges = [(x + str(i), x + str(j)) for x in "ab"
+             for i in range(10) for j in range(i + 1, 10)]
+    edges.append(("a0", "b0"))
+    demand = dict((x, (256, 1)) for x in names)
+    parts = partition(names, edges, demand, [(65536, 32), (65536, 32)])
+    assert cut_links(edges, parts) == 1
+    assert len(set(parts[x] for x in names[:10])) == 1
+
+
+# the leaves all want to be with the hub, the compute they were grown on
+# mustn't be drained below its share
+
+def test_a_compute_keeps_its_share():
+    names = ["hub"] + ["leaf" + str(i) for i in range(40)]
+    edges = [("hub", x) for x in names[1:]]
+    demand = dict((x, (256, 1)) for x in names)
+    parts = partition(names, edges, demand, [(65536, 32), (65536, 32)])
+    counts = collections.Counter(parts.values())
+    assert_balanced([counts[0], counts[1]], len(names),
+                    [(65536, 32), (65536, 32)])
+
+
+def test_fixed_nodes_stay():
+    names, edges, demand = graph("hub-spoke", 200)
+    fixed = dict((x, 2) for x in names[:20])
+    parts = partition(names, edges, demand, CAPACITY, fixed)
+    assert all(parts[x] == 2 for x in fixed)
+
+
+def test_switches_cost_nothing():
+    names = ["r1", "r2", "sw1"]
+    demand = {"r1": (256, 1), "r2": (256, 1), "sw1": (0, 0)}
+    parts = partition(names, [("r1", "sw1"), ("r2", "sw1")], demand,
+                      [(1024, 2), (1024, 2)])
+    assert sorted(parts[x] for x in ("r1", "r2")) == [0, 1]
+
+
+# a build on three stub computes: every compute gets its share of the
+# routers and the links between computes are created like any other
+
+def test_build_on_several_computes():
+    router_get = generate("leaf-spine", 150).router_get()
+    (nodes, links), _, _ = build_case(
+        router_get, 0, ["--computes", ",".join(PARTITION_COMPUTES)],
+        PARTITION_COMPUTES)
+    compute = dict((x[0], x[2]) for x in nodes)
+    routers = collections.Counter(x[2] for x in nodes
+                                  if x[1] != "ethernet_switch")
+    assert set(routers) == set(PARTITION_COMPUTES)
+    assert_balanced([routers[x] for x in PARTITION_COMPUTES],
+                    len(router_get), CAPACITY)
+
+    names, edges, _ = graph("leaf-spine", 150)
+    assert len(links) == len(edges)
+    between = [x for x in links if compute[x[0][0]] != compute[x[1][0]]]
+    assert 0 < len(between) < len(links)
@@ -0,0 +1,142 @@
+import functools
+import os
+import time
+
+import pytest
+
+import netmodel
+from benchmark import build_case
+from benchmark import project_state
+from configrules import DEFAULT_PLATFORM
+from pipeline import PipelinedBuild
+from synthetic import generate
+from test_resume import LINKS
+from test_resume import build
+from test_resume import write_cache
+from test_resume import workdir  # noqa: F401
+
+
+# the cached devices are fetched again instead of read, the ones in slow
+# answer last
+
+class Refetch(PipelinedBuild):
+
+    slow = ()
+
+    def discover(self):
+        parse = []
+        for name in sorted(self.cache.index):
+            result = self.cache.get(name, ttl=None)
+            host = {"name": name, "hostname": name,
+                    "platform": result.get("platform", DEFAULT_PLATFORM)}
+            fetch = self.sched.add(
+                "fetch:" + name, "fetch", self.answer, result,
+                0.5 if name in self.slow else 0,
+                done=functools.partial(self.fetched, host))
+            parse.append(self.sched.add(
+                "parse:" + name, "parse", self.create_node, name,
+                deps=[fetch], done=self.parsed))
+        self.hosts = len(parse)
+        return parse
+
+    def answer(self, result, delay):
+        time.sleep(delay)
+        return result
+
+
+def pipelined(stub, build_class=PipelinedBuild):
+    args = netmodel.make_parser().parse_args(
+        ["build", "--offline", "--no-upload", "--gns-server", stub.address,
+         "--project-name", "lab", "--pipeline"])
+    pipeline = build_class(netmodel.load_config(args))
+    pipeline.run()
+    return pipeline
+
+
+def configs(directory="configs"):
+    result = {}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name)) as f:
+            result[name] = f.read()
+    return result
+
+
+@pytest.mark.parametrize("kind,size", [("hub-spoke", 40),
+                                       ("leaf-spine", 52)])
+def test_same_project_as_the_sequential_build(kind, size):
+    router_get = generate(kind, size).router_get()
+    sequential = build_case(router_get, 0, [])
+    pipelined = build_case(router_get, 0, ["--pipeline"])
+    assert sequential[0] == pipelined[0]
+    assert sequential[1] == pipelined[1]
+
+
+# every router of the lab has its template and its ports before the model.
+# while the hub is fetched the spokes are created and configured, the hub
+# itself is created after the model. the hub answering last changes the
+# layout, the rest of the project is the sequential one
+
+def test_routers_start_while_a_device_is_fetched(stub, workdir,
+                                                 monkeypatch):
+    hub = sorted(generate("hub-spoke", 12).router_get())[0]
+    monkeypatch.setattr(Refetch, "slow", [hub])
+    pipeline = pipelined(stub, Refetch)
+    names = set(x.name for x in pipeline.model["gns_node_list"])
+    assert pipeline.placed == names - set([hub])
+    assert set(pipeline.early) == names
+    results = pipeline.sched.results
+    assert all("move:" + x in results for x in pipeline.placed)
+    assert not [x for x in results if x.startswith("reconfig:")]
+    nodes, links = project_state(stub)
+    positions = pipeline.model["positions"]
+    assert all((x, y) == positions[name] for name, _, _, x, y in nodes)
+    early = configs()
+
+    (workdir / "clean").mkdir()
+    monkeypatch.chdir(workdir / "clean")
+    write_cache()
+    clean = type(stub)().start()
+    try:
+        build(clean)
+        assert [x[:3] for x in project_state(clean)[0]] == \
+            [x[:3] for x in nodes]
+        assert project_state(clean)[1] == links
+    finally:
+        clean.stop()
+    assert configs() == early
+
+
+# with every device in the cache the model comes right away, the routers
+# are created after it and nothing has to be moved
+
+def test_cached_routers_are_created_in_place(stub, workdir):
+    pipeline = pipelined(stub)
+    assert not pipeline.placed
+    assert not [x for x in pipeline.sched.results if x.startswith("move:")]
+
+
+# a router taken for resolved before its neighbours were parsed has its
+# config generated with too few ports, the model has it generated again
+
+def test_a_config_with_other_ports_is_generated_again(stub, workdir,
+                                                      monkeypatch):
+    monkeypatch.setattr(PipelinedBuild, "resolved", lambda self, name: True)
+    pipeline = pipelined(stub)
+    assert [x for x in pipeline.sched.results if x.startswith("reconfig:")]
+    early = configs()
+
+    (workdir / "clean").mkdir()
+    monkeypatch.chdir(workdir / "clean")
+    write_cache()
+    build(stub)
+    assert early == configs()
+
+
+def test_a_failed_task_fails_the_build(stub, workdir, capsys):
+    stub.gns.inject("POST", LINKS, 409)
+    with pytest.raises(SystemExit) as e:
+        build(stub, "--pipeline")
+    assert str(e.value) == "1 tasks of the build failed"
+    out = capsys.readouterr().out
+    assert "These tasks didn't run to the end:" in out
+    assert "  link:" in out
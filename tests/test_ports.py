@@ -0,0 +1,121 @@
+import pytest
+
+from gnsmodel import Interface
+from gnsmodel import Node
+from ports import PortAllocator
+from ports import switch_ports
+from ports import template_layout
+
+
+IOU = {"template_type": "iou", "ethernet_adapters": 16}
+
+QEMU = {"template_type": "qemu", "adapters": 8,
+        "port_name_format": "Gi0/{0}", "first_port_name": "mgmt0"}
+
+DYNAMIPS = {"template_type": "dynamips", "platform": "c7200",
+            "slot0": "C7200-IO-FE", "slot1": "PA-2FE-TX", "slot2": "PA-GE",
+            "slot3": "PA-8E"}
+
+
+def node(count):
+    gns_node = Node("r1")
+    for i in range(count):
+        ip = "10.{}.{}.1".format(i // 256, i % 256)
+        gns_node.add_intf(Interface("e" + str(i), ip, 30))
+    return gns_node
+
+
+def test_iou_layout():
+    layout = template_layout(IOU)
+    assert len(layout) == 15 * 4
+    assert layout[:5] == [(1, 0, "Ethernet1/0"), (1, 1, "Ethernet1/1"),
+                          (1, 2, "Ethernet1/2"), (1, 3, "Ethernet1/3"),
+                          (2, 0, "Ethernet2/0")]
+    assert layout[-1] == (15, 3, "Ethernet15/3")
+
+
+def test_iou_layout_from_management_adapter():
+    layout = template_layout(IOU, first_adapter=0)
+    assert len(layout) == 64
+    assert layout[0] == (0, 0, "Ethernet0/0")
+
+
+def test_iou_appliance_properties():
+    appliance = {"node_type": "iou", "properties": {"ethernet_adapters": 4}}
+    assert len(template_layout(appliance)) == 12
+
+
+def test_qemu_layout():
+    layout = template_layout(QEMU)
+    assert layout == [(x, 0, "Gi0/" + str(x)) for x in range(1, 8)]
+    assert template_layout(QEMU, first_adapter=0)[0] == (0, 0, "mgmt0")
+
+
+def test_qemu_port_segments():
+    template = {"template_type": "qemu", "adapters": 10,
+                "port_name_format": "Ethernet{segment0}/{port0}",
+                "port_segment_size": 4}
+    names = [x[2] for x in template_layout(template, first_adapter=0)]
+    assert names[:5] == ["Ethernet0/0", "Ethernet0/1", "Ethernet0/2",
+                         "Ethernet0/3", "Ethernet1/0"]
+    assert names[-1] == "Ethernet2/1"
+
+
+def test_dynamips_layout():
+    layout = template_layout(DYNAMIPS)
+    assert layout == [(1, 0, "FastEthernet1/0"), (1, 1, "FastEthernet1/1"),
+                      (2, 0, "GigabitEthernet2/0")] + [
+                         (3, x, "Ethernet3/" + str(x)) for x in range(8)]
+
+
+def test_unknown_template_type():
+    with pytest.raises(ValueError):
+        template_layout({"template_type": "docker"})
+
+
+def test_smallest_template_that_fits():
+    allocator = PortAllocator({"iou": template_layout(IOU),
+                               "qemu": template_layout(QEMU),
+                               "dynamips": template_layout(DYNAMIPS)})
+    assert allocator.choose(3)[0] == "qemu"
+    assert allocator.choose(7)[0] == "qemu"
+    assert allocator.choose(8)[0] == "dynamips"
+    assert allocator.choose(11)[0] == "dynamips"
+    assert allocator.choose(12)[0] == "iou"
+    assert allocator.choose(60)[0] == "iou"
+
+
+def test_allocate_ports():
+    allocator = PortAllocator({"iou": template_layout(IOU),
+                               "qemu": template_layout(QEMU)})
+    gns_node = node(9)
+    allocator.allocate(gns_node)
+    assert gns_node.template == "iou"
+    ports = [(x.adapter, x.port, x.gns_name) for x in gns_node.interfaces]
+    assert ports == template_layout(IOU)[:9]
+
+
+def test_hundreds_of_interfaces():
+    big = {"template_type": "iou", "ethernet_adapters": 101}
+    allocator = PortAllocator({"iou": template_layout(IOU),
+                               "big": template_layout(big)})
+    gns_node = node(400)
+    allocator.allocate(gns_node)
+    assert gns_node.template == "big"
+    ports = set((x.adapter, x.port) for x in gns_node.interfaces)
+    assert len(ports) == 400
+    assert gns_node.interfaces[-1].gns_name == "Ethernet100/3"
+
+
+def test_too_many_interfaces():
+    allocator = PortAllocator({"iou": template_layout(IOU),
+                               "qemu": template_layout(QEMU)})
+    with pytest.raises(ValueError) as e:
+        allocator.allocate(node(61))
+    assert str(e.value) == "no template has 61 ports, the largest has 60"
+
+
+def test_switch_ports():
+    ports = switch_ports(3)
+    assert [x["port_number"] for x in ports] == [0, 1, 2]
+    assert all(x["type"] == "access" and x["vlan"] == 1 for x in ports)
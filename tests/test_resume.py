@@ -0,0 +1,105 @@
+import pytest
+
+import netmodel
+from benchmark import project_state
+from cache import DiscoveryCache
+from synthetic import generate
+
+
+LINKS = r"/projects/[^/]+/links"
+
+
+def write_cache():
+    cache = DiscoveryCache(".netmodel-cache")
+    for name, result in generate("hub-spoke", 12).router_get().items():
+        cache.put(name, result, name)
+    cache.save()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    (tmp_path / "lab").mkdir()
+    monkeypatch.chdir(tmp_path / "lab")
+    write_cache()
+    return tmp_path
+
+
+def build(stub, *flags):
+    args = netmodel.make_parser().parse_args(
+        ["build", "--offline", "--no-upload", "--gns-server", stub.address,
+         "--project-name", "lab"] + list(flags))
+    netmodel.cmd_build(netmodel.load_config(args))
+
+
+# the links of the same build without failures
+
+def expected(workdir, monkeypatch):
+    from gnsstub import StubServer
+
+    (workdir / "clean").mkdir()
+    monkeypatch.chdir(workdir / "clean")
+    write_cache()
+    clean = StubServer().start()
+    try:
+        build(clean)
+        return project_state(clean)[1]
+    finally:
+        clean.stop()
+
+
+def test_resume_after_links_the_server_made(stub, workdir, monkeypatch,
+                                            capsys):
+    stub.gns.inject("POST", LINKS, 500, times=5, applied=True)
+    with pytest.raises(SystemExit) as e:
+        build(stub)
+    assert "5 of" in str(e.value)
+    assert "These links couldn't be created" in capsys.readouterr().out
+    build(stub, "--resume", "links")
+    out = capsys.readouterr().out
+    assert "0 to create" in out
+    links = project_state(stub)[1]
+    assert links == expected(workdir, monkeypatch)
+
+
+def test_resume_creates_only_missing_links(stub, workdir, monkeypatch,
+                                          capsys):
+    stub.gns.inject("POST", LINKS, 503, times=3)
+    with pytest.raises(SystemExit):
+        build(stub)
+    before = len(project_state(stub)[1])
+    build(stub, "--resume", "links")
+    assert "3 to create" in capsys.readouterr().out
+    links = project_state(stub)[1]
+    assert len(links) == before + 3
+    assert links == expected(workdir, monkeypatch)
+
+
+def test_conflict_is_reported(stub, workdir):
+    stub.gns.inject("POST", LINKS, 409)
+    with pytest.raises(SystemExit) as e:
+        build(stub)
+    assert str(e.value).startswith("1 of ")
+
+
+# the nodes stage fails part way, the resumed build finishes the project it
+# made instead of starting another one
+
+def test_resume_nodes_in_the_same_project(stub, workdir, monkeypatch,
+                                          capsys):
+    import requests
+
+    stub.gns.inject("POST", r"/projects/[^/]+/templates/[^/]+", 500,
+                    times=2)
+    with pytest.raises(requests.HTTPError):
+        build(stub)
+    p_id, = stub.gns.projects
+    made = len(project_state(stub)[0])
+    assert 0 < made < 12
+    capsys.readouterr()
+    build(stub, "--resume", "nodes")
+    out = capsys.readouterr().out
+    assert "{} nodes unchanged, {} to create".format(made, 12 - made) in out
+    assert list(stub.gns.projects) == [p_id]
+    nodes, links = project_state(stub)
+    assert len(set(x[0] for x in nodes)) == len(nodes) == 12
+    assert links == expected(workdir, monkeypatch)
@@ -0,0 +1,111 @@
+from configgen import build_config
+from gnsmodel import Switch
+from netindex import PrefixFilter
+from netmodel import build_model
+from netmodel import create_interface_list
+from ports import PortAllocator
+from ports import template_layout
+
+
+ALLOCATOR = PortAllocator({"iou": template_layout(
+    {"template_type": "iou", "ethernet_adapters": 4})})
+
+FILTER = PrefixFilter({4: [32], 6: [128]})
+
+
+def intf(ipv4=None, ipv6=()):
+    result = {}
+    if ipv4:
+        ip, prefix = ipv4.split("/")
+        result["ipv4"] = {ip: {"prefix_length": int(prefix)}}
+    if ipv6:
+        result["ipv6"] = dict((x.split("/")[0],
+                               {"prefix_length": int(x.split("/")[1])})
+                              for x in ipv6)
+    return result
+
+
+def device(name, intfs, config=""):
+    return {"config": {"running": "hostname {}\n{}".format(name, config)},
+            "interfaces_ip": intfs}
+
+
+def model(router_get):
+    return build_model(router_get, ALLOCATOR, FILTER)
+
+
+def link_names(model):
+    return sorted(sorted((x.name, adapter, port) for x, adapter, port in ends)
+                  for ends in model["links"])
+
+
+def test_link_local_addresses_are_skipped():
+    intfs = create_interface_list({
+        "Ethernet0/0": intf(ipv6=["fe80::1/64"]),
+        "Ethernet0/1": intf("10.0.0.1/30", ["fe80::1/64",
+                                            "2001:db8::1/64"])})
+    assert [x.name for x in intfs] == ["Ethernet0/1"]
+    assert intfs[0].ip_string == "10.0.0.1"
+    assert len(intfs[0].keys) == 2
+
+
+def test_ipv6_point_to_point():
+    m = model({
+        "r1": device("r1", {"Ethernet0/0": intf(ipv6=["2001:db8::/127",
+                                                      "fe80::1/64"])}),
+        "r2": device("r2", {"Ethernet0/0": intf(ipv6=["2001:db8::1/127",
+                                                      "fe80::1/64"])}),
+        })
+    assert m["netlist"] == ["2001:db8::/127"]
+    assert m["switches"] == []
+    assert link_names(m) == [[("r1", 1, 0), ("r2", 1, 0)]]
+
+
+def test_dual_stack_is_one_link():
+    m = model({
+        "r1": device("r1", {"Ethernet0/0": intf(
+            "10.0.0.1/30", ["2001:db8:1::1/64"])}),
+        "r2": device("r2", {"Ethernet0/0": intf(
+            "10.0.0.2/30", ["2001:db8:1::2/64"])}),
+        })
+    assert m["netlist"] == ["10.0.0.0/30"]
+    assert link_names(m) == [[("r1", 1, 0), ("r2", 1, 0)]]
+
+
+def test_multi_access_segment_gets_a_switch():
+    lan = dict(("r" + str(i), device("r" + str(i), {
+        "Ethernet0/0": intf("10.1.0.{}/29".format(i),
+                            ["2001:db8:2::{}/64".format(i)]),
+        "Ethernet0/1": intf("10.0.{}.1/30".format(i))}))
+        for i in range(1, 4))
+    lan["r4"] = device("r4", {"Ethernet0/0": intf("10.0.1.2/30")})
+    m = model(lan)
+    switch, = m["switches"]
+    assert isinstance(switch, Switch)
+    assert switch.ports == 3
+    assert link_names(m) == sorted([
+        [("r1", 1, 1), ("r4", 1, 0)],
+        [("r1", 1, 0), (switch.name, 0, 0)],
+        [("r2", 1, 0), (switch.name, 0, 1)],
+        [("r3", 1, 0), (switch.name, 0, 2)],
+        ])
+    assert [len(x["nodes"]) for x in m["netmap"]] == [2, 3]
+
+
+def test_ipv6_interface_config():
+    config = ("interface Ethernet0/0\n"
+              " ipv6 address 2001:DB8::1/127\n"
+              " ipv6 ospf 1 area 0\n"
+              "interface Ethernet0/1\n"
+              " ipv6 address 2001:db8:9::1/64\n")
+    m = model({
+        "r1": device("r1", {"Ethernet0/0": intf(ipv6=["2001:db8::1/127"]),
+                            "Ethernet0/1": intf(ipv6=["2001:db8:9::1/64"])},
+                     config),
+        "r2": device("r2", {"Ethernet0/0": intf(ipv6=["2001:db8::/127"])}),
+        })
+    r1 = m["gns_node_list"][0]
+    text, _ = build_config(r1, "hostname r1\n" + config)
+    assert "interface Ethernet1/0\n ipv6 address 2001:DB8::1/127\n" in text
+    assert " ipv6 ospf 1 area 0\n" in text
+    assert "2001:db8:9::1" not in text
@@ -0,0 +1,122 @@
+import netmodel
+from benchmark import project_state
+from gnsmodel import Node
+from gnsproject import GnsClient
+from gnsstub import DEFAULT_TEMPLATES
+from sync import apply_deletes
+from sync import plan_sync
+from test_resume import build
+from test_resume import workdir  # noqa: F401
+
+
+APP_ID = next(iter(DEFAULT_TEMPLATES))
+
+
+# r1 - r2 - r3 in a line, links are (node, adapter, port) pairs
+
+def lab(names, links):
+    nodes = dict((x, Node(x)) for x in names)
+    return (list(nodes.values()),
+            [((nodes[a], 1, pa), (nodes[b], 1, pb))
+             for (a, pa), (b, pb) in links])
+
+
+LINE = (["r1", "r2", "r3"], [(("r1", 0), ("r2", 0)), (("r2", 1), ("r3", 0))])
+
+
+def project(stub, names, links):
+    gns = GnsClient(stub.address, backoff=0)
+    p_id = gns.create_project("lab")
+    ids = dict((x["name"], x["node_id"]) for x in gns.create_nodes(
+        p_id, APP_ID, [{"name": x} for x in names]))
+    for (a, pa), (b, pb) in links:
+        gns.create_link(p_id, {"nodes": [
+            {"node_id": ids[a], "adapter_number": 1, "port_number": pa},
+            {"node_id": ids[b], "adapter_number": 1, "port_number": pb}]})
+    return gns, p_id
+
+
+def test_nothing_changed(stub):
+    gns, p_id = project(stub, *LINE)
+    plan = plan_sync(gns, p_id, *lab(*LINE))
+    assert plan["create_nodes"] == []
+    assert plan["delete_nodes"] == []
+    assert sorted(plan["keep_nodes"]) == ["r1", "r2", "r3"]
+    assert plan["create_links"] == []
+    assert plan["delete_links"] == []
+
+
+def test_a_node_and_a_link_are_added(stub):
+    gns, p_id = project(stub, *LINE)
+    names, links = LINE
+    plan = plan_sync(gns, p_id, *lab(names + ["r4"],
+                                     links + [(("r3", 1), ("r4", 0))]))
+    assert plan["create_nodes"] == ["r4"]
+    assert plan["delete_nodes"] == []
+    assert plan["create_links"] == [
+        frozenset([("r3", 1, 1), ("r4", 1, 0)])]
+    assert plan["delete_links"] == []
+
+
+def test_a_node_and_a_link_are_removed(stub):
+    gns, p_id = project(stub, ["r1", "r2", "r3", "r4"],
+                        LINE[1] + [(("r3", 1), ("r4", 0)),
+                                   (("r1", 1), ("r3", 2))])
+    names, links = LINE
+    plan = plan_sync(gns, p_id, *lab(names, links))
+    assert [x["name"] for x in plan["delete_nodes"]] == ["r4"]
+    assert [x["endpoints"] for x in plan["delete_links"]] == [
+        frozenset([("r1", 1, 1), ("r3", 1, 2)])]
+    assert plan["create_nodes"] == []
+    assert plan["create_links"] == []
+
+    # the link to r4 goes with the node
+
+    apply_deletes(gns, p_id, plan)
+    assert project_state(stub)[1] == [[("r1", 1, 0), ("r2", 1, 0)],
+                                      [("r2", 1, 1), ("r3", 1, 0)]]
+    assert plan_sync(gns, p_id, *lab(names, links))["delete_links"] == []
+
+
+def test_a_moved_link(stub):
+    gns, p_id = project(stub, *LINE)
+    plan = plan_sync(gns, p_id, *lab(
+        ["r1", "r2", "r3"], [(("r1", 0), ("r2", 0)), (("r2", 2), ("r3", 0))]))
+    assert plan["create_links"] == [frozenset([("r2", 1, 2), ("r3", 1, 0)])]
+    assert [x["endpoints"] for x in plan["delete_links"]] == [
+        frozenset([("r2", 1, 1), ("r3", 1, 0)])]
+
+
+def test_a_slice_leaves_the_rest_alone(stub):
+    gns, p_id = project(stub, *LINE)
+    plan = plan_sync(gns, p_id, *lab(["r1", "r2"], [(("r1", 0), ("r2", 0))]),
+                     scope={"r1", "r2"})
+    assert plan["delete_nodes"] == []
+    assert plan["delete_links"] == []
+
+
+# a second build of the same network into the project changes nothing,
+# one with a device gone deletes its node and links
+
+def test_resync(stub, workdir, capsys):  # noqa: F811
+    build(stub)
+    before = project_state(stub)
+    p_id, = stub.gns.projects
+    capsys.readouterr()
+    build(stub, "--project-id", p_id)
+    out = capsys.readouterr().out
+    assert "12 nodes unchanged, 0 to create, 0 to delete" in out
+    assert "0 links to create, 0 to delete" in out
+    assert project_state(stub) == before
+
+    cache = netmodel.DiscoveryCache(".netmodel-cache")
+    gone = sorted(cache.index)[-1]
+    cache.invalidate([gone])
+    cache.save()
+    build(stub, "--project-id", p_id)
+    out = capsys.readouterr().out
+    assert "  - node " + gone in out
+    nodes, links = project_state(stub)
+    assert gone not in [x[0] for x in nodes]
+    assert len(nodes) == len(before[0]) - 1
+    assert all(gone not in [x[0] for x in link] for link in links)
@@ -0,0 +1,57 @@
+import collections
+
+import pytest
+
+from synthetic import generate
+from topology import TopologyIndex
+
+
+def index(topo):
+    networks = collections.defaultdict(list)
+    for name, intfs in topo.devices.items():
+        for intf, ip, prefix, _ in intfs:
+            if prefix == 30:
+                networks[ip & ~3].append(name)
+    return TopologyIndex(networks, topo.devices)
+
+
+@pytest.mark.parametrize("kind,size", [
+    ("leaf-spine", 10), ("leaf-spine", 300), ("leaf-spine", 2000),
+    ("hub-spoke", 300), ("full-mesh", 12)])
+def test_one_network_within_the_ports(kind, size):
+    topo = generate(kind, size)
+    topology = index(topo)
+    assert len(topo.devices) == size
+    assert len(topology.neighbourhood([next(iter(topo.devices))],
+                                      size)) == size
+    assert max(len(topology.neighbours(x)) for x in topo.devices) <= 48
+
+
+# sizes where the spine count is a multiple of the uplinks used to split
+# the fabric in pods
+
+@pytest.mark.parametrize("size", [5, 52, 104, 300, 520, 1000, 3001])
+def test_leaf_spine_is_connected(size):
+    topo = generate("leaf-spine", size)
+    topology = index(topo)
+    assert len(topology.neighbourhood(["spine1"], size)) == size
+    leaves = sorted(x for x, role in topo.roles.items() if role == "access")
+    assert topology.shortest_path(leaves[0], leaves[-1]) is not None
+
+
+def test_leaf_spine_uplinks():
+    topo = generate("leaf-spine", 300)
+    topology = index(topo)
+    spines = [x for x, role in topo.roles.items() if role == "core"]
+    for name, role in topo.roles.items():
+        if role == "access":
+            assert len(topology.neighbours(name)) == 4
+            assert topology.neighbours(name) <= set(spines)
+    links = [len(topology.neighbours(x)) for x in spines]
+    assert max(links) - min(links) <= 1
+    assert len(topology.shortest_path("spine1", "leaf276")) <= 7
+
+
+def test_same_topology_every_run():
+    assert (generate("leaf-spine", 500).devices ==
+            generate("leaf-spine", 500).devices)
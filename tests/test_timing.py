@@ -0,0 +1,37 @@
+from timing import Profiler
+
+
+def test_stage_memory_is_what_the_stage_added():
+    profiler = Profiler()
+    profiler.enable()
+    with profiler.stage("big"):
+        data = b"x" * (64 * 2 ** 20)
+    del data
+    with profiler.stage("small"):
+        data = b"x" * 2 ** 10
+    big, small = profiler.stages["big"], profiler.stages["small"]
+    assert big["rss_added_mb"] >= 50
+    assert small["rss_added_mb"] < 1
+    assert small["rss_mb"] >= big["rss_mb"]
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.stage("netmap"):
+        pass
+    profiler.count("rest_calls")
+    profiler.add_device("discovery", "r1", 1.0)
+    assert profiler.report()["stages"] == {}
+    assert profiler.counters == {} and profiler.devices == {}
+
+
+def test_stage_calls_add_up():
+    profiler = Profiler()
+    profiler.enable()
+
+    @profiler.timed("parse")
+    def parse():
+        return 1
+
+    assert parse() + parse() == 2
+    assert profiler.stages["parse"]["calls"] == 2
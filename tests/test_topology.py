@@ -0,0 +1,178 @@
+import json
+
+from topology import TopologyIndex
+from topology import crawl
+
+
+# r1 - r2 - r3 - r4 in a line, r5 and r6 on a segment of their own and r7
+# on no network at all
+
+NETWORKS = {
+    "10.0.0.0/30": ["r1", "r2"],
+    "10.0.0.4/30": ["r2", "r3"],
+    "10.0.0.8/30": ["r3", "r4"],
+    "10.0.1.0/24": ["r5", "r6"],
+    }
+
+
+def line():
+    return TopologyIndex(NETWORKS, ["r7"])
+
+
+def test_neighbours():
+    index = line()
+    assert index.neighbours("r2") == {"r1", "r3"}
+    assert index.neighbours("r7") == set()
+    assert index.neighbours("nope") == set()
+
+
+def test_neighbourhood_counts_hops():
+    index = line()
+    assert index.neighbourhood(["r1"], 0) == {"r1": 0}
+    assert index.neighbourhood(["r1"], 2) == {"r1": 0, "r2": 1, "r3": 2}
+    assert index.neighbourhood(["r1", "r4"], 1) == {
+        "r1": 0, "r2": 1, "r3": 1, "r4": 0}
+    assert index.neighbourhood(["r5"], 10) == {"r5": 0, "r6": 1}
+
+
+def test_shortest_path():
+    index = line()
+    assert index.shortest_path("r1", "r4") == ["r1", "r2", "r3", "r4"]
+    assert index.shortest_path("r4", "r2") == ["r4", "r3", "r2"]
+    assert index.shortest_path("r1", "r1") == ["r1"]
+    assert index.shortest_path("r1", "r5") is None
+    assert index.shortest_path("r1", "r7") is None
+
+
+def test_shortest_path_takes_the_shortcut():
+    index = line()
+    index.add("r1", ["10.0.2.0/30"])
+    index.add("r4", ["10.0.2.0/30"])
+    assert index.shortest_path("r1", "r4") == ["r1", "r4"]
+
+
+def test_group():
+    index = line()
+    groups = {"r1": ["core"], "r2": ["access", "edge"], "r9": ["core"]}
+    assert index.group(["core"], groups) == {"r1"}
+    assert index.group(["core", "edge"], groups) == {"r1", "r2"}
+    assert index.group(["none"], groups) == set()
+
+
+def test_update_drops_the_old_networks():
+    index = line()
+    index.update("r2", ["10.0.0.0/30"])
+    assert index.neighbours("r2") == {"r1"}
+    assert index.neighbours("r3") == {"r4"}
+    assert index.shortest_path("r1", "r4") is None
+
+
+def test_missing():
+    assert line().missing(["r1", "r8", "r7", "r9"]) == ["r8", "r9"]
+
+
+def test_save_and_load(tmp_path):
+    filename = str(tmp_path / "cache" / "topology.json")
+    index = line()
+    index.update("r4", [])
+    index.save(filename)
+    loaded = TopologyIndex.load(filename)
+    assert loaded.devices == index.devices
+    assert loaded.networks == dict((k, v) for k, v
+                                   in index.networks.items() if v)
+    with open(filename) as f:
+        assert "10.0.0.8/30" in json.load(f)["networks"]
+
+
+def test_load_without_a_topology(tmp_path):
+    assert TopologyIndex.load(str(tmp_path / "topology.json")) is None
+    (tmp_path / "bad.json").write_text("{")
+    assert TopologyIndex.load(str(tmp_path / "bad.json")) is None
+
+
+def test_load_another_version(tmp_path):
+    filename = str(tmp_path / "topology.json")
+    line().save(filename)
+    with open(filename) as f:
+        data = json.load(f)
+    data["version"] += 1
+    with open(filename, "w") as f:
+        json.dump(data, f)
+    assert TopologyIndex.load(filename) is None
+
+
+# a fetch that returns the networks of the real network, records every call
+# and can't reach the devices in down
+
+class Network():
+
+    def __init__(self, networks, down=()):
+        self.real = TopologyIndex(networks)
+        self.down = set(down)
+        self.calls = []
+
+    def fetch(self, names):
+        self.calls.append(sorted(names))
+        return dict((x, sorted(self.real.devices.get(x, ())))
+                    for x in names if x not in self.down)
+
+    @staticmethod
+    def networks(name, result):
+        return result
+
+    def fetched(self):
+        return sorted(x for call in self.calls for x in call)
+
+
+def test_crawl_within_the_budget():
+    network = Network(NETWORKS)
+    results = crawl(line(), {"r1": 2}, network.fetch, network.networks)
+    assert list(results) == ["r1", "r2", "r3"]
+    assert network.calls == [["r1"], ["r2"], ["r3"]]
+
+
+def test_crawl_fetches_each_device_once():
+    network = Network(NETWORKS)
+    results = crawl(line(), {"r1": 1, "r3": 1}, network.fetch,
+                    network.networks)
+    assert sorted(results) == ["r1", "r2", "r3", "r4"]
+    assert network.fetched() == ["r1", "r2", "r3", "r4"]
+
+
+def test_crawl_takes_the_largest_budget():
+    network = Network(NETWORKS)
+    results = crawl(line(), {"r1": 3, "r2": 0}, network.fetch,
+                    network.networks)
+    assert sorted(results) == ["r1", "r2", "r3", "r4"]
+    assert network.fetched() == ["r1", "r2", "r3", "r4"]
+
+
+def test_crawl_follows_the_fresh_data():
+    # r2 was moved to r5's segment since the topology was saved
+    moved = dict(NETWORKS)
+    moved["10.0.0.4/30"] = ["r3"]
+    moved["10.0.1.0/24"] = ["r2", "r5", "r6"]
+    network = Network(moved)
+    index = line()
+    results = crawl(index, {"r1": 2}, network.fetch, network.networks)
+    assert sorted(results) == ["r1", "r2", "r5", "r6"]
+    assert index.neighbours("r2") == {"r1", "r5", "r6"}
+
+
+def test_crawl_crosses_a_device_it_cant_fetch():
+    network = Network(NETWORKS, down=["r2"])
+    index = line()
+    results = crawl(index, {"r1": 2}, network.fetch, network.networks)
+    assert list(results) == ["r1", "r3"]
+    assert network.calls == [["r1"], ["r2"], ["r3"]]
+    assert index.neighbours("r2") == {"r1", "r3"}
+
+
+def test_crawl_a_seed_new_since_the_save():
+    added = dict(NETWORKS)
+    added["10.0.0.8/30"] = ["r3", "r4", "r8"]
+    network = Network(added)
+    index = line()
+    results = crawl(index, {"r8": 1}, network.fetch, network.networks)
+    assert sorted(results) == ["r3", "r4", "r8"]
+    assert index.missing(["r8"]) == []
@@ -0,0 +1,164 @@
+import os
+
+import pytest
+
+from sftpserver import SftpStub
+from upload import Uploader
+from upload import print_upload_report
+
+
+@pytest.fixture
+def sftp(tmp_path):
+    root = tmp_path / "server"
+    root.mkdir()
+    server = SftpStub(str(root))
+    yield server
+    server.stop()
+
+
+def configs(tmp_path, count):
+    local = tmp_path / "configs"
+    local.mkdir(exist_ok=True)
+    files = []
+    for i in range(count):
+        path = local / "r{}-gns.cfg".format(i)
+        path.write_text("hostname r{}\n".format(i) * (i + 1))
+        files.append((str(path), "/r{}.cfg".format(i)))
+    return files
+
+
+def uploader(sftp, channels=4, manifest=None):
+    return Uploader("127.0.0.1", "gns3", "gns3", port=sftp.port,
+                    channels=channels, manifest=manifest)
+
+
+def upload(sftp, files, manifest=None):
+    up = uploader(sftp, manifest=manifest)
+    try:
+        return up.upload_all(files)
+    finally:
+        up.close()
+
+
+def test_one_login_and_a_channel_each(sftp, tmp_path):
+    files = configs(tmp_path, 20)
+    up = uploader(sftp, channels=3)
+    try:
+        results = up.upload_all(files)
+    finally:
+        up.close()
+    assert sftp.logins == 1
+    assert sftp.channels == 3
+    assert [x["remote"] for x in results] == [x[1] for x in files]
+    for local, remote in files:
+        with open(local) as f, open(sftp.root + remote) as g:
+            assert f.read() == g.read()
+
+
+def test_unchanged_files_are_skipped_without_reading_them(sftp, tmp_path):
+    files = configs(tmp_path, 5)
+    up = uploader(sftp)
+    try:
+        up.upload_all(files)
+        del sftp.opened[:]
+        results = up.upload_all(files)
+    finally:
+        up.close()
+    assert all(x["skipped"] and x["bytes"] == 0 for x in results)
+    assert sftp.opened == []
+
+
+def test_changed_files_go_up_again(sftp, tmp_path):
+    files = configs(tmp_path, 3)
+    up = uploader(sftp)
+    try:
+        up.upload_all(files)
+        local = files[1][0]
+        with open(local, "a") as f:
+            f.write("interface Loopback0\n")
+        results = up.upload_all(files)
+    finally:
+        up.close()
+    assert [x["skipped"] for x in results] == [True, False, True]
+    with open(sftp.root + files[1][1]) as f:
+        assert f.read().endswith("interface Loopback0\n")
+
+
+def test_same_size_other_content(sftp, tmp_path):
+    files = configs(tmp_path, 1)
+    up = uploader(sftp)
+    try:
+        up.upload_all(files)
+        with open(files[0][0], "w") as f:
+            f.write("hostname r9\n")
+        results = up.upload_all(files)
+    finally:
+        up.close()
+    assert not results[0]["skipped"]
+    with open(sftp.root + files[0][1]) as f:
+        assert f.read() == "hostname r9\n"
+
+
+def test_rewritten_files_are_skipped_across_runs(sftp, tmp_path):
+    files = configs(tmp_path, 3)
+    manifest = str(tmp_path / "cache" / "uploads.json")
+    upload(sftp, files, manifest)
+
+    # the next build writes every config again, with the same content
+
+    for local, _ in files:
+        with open(local) as f:
+            text = f.read()
+        with open(local, "w") as f:
+            f.write(text)
+        stat = os.stat(local)
+        os.utime(local, (stat.st_atime, stat.st_mtime + 10))
+    del sftp.opened[:]
+    results = upload(sftp, files, manifest)
+    assert all(x["skipped"] for x in results)
+    assert sftp.opened == []
+
+
+def test_files_changed_on_the_server_go_up_again(sftp, tmp_path):
+    files = configs(tmp_path, 2)
+    manifest = str(tmp_path / "uploads.json")
+    upload(sftp, files, manifest)
+    with open(sftp.root + files[0][1], "w") as f:
+        f.write("hostname r0\n" + "!" * 100)
+    os.remove(sftp.root + files[1][1])
+    results = upload(sftp, files, manifest)
+    assert [x["skipped"] for x in results] == [False, False]
+    for local, remote in files:
+        with open(local) as f, open(sftp.root + remote) as g:
+            assert f.read() == g.read()
+
+
+def test_without_a_manifest_everything_goes_up(sftp, tmp_path):
+    files = configs(tmp_path, 2)
+    upload(sftp, files, str(tmp_path / "uploads.json"))
+    results = upload(sftp, files)
+    assert [x["skipped"] for x in results] == [False, False]
+
+
+def test_failures_are_reported_per_file(sftp, tmp_path, capsys):
+    files = configs(tmp_path, 4)
+    sftp.fail_writes.add("r2.cfg")
+    up = uploader(sftp, channels=2)
+    try:
+        results = up.upload_all(files)
+    finally:
+        up.close()
+    assert [bool(x["error"]) for x in results] == [False, False, True, False]
+    assert results[2]["bytes"] == 0
+    assert not os.path.exists(sftp.root + "/r2.cfg")
+    print_upload_report(results)
+    out = capsys.readouterr().out
+    assert "Uploaded 3 of 4 files" in out
+    assert "1 files failed to upload" in out
+
+
+def test_bad_login(sftp):
+    import paramiko
+
+    with pytest.raises(paramiko.AuthenticationException):
+        Uploader("127.0.0.1", "gns3", "wrong", port=sftp.port)
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from concurrent.futures import CancelledError
+from workers import DaemonPool
+
+
+def slow(x):
+    time.sleep(0.001 * (10 - x % 10))
+    return x * x
+
+
+def fail_on(bad):
+    def run(x):
+        if x in bad:
+            raise ValueError("bad " + str(x))
+        return x
+    return run
+
+
+def test_map_keeps_the_order():
+    pool = DaemonPool(4)
+    try:
+        assert list(pool.map(slow, range(40))) == [x * x for x in range(40)]
+    finally:
+        pool.shutdown()
+
+
+def test_futures_keep_their_results():
+    pool = DaemonPool(3)
+    futures = [pool.submit(slow, x) for x in range(20)]
+    pool.shutdown()
+    assert [x.result() for x in futures] == [x * x for x in range(20)]
+
+
+def test_an_error_stays_with_its_task():
+    pool = DaemonPool(2)
+    futures = [pool.submit(fail_on({3, 7}), x) for x in range(10)]
+    pool.shutdown()
+    for x, future in enumerate(futures):
+        if x in (3, 7):
+            with pytest.raises(ValueError, match="bad " + str(x)):
+                future.result()
+        else:
+            assert future.result() == x
+    assert len(pool.workers) <= 2
+
+
+def test_workers_are_bounded():
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def work(x):
+        with lock:
+            running.append(x)
+            most.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(x)
+
+    pool = DaemonPool(3)
+    list(pool.map(work, range(12)))
+    pool.shutdown()
+    assert max(most) == 3
+
+
+def test_an_abandoned_task_gives_up_its_worker():
+    release = threading.Event()
+    pool = DaemonPool(1)
+    hung = pool.submit(release.wait)
+    while hung not in pool.running:
+        time.sleep(0.001)
+    queued = pool.submit(lambda: "done")
+    pool.abandon(hung)
+    assert queued.result(timeout=5) == "done"
+    assert not hung.done()
+    release.set()
+    assert hung.result(timeout=5) is True
+    pool.shutdown()
+
+
+def test_a_queued_task_is_cancelled():
+    release = threading.Event()
+    pool = DaemonPool(1)
+    pool.submit(release.wait)
+    queued = pool.submit(lambda: "never")
+    pool.abandon(queued)
+    assert queued.cancelled()
+    release.set()
+    pool.shutdown()
+    with pytest.raises(CancelledError):
+        queued.result()
+
+
+def test_shutdown_without_waiting_for_a_hung_task():
+    pool = DaemonPool(2)
+    pool.submit(threading.Event().wait)
+    queued = [pool.submit(threading.Event().wait) for _ in range(3)]
+    start = time.perf_counter()
+    pool.shutdown(wait=False, cancel_futures=True)
+    assert time.perf_counter() - start < 1
+    assert sum(x.cancelled() for x in queued) >= 2
+    with pytest.raises(RuntimeError):
+        pool.submit(slow, 1)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import functools
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+'''
+Stage timing for a netmodel run. The pipeline wraps each stage in
+profiler.stage(), the slow per-device parts in profiler.device() and the
+REST client, config parser and uploader count what they do with
+profiler.count(). Nothing is recorded until enable() is called, a disabled
+profiler is one attribute check per call.
+
+Example of a report:
+{"stages": {"netmap": {"seconds": 0.41, "calls": 1, "rss_mb": 212.0,
+                        "rss_added_mb": 96.5}},
+ "devices": {"discovery": {"r1": 3.2, "r2": 2.9}},
+ "counters": {"rest_calls": 5012, "rest_bytes_sent": 1290311, ...}}
+
+Memory is the peak resident size of the process, which only ever goes up.
+rss_mb is that peak when a stage ended and rss_added_mb how much the stage
+raised it, the memory a stage needed on top of what the stages before it
+had already used. A stage that fits in memory already used adds nothing.
+
+cProfile can be run on one stage, the stats are written to a .pstats file
+that snakeviz or pstats can read. it only sees the main thread, the
+per-device work of the worker pools is in the device times instead.
+'''
+
+
+# peak resident memory of the process so far. linux reports kilobytes
+
+def peak_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Profiler():
+
+    def __init__(self):
+        self.enabled = False
+        self.cprofile_stage = None
+        self.cprofile = None
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.devices = {}
+        self.counters = {}
+
+    def enable(self, cprofile_stage=None):
+        self.enabled = True
+        self.cprofile_stage = cprofile_stage
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        profile = None
+        if name == self.cprofile_stage:
+            if self.cprofile is None:
+                import cProfile
+                self.cprofile = cProfile.Profile()
+            profile = self.cprofile
+            profile.enable()
+        peak_before = peak_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile:
+                profile.disable()
+            peak = peak_mb()
+            with self.lock:
+                stage = self.stages.setdefault(
+                    name, {"seconds": 0.0, "calls": 0, "rss_mb": 0.0,
+                           "rss_added_mb": 0.0})
+                stage["seconds"] += elapsed
+                stage["calls"] += 1
+                stage["rss_mb"] = peak
+                stage["rss_added_mb"] += peak - peak_before
+
+    # the same as a decorator, for stages that are a whole function
+
+    def timed(self, name):
+        def wrap(func):
+            @functools.wraps(func)
+            def run(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return run
+        return wrap
+
+    @contextmanager
+    def device(self, stage, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_device(stage, name, time.perf_counter() - start)
+
+    # for device times measured somewhere else, e.g. in a worker process
+
+    def add_device(self, stage, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            devices = self.devices.setdefault(stage, {})
+            devices[name] = devices.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        return {"stages": self.stages, "devices": self.devices,
+                "counters": self.counters, "peak_mb": peak_mb()}
+
+    # the human readable version, slowest devices per stage only
+
+    def print_report(self, slowest=5):
+        print("{:<20} {:>10} {:>8} {:>12} {:>10}".format(
+            "stage", "seconds", "calls", "process MB", "added MB"))
+        for name, stage in self.stages.items():
+            print("{:<20} {:>10.3f} {:>8} {:>12.1f} {:>10.1f}".format(
+                name, stage["seconds"], stage["calls"], stage["rss_mb"],
+                stage["rss_added_mb"]))
+        for stage, devices in self.devices.items():
+            worst = sorted(devices.items(), key=lambda x: -x[1])[:slowest]
+            print("slowest in {}: {}".format(stage, ", ".join(
+                "{} {:.2f}s".format(*x) for x in worst)))
+        for name, value in sorted(self.counters.items()):
+            print("{:<28} {:>12}".format(name, value))
+        print("process peak memory {:.1f} MB".format(peak_mb()))
+
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.cprofile_stage + ".pstats")
+
+
+profiler = Profiler()
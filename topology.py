@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import collections
+import json
+import os
+
+from cache import write_atomic
+from netindex import key_to_string
+
+
+'''
+An adjacency index of the network: which devices are on which networks.
+Two devices are neighbours when they share a network, the same networks the
+netmap has. It answers the questions a slice of the network is made of:
+
+neighbourhood   the devices within k hops of some seed devices
+shortest_path   the devices on a shortest path between two devices
+group           the devices in some of the groups of the inventory
+
+The index of the last full model is kept in the cache directory as
+topology.json, so a slice can be discovered without logging into the whole
+network: crawl starts at the seed devices and only fetches the neighbours
+of what it has fetched, hop by hop. The networks of every device it fetches
+come from the fresh data, the cached topology is only used for the devices
+it hasn't reached yet.
+
+Example of topology.json:
+{"version": 1, "networks": {"10.0.0.0/30": ["r1", "r2"], ...},
+ "devices": ["r1", "r2", "r3"]}
+'''
+
+
+VERSION = 1
+
+
+# the networks of a node we model, the way create_netlist picks them
+
+def node_networks(gns_node, prefix_filter):
+    return set(key_to_string(key) for intf in gns_node.interfaces
+               for key in intf.keys if prefix_filter(key))
+
+
+class TopologyIndex():
+
+    # networks is network -> device names, devices can add devices that
+    # aren't on any network
+
+    def __init__(self, networks=None, devices=()):
+        self.networks = {}
+        self.devices = {}
+        for name in devices:
+            self.devices.setdefault(name, set())
+        for network, names in (networks or {}).items():
+            for name in names:
+                self.add(name, [network])
+
+    @classmethod
+    def from_netmap(cls, netmap, devices=()):
+        return cls(dict((x["name"], [n.name for n in x["nodes"]])
+                        for x in netmap), devices)
+
+    def add(self, name, networks):
+        self.devices.setdefault(name, set()).update(networks)
+        for network in networks:
+            self.networks.setdefault(network, set()).add(name)
+
+    # a device we have fresh data for, its old networks are dropped
+
+    def update(self, name, networks):
+        for network in self.devices.pop(name, ()):
+            self.networks[network].discard(name)
+        self.add(name, networks)
+
+    def neighbours(self, name):
+        result = set()
+        for network in self.devices.get(name, ()):
+            result.update(self.networks[network])
+        result.discard(name)
+        return result
+
+    # device name -> hops from the nearest seed, for the devices within
+    # hops of the seeds
+
+    def neighbourhood(self, seeds, hops):
+        distance = dict((x, 0) for x in seeds)
+        queue = collections.deque(seeds)
+        while queue:
+            name = queue.popleft()
+            if distance[name] == hops:
+                continue
+            for x in sorted(self.neighbours(name)):
+                if x not in distance:
+                    distance[x] = distance[name] + 1
+                    queue.append(x)
+        return distance
+
+    # the devices from source to target, None when they aren't connected
+
+    def shortest_path(self, source, target):
+        parent = {source: None}
+        queue = collections.deque([source])
+        while queue:
+            name = queue.popleft()
+            if name == target:
+                path = []
+                while name is not None:
+                    path.append(name)
+                    name = parent[name]
+                return path[::-1]
+            for x in sorted(self.neighbours(name)):
+                if x not in parent:
+                    parent[x] = name
+                    queue.append(x)
+        return None
+
+    # host_groups is host -> groups, from layout.load_groups
+
+    def group(self, groups, host_groups):
+        groups = set(groups)
+        return set(x for x in self.devices
+                   if groups.intersection(host_groups.get(x, ())))
+
+    def missing(self, names):
+        return [x for x in names if x not in self.devices]
+
+    def save(self, filename):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        data = {"version": VERSION,
+                "networks": dict((k, sorted(v))
+                                 for k, v in self.networks.items() if v),
+                "devices": sorted(self.devices)}
+        write_atomic(filename, json.dumps(data, sort_keys=True))
+
+    # None when there is no topology or it was written by another version
+
+    @classmethod
+    def load(cls, filename):
+        try:
+            with open(filename) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get("version") != VERSION:
+            return None
+        return cls(data["networks"], data["devices"])
+
+
+# breadth first from the seeds, budgets is seed -> hops. fetch(names) gets
+# the getter results of some devices (the ones it can), networks(name,
+# result) their networks. a device that can't be fetched is still crossed
+# with what the index knows about it. returns name -> result in the order
+# they were fetched
+
+def crawl(index, budgets, fetch, networks):
+    results = {}
+    best = dict(budgets)
+    frontier = list(budgets)
+    while frontier:
+        for name, result in fetch(
+                [x for x in frontier if x not in results]).items():
+            results[name] = result
+            index.update(name, networks(name, result))
+        following = {}
+        for name in frontier:
+            for x in sorted(index.neighbours(name)):
+                if best[name] - 1 > best.get(x, -1):
+                    best[x] = best[name] - 1
+                    following[x] = True
+        frontier = list(following)
+    return results
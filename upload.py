@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import posixpath
+import queue
+import time
+import paramiko
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import file_digest
+from cache import write_atomic
+from timing import profiler
+
+
+'''
+Uploads the gns startup configs to the gns3 server. One ssh transport is
+opened and a small pool of sftp channels runs over it, so the configs go up
+in parallel without a login per file.
+
+A file whose remote size and sha256 match the local one is skipped. Sftp
+can't hash a remote file without reading it back, which costs as much as
+uploading it, so the manifest keeps the sha256, size and modification time
+of every file we uploaded. A remote file is taken to still have that hash
+while its size and time are the ones we saw after the upload, when in doubt
+the file is uploaded again. The local time doesn't count, the configs are
+written again on every build.
+
+A file that fails to upload doesn't stop the others, its result has the
+error instead.
+
+Example of the manifest:
+{"172.28.88.11:/opt/gns3/projects/.../i1_startup-config.cfg":
+    {"sha256": "9f86d0...", "size": 1843, "mtime": 1554600000}}
+'''
+
+
+class Uploader():
+
+    # manifest is the json file the hashes of the uploaded files are kept
+    # in, without one they are only known while the uploader is open
+
+    def __init__(self, host, username, password, port=22, channels=4,
+                 manifest=None):
+        self.host = host
+        self.manifest_file = manifest
+        self.manifest = {}
+        if manifest is not None and os.path.exists(manifest):
+            with open(manifest) as f:
+                self.manifest = json.load(f)
+        self.transport = paramiko.Transport((host, port))
+        self.transport.connect(username=username, password=password)
+        self.channels = channels
+        self.pool = queue.Queue()
+        for _ in range(channels):
+            self.pool.put(paramiko.SFTPClient.from_transport(self.transport))
+
+    def key(self, remote):
+        return self.host + ":" + remote
+
+    # true when the remote file is the one we uploaded and it has the size
+    # and sha256 of the local one
+
+    def same_file(self, sftp, local, remote):
+        entry = self.manifest.get(self.key(remote))
+        if entry is None or entry["size"] != os.path.getsize(local):
+            return False
+        try:
+            stat = sftp.stat(remote)
+        except IOError:
+            return False
+        return (stat.st_size == entry["size"] and
+                stat.st_mtime == entry["mtime"] and
+                file_digest(local) == entry["sha256"])
+
+    # upload one file on a free channel and return how it went
+
+    def upload(self, local, remote):
+        result = {"local": local, "remote": remote, "bytes": 0,
+                  "seconds": 0.0, "skipped": False, "error": None}
+        sftp = self.pool.get()
+        start = time.perf_counter()
+        try:
+            if self.same_file(sftp, local, remote):
+                result["skipped"] = True
+            else:
+                self.manifest.pop(self.key(remote), None)
+                digest = file_digest(local)
+                attrs = sftp.put(local, remote)
+                self.manifest[self.key(remote)] = {
+                    "sha256": digest, "size": attrs.st_size,
+                    "mtime": attrs.st_mtime}
+                result["bytes"] = attrs.st_size
+        except (IOError, paramiko.SSHException) as e:
+            result["error"] = "{}: {}".format(type(e).__name__, e)
+            profiler.count("sftp_failures")
+        finally:
+            self.pool.put(sftp)
+        result["seconds"] = time.perf_counter() - start
+        profiler.count("sftp_files")
+        profiler.count("sftp_bytes", result["bytes"])
+        return result
+
+    # files is a list of (local, remote) tuples, results keep the same order
+
+    def upload_all(self, files):
+        with ThreadPoolExecutor(max_workers=self.channels) as pool:
+            return list(pool.map(lambda x: self.upload(*x), files))
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+        self.transport.close()
+        if self.manifest_file is not None:
+            os.makedirs(os.path.dirname(self.manifest_file) or ".",
+                        exist_ok=True)
+            write_atomic(self.manifest_file,
+                         json.dumps(self.manifest, sort_keys=True))
+
+
+def print_upload_report(results):
+    total_bytes = 0
+    total_seconds = 0.0
+    for x in results:
+        total_bytes += x["bytes"]
+        total_seconds += x["seconds"]
+        if x.get("error"):
+            status = "failed, " + x["error"]
+        elif x["skipped"]:
+            status = "unchanged"
+        else:
+            status = "{:.1f} KB/s".format(
+                x["bytes"] / 1024 / max(x["seconds"], 1e-6))
+        print("{:<40} {:>8} bytes {:>7.3f}s {}".format(
+            posixpath.basename(x["remote"]), x["bytes"], x["seconds"],
+            status))
+    failed = len([x for x in results if x.get("error")])
+    print("Uploaded {} of {} files, {} bytes".format(
+        len([x for x in results if not x["skipped"]]) - failed, len(results),
+        total_bytes))
+    if failed:
+        print("{} files failed to upload".format(failed))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+
+from concurrent.futures import Executor
+from concurrent.futures import Future
+
+
+'''
+A thread pool whose threads are daemons. The threads of a
+ThreadPoolExecutor are joined when the interpreter exits, so a call that
+hangs (a device that never answers) keeps the program running long after
+its deadline, and while it hangs it holds one of the workers. Here a call
+that is given up on is abandoned: its thread is left to finish or hang on
+its own without blocking the exit, and a new thread takes its place so
+the pool keeps its number of workers.
+
+    pool = DaemonPool(20)
+    future = pool.submit(fetch, host)
+    ...
+    pool.abandon(future)    # it ran past its deadline
+'''
+
+
+class DaemonPool(Executor):
+
+    def __init__(self, max_workers):
+        self.max_workers = max(1, max_workers)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = set()
+        self.running = {}
+        self.abandoned = set()
+        self.closed = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot submit after shutdown")
+            self.queue.put((future, fn, args, kwargs))
+            self.grow()
+        return future
+
+    # called with the lock held
+
+    def grow(self):
+        if len(self.workers) < self.max_workers and self.queue.qsize():
+            thread = threading.Thread(target=self.work, daemon=True)
+            self.workers.add(thread)
+            thread.start()
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self.lock:
+                self.running[future] = threading.current_thread()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self.lock:
+                del self.running[future]
+                if future in self.abandoned:
+                    self.abandoned.discard(future)
+                    return
+
+    # stop waiting for a call. one that hasn't started is cancelled, one
+    # that is running keeps its thread and another thread is started for
+    # the rest of the queue
+
+    def abandon(self, future):
+        if future.cancel():
+            return
+        with self.lock:
+            if future not in self.running:
+                return
+            self.abandoned.add(future)
+            self.workers.discard(self.running[future])
+            self.grow()
+
+    # the threads stop when the queue is empty, calls still running are
+    # never waited for when wait is false
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self.lock:
+            self.closed = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+            workers = list(self.workers)
+            for _ in workers:
+                self.queue.put(None)
+        if wait:
+            for thread in workers:
+                thread.join()